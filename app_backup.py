@@ -1,28 +1,149 @@
 import os
 import json
-from flask import Flask, request, jsonify, render_template, send_from_directory, send_file
+import contextvars
+import zipfile
+from flask import Flask, Request, request, jsonify, render_template, send_from_directory, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from pptx import Presentation
-import openpyxl
-import requests
-import PyPDF2
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from dotenv import load_dotenv
-import dashscope
 from http import HTTPStatus
+from urllib.parse import quote
+from modules.parse_cache import ParseCache
+from modules.upload_store import UploadStore
+from modules.upload_janitor import UploadJanitor, DAY
+from modules import document_extractor
+from modules.llm_client import LLMClient, timeouts_from_env
+from modules.resilience import RetryPolicy
+from modules.rate_limiter import RateLimiter, rate_limits_from_env, set_current_user, current_user, user_context
+from modules.llm_cache import LLMResponseCache
+from modules.pipeline import Pipeline, get_executor
+from modules.sse import stream_llm_events, SSE_HEADERS, STREAM_TIMINGS
+from modules.json_stream import extract_json, REQUIRED
+from modules.job_queue import JobQueue, JobStore
+from modules.batch import run_batch, get_stage_executor
+from modules.cohort import CohortStore
+from modules.results_store import ResultStore, make_result_key
+from modules.xlsx_stream import Sheet, stream_xlsx, XLSX_MIMETYPE
+from modules import report_pdf
+from modules.chunking import estimate_tokens, context_budget, chunk_text, map_reduce
+from modules.retrieval import retrieve_evidence
+from modules.keyword_matcher import KeywordAnalyzer
+from modules import employee_info
+from modules import scoring_table
+from modules import transcription
+from modules import audio_ingest
 
 load_dotenv()
 # API密钥现在通过手动配置管理，不再使用硬编码密钥
 
+class UploadRequest(Request):
+    """
+    multipart 解析时上传内容直接分块写入上传存储的临时文件，同时计算内容哈希；
+    录音文件同时交给流式接入，边上传边解码、分段并开始转写
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UPLOAD_STORE.open_spool(listener=start_audio_ingest(filename))
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['ALLOWED_EXTENSIONS'] = {'pptx', 'pdf', 'xlsx', 'mp3', 'wav'}
+app.config['ALLOWED_EXTENSIONS'] = {'pptx', 'pdf', 'docx', 'xlsx', 'mp3', 'wav', 'm4a'}
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_BYTES', 100 * 1024 * 1024))
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# 缓存、任务库等运行数据存放在上传目录旁
+DATA_DIR = os.path.dirname(os.path.abspath(app.config['UPLOAD_FOLDER']))
+
+# 上传存储：文件按内容SHA-256保存，相同内容只存一份，按引用计数释放
+UPLOAD_STORE = UploadStore(
+    root=app.config['UPLOAD_FOLDER'],
+    db_path=os.getenv('UPLOAD_DB', os.path.join(DATA_DIR, 'uploads.db'))
+)
+
+# 解析结果缓存：同一份文件在校对、诊断、打分等多个接口间只解析一次；
+# 上传存储中的文件直接以内容ID为键，不必重新读文件计算哈希
+PARSE_CACHE = ParseCache(
+    spill_dir=os.getenv('PARSE_CACHE_DIR', os.path.join(DATA_DIR, 'parse_cache')),
+    max_bytes=int(os.getenv('PARSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    max_spill_bytes=int(os.getenv('PARSE_CACHE_MAX_SPILL_BYTES', 512 * 1024 * 1024)),
+    digest_resolver=UPLOAD_STORE.content_id_for_path
+)
+
+# 上传目录清理：超过保留期未访问的文件删除，超出配额时按最近访问时间淘汰
+UPLOAD_JANITOR = UploadJanitor(
+    UPLOAD_STORE,
+    upload_dir=app.config['UPLOAD_FOLDER'],
+    retention=float(os.getenv('UPLOAD_RETENTION_DAYS', 30)) * DAY,
+    quota_bytes=int(os.getenv('UPLOAD_QUOTA_BYTES', 0)),
+    low_watermark=float(os.getenv('UPLOAD_QUOTA_LOW_WATERMARK', 0.9)),
+    min_idle=float(os.getenv('UPLOAD_MIN_IDLE', 3600)),
+    interval=float(os.getenv('UPLOAD_JANITOR_INTERVAL', 600))
+)
+
+# 大模型响应缓存：重复的提示词（重新生成、前端重试）直接返回已有结果
+LLM_CACHE = LLMResponseCache(
+    db_path=os.getenv('LLM_CACHE_DB', os.path.join(DATA_DIR, 'llm_cache.db')),
+    ttl=int(os.getenv('LLM_CACHE_TTL', 24 * 3600)),
+    max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', 256)),
+    max_rows=int(os.getenv('LLM_CACHE_MAX_ROWS', 5000))
+)
+
+# 客户端限流：按密钥和模型的请求数/token数令牌桶，超限时按用户公平排队；
+# DASHSCOPE_API_KEYS 配置多个密钥（逗号分隔）时轮换使用
+RATE_LIMITER = RateLimiter(
+    keys=[key.strip() for key in os.getenv('DASHSCOPE_API_KEYS', '').split(',') if key.strip()],
+    limits=rate_limits_from_env(),
+    burst_seconds=float(os.getenv('LLM_RATE_BURST_SECONDS', 10))
+) if os.getenv('LLM_RATE_LIMIT', 'true').lower() != 'false' else None
+
+# 大模型调用客户端：所有DashScope调用共用连接池、熔断器、重试策略和限流器
+LLM_CLIENT = LLMClient(
+    pool_size=int(os.getenv('LLM_POOL_SIZE', 10)),
+    keepalive=os.getenv('LLM_KEEPALIVE', 'true').lower() != 'false',
+    timeouts=timeouts_from_env(),
+    cache=LLM_CACHE,
+    retry=RetryPolicy(
+        max_attempts=int(os.getenv('LLM_RETRY_ATTEMPTS', 3)),
+        base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY', 0.5)),
+        max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY', 8))
+    ),
+    breaker_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+    breaker_reset=float(os.getenv('LLM_BREAKER_RESET', 30)),
+    hedge_endpoints=[name.strip() for name in os.getenv('LLM_HEDGE_ENDPOINTS', 'employee_info,suggestion').split(',')
+                     if name.strip()],
+    hedge_delay=float(os.getenv('LLM_HEDGE_DELAY', 3)),
+    rate_limiter=RATE_LIMITER,
+    throttle_cooldown=float(os.getenv('LLM_THROTTLE_COOLDOWN', 5))
+)
+
+# 群体分析：历次诊断的六维评分
+COHORT_STORE = CohortStore(os.getenv('COHORT_DB', os.path.join(DATA_DIR, 'cohort.db')))
+
+# 分析结果存储：导出、群体分析按结果ID读取
+RESULT_STORE = ResultStore(os.getenv('RESULTS_DB', os.path.join(DATA_DIR, 'results.db')))
+
+# PDF报告渲染器：字体注册、段落样式和静态内容在启动时准备一次，批量导出使用进程池
+REPORT_ENGINE = report_pdf.get_engine()
+
+# 备用校对分析的关键词自动机：分类体系可通过JSON文件配置，启动时编译一次
+FALLBACK_ANALYZER = KeywordAnalyzer.from_file(os.getenv('FALLBACK_TAXONOMY_FILE'))
+
+# 后台任务队列：耗时任务提交后立即返回任务ID，交互式任务有专用工作线程
+JOB_QUEUE = JobQueue(
+    JobStore(os.getenv('JOB_DB', os.path.join(DATA_DIR, 'jobs.db'))),
+    workers=int(os.getenv('JOB_WORKERS', 4)),
+    reserved_interactive=int(os.getenv('JOB_INTERACTIVE_WORKERS', 1)),
+    lease=float(os.getenv('JOB_LEASE_SECONDS', 60))
+)
+
+@app.before_request
+def bind_request_user():
+    """限流排队按用户区分：优先取 X-User-Id 请求头，否则按客户端地址"""
+    set_current_user(request.headers.get('X-User-Id') or request.remote_addr)
+
 def allowed_file(filename, allowed_extensions=None):
     if allowed_extensions is None:
         allowed_extensions = app.config['ALLOWED_EXTENSIONS']
@@ -36,6 +157,23 @@ def index():
 def serve_static(path):
     return send_from_directory('static', path)
 
+AUDIO_EXTENSIONS = {'mp3', 'wav', 'm4a'}
+
+# 录音流式接入：上传过程中即解码、检测语音段；AUDIO_TRANSCRIBE_ON_UPLOAD 开启时同时开始转写
+# （上传结束前无法得知内容是否已转写过，重复上传也会产生转写调用，默认关闭）
+AUDIO_STREAM_INGEST = os.getenv('AUDIO_STREAM_INGEST', 'true').lower() != 'false'
+AUDIO_TRANSCRIBE_ON_UPLOAD = os.getenv('AUDIO_TRANSCRIBE_ON_UPLOAD', 'false').lower() == 'true'
+
+def start_audio_ingest(filename):
+    """录音文件返回流式接入（作为上传临时文件的监听器），其他文件返回None"""
+    if not AUDIO_STREAM_INGEST or not filename:
+        return None
+    extension = document_extractor.get_extension(filename)
+    if extension not in AUDIO_EXTENSIONS:
+        return None
+    return audio_ingest.AudioIngest(extension, transcribe=AUDIO_TRANSCRIBE_ON_UPLOAD,
+                                    buffer_dir=UPLOAD_STORE.tmp_dir)
+
 # 上传文件接口
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -45,43 +183,130 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        return jsonify({'filename': filename, 'file_path': file_path}), 200
+        # 内容在请求解析时已写入临时文件并算好哈希，这里只需按内容ID改名；
+        # 原始文件名（含中文）记录在存储中，供员工信息抽取使用
+        stored = UPLOAD_STORE.store(file, file.filename)
+        result = {
+            'filename': secure_filename(file.filename),
+            'file_path': stored['file_path'],
+            'content_id': stored['content_id'],
+            'ref_id': stored['ref_id'],
+            'size': stored['size'],
+            'deduplicated': stored['deduplicated']
+        }
+        ingest = getattr(file.stream, 'listener', None)
+        if ingest is not None:
+            # 录音已在上传过程中解码完毕，返回时长与语音段统计；已开始的转写交给转写任务等待结果
+            result['audio'] = ingest.finish()
+            if ingest.transcribe and not ingest.error:
+                if PARSE_CACHE.cached(stored['file_path'], transcript_namespace(ingest.backend)) is not None:
+                    # 相同内容已转写过，取消上传过程中已开始的转写，任务直接返回缓存结果
+                    ingest.cancel()
+                else:
+                    audio_ingest.register_pending(stored['content_id'], ingest)
+                result['transcribe_job_id'] = JOB_QUEUE.submit('transcribe', {
+                    'audio_path': stored['file_path'],
+                    'backend': ingest.backend,
+                    'requested_by': current_user()
+                })
+        return jsonify(result), 200
     return jsonify({'error': 'File type not allowed'}), 400
 
-# 解析文档内容（支持PPT和PDF）
+# 释放一次上传，文件在没有其他引用时删除
+@app.route('/api/upload/<ref_id>', methods=['DELETE'])
+def release_upload(ref_id):
+    if not UPLOAD_STORE.release(ref_id):
+        return jsonify({'success': False, 'error': '上传记录不存在'}), 404
+    return jsonify({'success': True}), 200
+
+# 上传存储的文件数、占用空间、去重节省与清理情况
+@app.route('/api/upload/stats', methods=['GET'])
+def upload_stats():
+    return jsonify({'success': True, 'stats': UPLOAD_STORE.stats(), 'janitor': UPLOAD_JANITOR.stats()}), 200
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'error': f'上传文件超过{limit_mb}MB上限'}), 413
+
+def extract_document_text(doc_path):
+    """读取文档正文，相同内容的文件只解析一次"""
+    if not UPLOAD_STORE.exists(doc_path):
+        raise FileNotFoundError(doc_path)
+    return PARSE_CACHE.get_or_parse(doc_path, f'doc.v{document_extractor.EXTRACTOR_VERSION}', document_extractor.extract_text)
+
+def upload_display_name(doc_path):
+    """文档的原始文件名（上传存储中的文件按内容ID命名，原名从存储记录中取）"""
+    return UPLOAD_STORE.display_name(doc_path)
+
+def resolve_upload_path(doc_path):
+    """补全上传目录前缀"""
+    if doc_path.startswith('uploads/') or doc_path.startswith('uploads\\'):
+        return doc_path
+    return os.path.join(app.config['UPLOAD_FOLDER'], doc_path)
+
+# 长文档token预算：正文超出预算时先分块并发摘要（map），再合并压缩（reduce）后分析
+LLM_DOC_TOKEN_BUDGET = int(os.getenv('LLM_DOC_TOKEN_BUDGET', 24000))
+LLM_CHUNK_TOKENS = int(os.getenv('LLM_CHUNK_TOKENS', 6000))
+SUGGESTION_EXCERPT_TOKENS = int(os.getenv('LLM_SUGGESTION_EXCERPT_TOKENS', 1500))
+
+def build_chunk_summary_prompt(chunk, index, total):
+    """构造分块摘要提示词"""
+    return f"""
+以下是一份员工述职材料的第{index + 1}/{total}部分。请提炼这一部分的要点，供后续的能力评估使用。
+
+要求：
+1. 保留具体的项目名称、职责、关键行动、量化数据和成果，不要泛泛概括
+2. 保留与团队协作、业务影响、成本、创新、规划相关的事实
+3. 按原文顺序分条列出，不要添加原文没有的评价
+4. 控制在原文长度的三分之一以内
+
+述职材料（第{index + 1}/{total}部分）：
+{chunk}
+"""
+
+def fit_document_to_budget(text, model, template, use_cache=True):
+    """
+    保证正文与提示词模板合计不超出模型上下文预算，未超出时原样返回
+    template 为不含正文的提示词，用于估算模板本身占用的token
+    """
+    budget = min(LLM_DOC_TOKEN_BUDGET, context_budget(model, estimate_tokens(template)))
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    
+    def summarize(chunk, index, total):
+        response = LLM_CLIENT.generate('qwen-plus', prompt=build_chunk_summary_prompt(chunk, index, total),
+                                       endpoint='summary', use_cache=use_cache)
+        if response.status_code != HTTPStatus.OK:
+            print(f"分块摘要调用失败: {response.status_code}, {response.message}")
+            return None
+        return response.text
+    
+    condensed, rounds = map_reduce(text, summarize, budget, min(LLM_CHUNK_TOKENS, budget))
+    print(f"[MAP-REDUCE] 正文约{tokens} tokens，超出预算{budget}，经{rounds}轮分块摘要压缩至约{estimate_tokens(condensed)} tokens")
+    return condensed
+
+def document_excerpt(text, max_tokens):
+    """在章节边界处截取不超过 max_tokens 的开头部分，返回 (摘录, 是否截断)"""
+    chunks = chunk_text(text, max_tokens)
+    if not chunks:
+        return '', False
+    return chunks[0], len(chunks) > 1
+
+# 解析文档内容（支持PPT、PDF、Word和Excel）
 @app.route('/api/parse_document', methods=['POST'])
 def parse_document():
     data = request.json
     doc_path = data.get('doc_path')
-    if not doc_path or not os.path.exists(doc_path):
+    if not doc_path or not UPLOAD_STORE.exists(doc_path):
         return jsonify({'error': '文件未找到'}), 400
     
+    if not document_extractor.is_supported(doc_path):
+        return jsonify({'error': '不支持的文件格式'}), 400
+    
     try:
-        if doc_path.lower().endswith('.pptx'):
-            # 解析PPT
-            prs = Presentation(doc_path)
-            doc_text = []
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, 'text'):
-                        doc_text.append(shape.text)
-            return jsonify({'doc_text': '\n'.join(doc_text)}), 200
-            
-        elif doc_path.lower().endswith('.pdf'):
-            # 解析PDF
-            pdf_text = []
-            with open(doc_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    pdf_text.append(page.extract_text())
-            return jsonify({'doc_text': '\n'.join(pdf_text)}), 200
-            
-        else:
-            return jsonify({'error': '不支持的文件格式'}), 400
+        return jsonify({'doc_text': extract_document_text(doc_path)}), 200
     except Exception as e:
         return jsonify({'error': f'解析文件错误: {str(e)}'}), 500
 
@@ -90,7 +315,7 @@ def parse_document():
 def parse_ppt():
     data = request.json
     ppt_path = data.get('ppt_path')
-    if not ppt_path or not os.path.exists(ppt_path):
+    if not ppt_path or not UPLOAD_STORE.exists(ppt_path):
         return jsonify({'error': 'PPT file not found'}), 400
     
     # 将请求转发给新接口
@@ -107,43 +332,196 @@ def parse_ppt():
 def parse_score():
     data = request.json
     score_path = data.get('score_path')
-    if not score_path or not os.path.exists(score_path):
+    if not score_path or not UPLOAD_STORE.exists(score_path):
         return jsonify({'error': 'Score file not found'}), 400
     try:
-        wb = openpyxl.load_workbook(score_path)
-        ws = wb.active
-        score_items = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row and any(row):  # 确保行不为空
-                score_items.append(' '.join(str(cell) for cell in row if cell))
-        return jsonify({'score_items': score_items}), 200
+        schema = parse_scoring_schema(score_path)
+        return jsonify({'score_items': scoring_table.score_items(schema),
+                        'sheets': scoring_table.summarize(schema)}), 200
     except Exception as e:
         return jsonify({'error': f'Error parsing score file: {str(e)}'}), 500
 
+def parse_scoring_schema(score_path):
+    """流式解析评分表全部工作表的表头、考核项与权重，相同内容的文件只解析一次"""
+    return PARSE_CACHE.get_or_parse(score_path, f'score.v{scoring_table.SCHEMA_VERSION}',
+                                    scoring_table.parse_scoring_table)
+
+def transcript_namespace(backend):
+    """转写结果在解析缓存中的命名空间"""
+    return f'audio.v{transcription.TRANSCRIPT_VERSION}.{backend}'
+
+def transcribe_audio(audio_path, backend=None, progress=None):
+    """录音转写，相同内容的录音（同一后端）只转写一次；上传时已开始的流式转写直接等待其结果"""
+    backend = backend or transcription.TRANSCRIBE_BACKEND
+    ingest = audio_ingest.take_pending(UPLOAD_STORE.content_id_for_path(audio_path))
+    if ingest is not None and ingest.backend != backend:
+        ingest = None
+
+    def parse(path):
+        if ingest is not None:
+            try:
+                return ingest.result(progress)
+            except ValueError as e:
+                print(f"上传时的流式转写不可用，改为读取文件转写: {str(e)}")
+        return transcription.transcribe_file(path, backend=backend, progress=progress,
+                                             buffer_dir=UPLOAD_STORE.tmp_dir)
+
+    return PARSE_CACHE.get_or_parse(audio_path, transcript_namespace(backend), parse)
+
+def run_transcription(data, progress=None):
+    """录音转文本，返回 (结果, HTTP状态码)；供后台任务使用"""
+    audio_path = data.get('audio_path')
+    backend = data.get('backend') or transcription.TRANSCRIBE_BACKEND
+    error = None
+    if not audio_path or not UPLOAD_STORE.exists(audio_path):
+        error = '录音文件未找到'
+    elif document_extractor.get_extension(audio_path) not in AUDIO_EXTENSIONS:
+        error = '不支持的音频格式'
+    elif backend not in transcription.backend_names():
+        error = f'未知的转写后端: {backend}'
+    if error:
+        # 上传时已开始的转写不会再被取走，取消并释放
+        audio_ingest.discard_pending(UPLOAD_STORE.content_id_for_path(audio_path))
+        return {'error': error}, 400
+    try:
+        return {'success': True, 'transcript': transcribe_audio(audio_path, backend, progress)}, 200
+    except (ValueError, RuntimeError) as e:
+        return {'error': f'语音转写失败: {str(e)}'}, 400
+    except Exception as e:
+        return {'error': f'语音转写失败: {str(e)}'}, 500
+
+# 提交录音转文本任务：长录音按静音切分后并发转写，通过 /api/jobs/<job_id> 查询进度和结果
+@app.route('/api/transcribe', methods=['POST'])
+def transcribe():
+    data = request.get_json(silent=True) or {}
+    if not data.get('audio_path') or not UPLOAD_STORE.exists(data['audio_path']):
+        return jsonify({'success': False, 'error': '录音文件未找到'}), 400
+    job_id = JOB_QUEUE.submit('transcribe', {
+        'audio_path': data['audio_path'],
+        'backend': data.get('backend'),
+        'requested_by': current_user()
+    })
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+# 解析缓存命中统计
+@app.route('/api/parse_cache/stats', methods=['GET'])
+def parse_cache_stats():
+    return jsonify({'success': True, 'stats': PARSE_CACHE.stats()}), 200
+
+# 大模型响应缓存命中率与节省耗时
+@app.route('/api/llm_cache/stats', methods=['GET'])
+def llm_cache_stats():
+    return jsonify({'success': True, 'stats': LLM_CACHE.stats()}), 200
+
+# 大模型调用的熔断器状态、重试与对冲次数
+@app.route('/api/llm_client/stats', methods=['GET'])
+def llm_client_stats():
+    return jsonify({'success': True, 'stats': LLM_CLIENT.stats()}), 200
+
+# 流式接口首字耗时统计
+@app.route('/api/stream/stats', methods=['GET'])
+def stream_stats():
+    return jsonify({'success': True, 'stats': STREAM_TIMINGS.stats()}), 200
+
 # 文档与评分表内容一致性校对
 @app.route('/api/verify', methods=['POST'])
 def verify():
-    data = request.json
+    payload, status = run_verify(request.json)
+    return jsonify(payload), status
+
+def run_verify(data, progress=None):
+    """执行校对，返回 (结果, HTTP状态码)；供同步接口与后台任务共用"""
     doc_text = data.get('doc_text', '') or data.get('ppt_text', '')  # 兼容旧版本
     score_items = data.get('score_items', [])
+    use_cache = not data.get('bypass_cache', False)
     
     # 调用大模型进行智能分析，而不是简单的文本匹配
-    analysis_result = call_dashscope_llm_analysis(doc_text, score_items)
+    doc_context, evidence = build_verify_context(doc_text, score_items)
+    analysis_result = call_dashscope_llm_analysis(doc_text, score_items, use_cache=use_cache, doc_context=doc_context)
     
-    return jsonify({
+    return save_verify_result(build_verify_payload(analysis_result, evidence), data, doc_text, score_items), 200
+
+def build_verify_payload(analysis_result, evidence=None):
+    return {
         'missing_items': analysis_result.get('missing_items', []), 
         'suggestions': analysis_result.get('suggestions', ''),
+        'evidence': evidence or {},
         'success': True
-    }), 200
+    }
 
-# 调用阿里云DashScope大模型进行智能分析
-# API密钥现在通过手动配置管理，不再使用硬编码密钥
+# 长文档校对时按评价项检索证据片段，只把相关片段送入大模型
+VERIFY_RETRIEVAL_MIN_TOKENS = int(os.getenv('VERIFY_RETRIEVAL_MIN_TOKENS', 2000))
+VERIFY_EVIDENCE_TOP_K = int(os.getenv('VERIFY_EVIDENCE_TOP_K', 3))
 
-def call_dashscope_llm_analysis(doc_text, score_items):
+def build_verify_context(doc_text, score_items):
     """
-    使用专业的述职报告校对助手进行智能分析
+    准备校对用的文档内容，返回 (送入提示词的文档内容, {评价项: 证据片段列表})
+    文档较短时送入全文；较长时只送入各评价项检索到的片段，并标注片段编号与对应关系
     """
-    prompt = f"""
+    items = [item for item in score_items if item.strip()]
+    if not doc_text.strip() or not items:
+        return doc_text, {}
+    index, evidence = retrieve_evidence(doc_text, items, top_k=VERIFY_EVIDENCE_TOP_K)
+    if estimate_tokens(doc_text) <= VERIFY_RETRIEVAL_MIN_TOKENS:
+        return doc_text, evidence
+    
+    passages = sorted({hit['passage'] for hits in evidence.values() for hit in hits})
+    lines = ['（文档较长，以下为按评价项检索到的相关片段，[P编号]为片段在原文中的顺序）']
+    for passage in passages:
+        lines.append(f'[P{passage}] {index.passages[passage - 1].strip()}')
+    lines.append('')
+    lines.append('各评价项对应的片段（未检索到相关内容的评价项视为PPT中缺失）：')
+    for item in items:
+        refs = ', '.join(f'P{hit["passage"]}' for hit in evidence[item])
+        lines.append(f'- {item}: {refs or "未检索到相关内容"}')
+    return '\n'.join(lines), evidence
+
+def save_verify_result(payload, data, doc_text, score_items):
+    return save_result('verify', payload, make_result_key('verify', doc_text=doc_text, score_items=score_items),
+                       employee=data.get('employee_name'), quarter=data.get('quarter'),
+                       ability_model=data.get('ability_model'), source=data.get('doc_path'))
+
+# 校对的流式版本（SSE），缺失项逐条下发
+@app.route('/api/verify/stream', methods=['POST'])
+def verify_stream():
+    data = request.json
+    doc_text = data.get('doc_text', '') or data.get('ppt_text', '')
+    score_items = data.get('score_items', [])
+    use_cache = not data.get('bypass_cache', False)
+    doc_context, evidence = build_verify_context(doc_text, score_items)
+    
+    # 长文档压缩可能调用大模型，放在生成器内执行，出错时同样返回备用结果
+    def prepare():
+        return build_verify_prompt(
+            fit_document_to_budget(doc_context, 'qwen-plus', build_verify_prompt('', score_items), use_cache),
+            score_items)
+    
+    def finalize(response_text, prompt):
+        try:
+            analysis_result = parse_verify_response(response_text)
+        except json.JSONDecodeError as e:
+            LLM_CLIENT.invalidate('qwen-plus', prompt=prompt, parameters={'max_tokens': 2000})
+            analysis_result = get_verify_parse_error_result(e, response_text)
+        return save_verify_result(build_verify_payload(analysis_result, evidence), data, doc_text, score_items)
+    
+    events = stream_llm_events(
+        'verify',
+        lambda prompt: LLM_CLIENT.stream('qwen-plus', prompt=prompt, parameters={'max_tokens': 2000}, endpoint='verify', use_cache=use_cache),
+        ['missing_items'],
+        finalize,
+        lambda error_msg: save_verify_result(
+            build_verify_payload(get_fallback_analysis(doc_text, score_items, error_msg), evidence),
+            data, doc_text, score_items),
+        prepare=prepare
+    )
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# 调用阿里云DashScope大模型进行智能分析
+# API密钥现在通过手动配置管理，不再使用硬编码密钥
+
+def build_verify_prompt(doc_text, score_items):
+    """构造述职报告校对提示词"""
+    return f"""
 ## 角色
 你是一个专业的述职报告校对助手。你的任务是严格、细致地对比"评价表"中的要求和"述职PPT"中的实际内容，找出所有不一致、缺失或表述不清的地方，并提供具体、可行的修改参考。
 
@@ -205,57 +583,62 @@ suggestions字段必须按以下HTML格式输出，直接列出修改参考：
 {{"missing_items": ["工作成果量化不足"], "suggestions": "<div class=\"suggestions-content\"><h5>系统已完成校对，共检测到 1处 需要关注的内容</h5><h5>一、工作与能力展示维度</h5><ul><li><strong>问题：工作成果量化不足</strong><br/>修改参考：补充具体数据和案例</li></ul></div>"}}
     """
     
-    url = 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'
-    headers = {
-        'Authorization': f'Bearer {DASHSCOPE_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'model': 'qwen-plus',
-        'input': {'prompt': prompt},
-        'parameters': {'result_format': 'text', 'max_tokens': 2000}
+
+# 校对结果的结构约定：{字段: (类型, 默认值)}
+VERIFY_SCHEMA = {
+    'missing_items': (list, REQUIRED),
+    'suggestions': (str, '')
+}
+
+def parse_verify_response(response_text):
+    """解析校对结果JSON（容忍代码块标记、常见格式问题和截断），无法修复时抛出 json.JSONDecodeError"""
+    return extract_json(response_text, VERIFY_SCHEMA)
+
+def get_verify_parse_error_result(e, response_text):
+    """JSON解析失败时返回基础分析结果，包含调试信息"""
+    return {
+        'missing_items': ['大模型返回格式解析失败'],
+        'suggestions': f'''
+        <div class="suggestions-content">
+        <div class="alert alert-warning">
+            <h6><i class="fas fa-exclamation-triangle me-2"></i>JSON解析错误</h6>
+            <p><strong>错误位置：</strong> 第{e.lineno}行，第{e.colno}列</p>
+            <p><strong>错误信息：</strong> {e.msg}</p>
+            <details>
+                <summary>查看原始响应</summary>
+                <pre style="max-height: 200px; overflow-y: auto; font-size: 0.8em;">{response_text[:1000]}{'...' if len(response_text) > 1000 else ''}</pre>
+            </details>
+        </div>
+        <h5>修改参考</h5>
+        <ul>
+            <li>大模型返回格式错误，建议稍后重试或检查网络连接</li>
+        </ul>
+        </div>
+        '''
     }
+
+def call_dashscope_llm_analysis(doc_text, score_items, use_cache=True, doc_context=None):
+    """
+    使用专业的述职报告校对助手进行智能分析
+    use_cache=False 时跳过响应缓存强制重新生成
+    doc_context 为送入提示词的文档内容（如检索到的证据片段），默认使用全文
+    """
+    prompt = build_verify_prompt(
+        fit_document_to_budget(doc_context if doc_context is not None else doc_text, 'qwen-plus',
+                               build_verify_prompt('', score_items), use_cache), score_items)
     
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=60)
+        resp = LLM_CLIENT.generate('qwen-plus', prompt=prompt, parameters={'max_tokens': 2000}, endpoint='verify', use_cache=use_cache)
         if resp.status_code == 200:
-            result = resp.json()
-            response_text = result.get('output', {}).get('text', '')
+            response_text = resp.text
             
             # 尝试解析JSON响应
             try:
-                # 清理可能的代码块标记
-                cleaned_text = response_text.strip()
-                if cleaned_text.startswith('```json'):
-                    cleaned_text = cleaned_text[7:]
-                if cleaned_text.endswith('```'):
-                    cleaned_text = cleaned_text[:-3]
-                cleaned_text = cleaned_text.strip()
-                
-                analysis_result = json.loads(cleaned_text)
-                return analysis_result
+                return parse_verify_response(response_text)
             except json.JSONDecodeError as e:
-                # 如果JSON解析失败，返回基础分析结果，包含调试信息
-                return {
-                    'missing_items': ['大模型返回格式解析失败'],
-                    'suggestions': f'''
-                    <div class="suggestions-content">
-                    <div class="alert alert-warning">
-                        <h6><i class="fas fa-exclamation-triangle me-2"></i>JSON解析错误</h6>
-                        <p><strong>错误位置：</strong> 第{e.lineno}行，第{e.colno}列</p>
-                        <p><strong>错误信息：</strong> {e.msg}</p>
-                        <details>
-                            <summary>查看原始响应</summary>
-                            <pre style="max-height: 200px; overflow-y: auto; font-size: 0.8em;">{response_text[:1000]}{'...' if len(response_text) > 1000 else ''}</pre>
-                        </details>
-                    </div>
-                    <h5>修改参考</h5>
-                    <ul>
-                        <li>大模型返回格式错误，建议稍后重试或检查网络连接</li>
-                    </ul>
-                    </div>
-                    '''
-                }
+                # 解析失败的响应不保留在缓存中，避免重试时拿到同样的结果
+                LLM_CACHE.invalidate(resp.cache_key)
+                return get_verify_parse_error_result(e, response_text)
         else:
             return get_fallback_analysis(doc_text, score_items)
     except Exception as e:
@@ -263,22 +646,9 @@ suggestions字段必须按以下HTML格式输出，直接列出修改参考：
 
 def get_fallback_analysis(doc_text, score_items, error_msg=None):
     """备用分析逻辑，遵循专业校对格式"""
-    missing_items = []
-    
-    # 简单关键词匹配分析
-    keywords_to_check = {
-        '工作成果展示': ['成果', '业绩', '结果', '产出', '完成'],
-        '团队协作能力': ['协作', '团队', '合作', '配合', '沟通'],
-        '能力发展体现': ['学习', '成长', '提升', '发展', '进步'],
-        '业务影响说明': ['业务', '价值', '效益', '收益', '贡献'],
-        '创新思维展现': ['创新', '改进', '优化', '新方法', '突破']
-    }
-    
-    detected_issues = []
-    for category, keywords in keywords_to_check.items():
-        if not any(keyword in doc_text for keyword in keywords):
-            missing_items.append(f"{category}内容不充分")
-            detected_issues.append(category)
+    # 关键词匹配分析：一次扫描统计分类体系中所有关键词的命中
+    detected_issues, category_hits = FALLBACK_ANALYZER.missing_categories(doc_text)
+    missing_items = [f"{category}内容不充分" for category in detected_issues]
     
     # 生成专业格式的建议
     issue_count = len(detected_issues)
@@ -295,22 +665,12 @@ def get_fallback_analysis(doc_text, score_items, error_msg=None):
     <ul>
     """
     
-    if '工作成果展示' in detected_issues:
-        suggestions_content += """
-        <li><strong>问题：工作成果数据不够具体</strong><br/>
-        修改参考：补充项目数量、质量指标等具体数据和案例</li>
-        """
-    
-    if '团队协作能力' in detected_issues:
-        suggestions_content += """
-        <li><strong>问题：团队协作案例缺失</strong><br/>
-        修改参考：添加跨部门协作具体案例和个人贡献描述</li>
-        """
-    
-    if '业务影响说明' in detected_issues:
-        suggestions_content += """
-        <li><strong>问题：业务价值体现不足</strong><br/>
-        修改参考：量化工作对业务的具体贡献和价值影响</li>
+    for category in detected_issues:
+        spec = FALLBACK_ANALYZER.taxonomy[category]
+        if spec.get('problem') and spec.get('suggestion'):
+            suggestions_content += f"""
+        <li><strong>问题：{spec['problem']}</strong><br/>
+        修改参考：{spec['suggestion']}</li>
         """
     
     suggestions_content += """
@@ -333,16 +693,19 @@ def get_fallback_analysis(doc_text, score_items, error_msg=None):
     
     return {
         'missing_items': missing_items,
-        'suggestions': suggestions_content
+        'suggestions': suggestions_content,
+        'category_hits': category_hits
     }
 
 # 保留原有函数以兼容其他功能
 def call_dashscope_llm(doc_text, score_items, missing_items):
+    # 按token预算在章节边界处截取，而不是固定截断前500个字符
+    excerpt, truncated = document_excerpt(doc_text, SUGGESTION_EXCERPT_TOKENS)
     prompt = f"""
     任务：分析述职文档与评分表的一致性，并提供针对性建议
     
     文档内容概述：
-    {doc_text[:500]}...（内容省略）
+    {excerpt}{'...（内容省略）' if truncated else ''}
     
     评分表考核项：
     {', '.join(score_items[:10])}...（可能有更多项）
@@ -375,22 +738,10 @@ def call_dashscope_llm(doc_text, score_items, missing_items):
     请严格按照上述HTML结构输出，不要添加其他文字说明。
     """
     
-    url = 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'
-    headers = {
-        'Authorization': f'Bearer {DASHSCOPE_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'model': 'qwen-plus',
-        'input': {'prompt': prompt},
-        'parameters': {'result_format': 'text'}
-    }
-    
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=30)
+        resp = LLM_CLIENT.generate('qwen-plus', prompt=prompt, endpoint='suggestion')
         if resp.status_code == 200:
-            result = resp.json()
-            return result.get('output', {}).get('text', '')
+            return resp.text
         else:
             # 模拟返回结果，API调用失败时使用
             if missing_items:
@@ -457,8 +808,15 @@ def call_dashscope_llm(doc_text, score_items, missing_items):
         """
 
 # 员工诊断报告API
-def extract_employee_info_with_llm(text, filename):
-    """使用大模型分析文档内容并提取员工信息"""
+# 规则抽取的员工信息置信度不低于该值时不再调用大模型
+EMPLOYEE_INFO_MIN_CONFIDENCE = float(os.getenv('EMPLOYEE_INFO_MIN_CONFIDENCE', 0.8))
+
+def extract_employee_info_with_llm(text, filename, fallback=None):
+    """使用大模型分析文档内容并提取员工信息，大模型未给出的字段用规则抽取结果补齐"""
+    if fallback is None:
+        fallback = employee_info.extract(text, filename)
+    fallback = (fallback.name, fallback.position, fallback.quarter)
+
     prompt = f"""
 ## 任务
 请分析以下文档内容，提取员工的基本信息。
@@ -485,44 +843,15 @@ def extract_employee_info_with_llm(text, filename):
     
     try:
         print(f"[DEBUG] 开始使用大模型提取员工信息，文件名: {filename}")
-        print(f"[DEBUG] 文档内容前500字符: {text[:500]}")
         
-        response = dashscope.Generation.call(
-            model='qwen-plus',
-            prompt=prompt,
-            result_format='text',
-            api_key=DASHSCOPE_API_KEY
-        )
+        response = LLM_CLIENT.generate('qwen-plus', prompt=prompt, endpoint='employee_info')
         
         if response.status_code == HTTPStatus.OK:
-            response_text = response.output.text.strip()
+            response_text = response.text.strip()
             print(f"[DEBUG] 大模型返回结果: {response_text}")
             
-            # 使用正则表达式从大模型输出中提取信息
-            import re
-            
-            employee_name = '未知'
-            position = '未知'
-            quarter = '未知'
-            
-            # 提取员工姓名
-            name_match = re.search(r'员工姓名[：:]\s*([^\n\r]+)', response_text)
-            if name_match:
-                employee_name = name_match.group(1).strip()
-                print(f"[DEBUG] 提取到员工姓名: {employee_name}")
-            
-            # 提取职位信息
-            position_match = re.search(r'职位信息[：:]\s*([^\n\r]+)', response_text)
-            if position_match:
-                position = position_match.group(1).strip()
-                print(f"[DEBUG] 提取到职位信息: {position}")
-            
-            # 提取评估周期
-            quarter_match = re.search(r'评估周期[：:]\s*([^\n\r]+)', response_text)
-            if quarter_match:
-                quarter = quarter_match.group(1).strip()
-                print(f"[DEBUG] 提取到评估周期: {quarter}")
-            
+            employee_name, position, quarter = employee_info.merge(
+                employee_info.parse_llm_response(response_text), fallback)
             print(f"[DEBUG] 最终提取结果 - 姓名: {employee_name}, 职位: {position}, 周期: {quarter}")
             return employee_name, position, quarter
         else:
@@ -531,246 +860,432 @@ def extract_employee_info_with_llm(text, filename):
     except Exception as e:
         print(f"大模型提取员工信息失败: {str(e)}")
     
-    # 如果大模型提取失败，回退到原有的正则表达式方法
+    # 如果大模型提取失败，回退到规则抽取结果
     print(f"[DEBUG] 回退到正则提取方法")
-    return extract_employee_info_from_content_fallback(text, filename)
+    return fallback
 
 def extract_employee_info_from_content_fallback(text, filename):
     """备用的正则表达式提取方法"""
-    import re
-    
-    employee_name = '未知'
-    position = '未知'
-    quarter = '未知'
-    
-    # 从文件名提取信息
-    filename_lower = filename.lower()
+    info = employee_info.extract(text, filename)
+    return info.name, info.position, info.quarter
+
+def extract_employee_info_from_content(text, filename):
+    """
+    从文件内容和文件名中提取员工信息（主入口函数）
+
+    先用预编译规则单次扫描抽取，三个字段的置信度都不低于 EMPLOYEE_INFO_MIN_CONFIDENCE 时
+    直接返回，否则再调用大模型
+    """
+    info = employee_info.extract(text, filename)
+    if info.confidence >= EMPLOYEE_INFO_MIN_CONFIDENCE:
+        print(f"[DEBUG] 规则抽取置信度 {info.confidence:.2f}，跳过大模型 - "
+              f"姓名: {info.name}, 职位: {info.position}, 周期: {info.quarter}")
+        return info.name, info.position, info.quarter
+    return extract_employee_info_with_llm(text, filename, fallback=info)
+
+@app.route('/api/generate_diagnosis', methods=['POST'])
+def generate_diagnosis():
+    payload, status = run_diagnosis(request.get_json())
+    return jsonify(payload), status
+
+def load_diagnosis_document(doc_path):
+    """读取诊断用的述职文档，返回 (正文, 错误结果)，错误结果为 (dict, HTTP状态码)"""
+    if not doc_path:
+        return None, ({'error': 'Missing doc_path'}, 400)
     
-    # 提取季度信息
-    quarter_patterns = [
-        r'(\d{4})年?第?([一二三四1234])季度?',
-        r'(\d{4})年?([一二三四1234])季度?',
-        r'(\d{4})q([1234])',
-        r'q([1234])(\d{4})',
-        r'(\d{4})[年-](\d{1,2})月?'
-    ]
+    try:
+        # 读取文档内容
+        full_doc_path = resolve_upload_path(doc_path)
+        
+        if not document_extractor.is_supported(doc_path):
+            return None, ({'error': 'Unsupported file format'}, 400)
+        report_text = extract_document_text(full_doc_path)
+            
+        if not report_text.strip():
+            return None, ({'error': 'Failed to extract text from document'}, 400)
+    except FileNotFoundError:
+        return None, ({'error': f'Failed to read document: File not found: {doc_path}'}, 400)
+    except Exception as e:
+        return None, ({'error': f'Failed to generate diagnosis: {str(e)}'}, 500)
+    return report_text, None
+
+def run_diagnosis(data, progress=None, executor=None):
+    """
+    执行员工诊断，返回 (结果, HTTP状态码)；供同步接口与后台任务共用
+
+    executor 为并发阶段使用的线程池，默认为全局共享的流水线线程池。
+    """
+    # 获取请求参数
+    employee_name = data.get('employee_name', '未知员工')
+    # 前端传空值时使用通用能力模型，群体分析按该名称筛选
+    ability_model = data.get('ability_model') or '通用能力模型'
+    quarter = data.get('quarter', '未知季度')
+    doc_path = data.get('doc_path')
+    use_cache = not data.get('bypass_cache', False)
+    # 不再使用音频文件
+    # audio_path = data.get('audio_path', '')
     
-    for pattern in quarter_patterns:
-        match = re.search(pattern, filename_lower + text[:500])
-        if match:
-            if '月' in pattern:
-                year, month = match.groups()
-                month_num = int(month)
-                if 1 <= month_num <= 3:
-                    quarter = f'{year}年第一季度'
-                elif 4 <= month_num <= 6:
-                    quarter = f'{year}年第二季度'
-                elif 7 <= month_num <= 9:
-                    quarter = f'{year}年第三季度'
-                elif 10 <= month_num <= 12:
-                    quarter = f'{year}年第四季度'
-            else:
-                groups = match.groups()
-                if len(groups) >= 2:
-                    year = groups[0] if groups[0].isdigit() else groups[1]
-                    q = groups[1] if groups[0].isdigit() else groups[0]
-                    quarter_map = {'1': '一', '2': '二', '3': '三', '4': '四',
-                                 '一': '一', '二': '二', '三': '三', '四': '四'}
-                    if q in quarter_map:
-                        quarter = f'{year}年第{quarter_map[q]}季度'
-            break
+    report_text, error = load_diagnosis_document(doc_path)
+    if error:
+        return error
+    filename = upload_display_name(doc_path)
+    if progress:
+        progress(0.2, '文档解析完成')
     
-    # 从文本内容提取员工姓名
-    name_patterns = [
-        r'述职人[：:]\s*([\u4e00-\u9fa5]{2,4})',
-        r'姓名[：:]\s*([\u4e00-\u9fa5]{2,4})',
-        r'汇报人[：:]\s*([\u4e00-\u9fa5]{2,4})',
-        r'花名[：:]\s*([\u4e00-\u9fa5]{2,4})',
-        r'我是\s*([\u4e00-\u9fa5]{2,4})',
-        r'本人\s*([\u4e00-\u9fa5]{2,4})',
-        r'申请人[：:]\s*([\u4e00-\u9fa5]{2,4})'
-    ]
+    try:
+        # 员工信息抽取与千问诊断分析互不依赖，并发执行；
+        # 抽取到的姓名、职位、评估周期在诊断完成后再回填到结果中
+        pipeline = Pipeline(executor)
+        pipeline.add('employee_info', lambda: extract_employee_info_from_content(report_text, filename))
+        pipeline.add('diagnosis', lambda: call_qianwen_for_diagnosis(
+            report_text, employee_name or '未知员工', ability_model, quarter or '未知季度', use_cache=use_cache))
+        stage_results = pipeline.run()
+        
+        payload = build_diagnosis_payload(
+            stage_results['diagnosis'], employee_name, ability_model, quarter, stage_results['employee_info'])
+        return save_diagnosis_result(payload, report_text, employee_name, ability_model, quarter, doc_path), 200
+    except Exception as e:
+        return {'error': f'Failed to generate diagnosis: {str(e)}'}, 500
+
+def build_diagnosis_payload(diagnosis_result, employee_name, ability_model, quarter, extracted_info):
+    """将抽取到的员工信息回填到诊断结果，诊断失败时使用备用结果"""
+    extracted_name, extracted_position, extracted_quarter = extracted_info
     
-    for pattern in name_patterns:
-        match = re.search(pattern, text[:1500])
-        if match:
-            employee_name = match.group(1).strip()
-            break
+    # 如果前端没有提供员工信息，则使用提取的信息
+    if employee_name == '未知员工' or not employee_name:
+        employee_name = extracted_name
+    if quarter == '未知季度' or not quarter:
+        quarter = extracted_quarter
     
-    # 从文本内容提取职位信息
-    position_patterns = [
-        r'职位[：:]\s*([\u4e00-\u9fa5]{2,10})',
-        r'岗位[：:]\s*([\u4e00-\u9fa5]{2,10})',
-        r'职级[：:]\s*(p\d+|P\d+|[\u4e00-\u9fa5]{2,10})',
-        r'申请岗位[：:]\s*([\u4e00-\u9fa5]{2,10})',
-        r'担任\s*([\u4e00-\u9fa5]{2,10})',
-        r'(高级|中级|初级|资深)?(工程师|开发|架构师|经理|主管|总监|专员|策划)',
-        r'(P\d+|T\d+|M\d+|p\d+|t\d+|m\d+)'
-    ]
+    payload = {'success': True}
+    if not diagnosis_result:
+        # 如果千问模型调用失败，返回备用诊断结果
+        diagnosis_result = get_fallback_diagnosis(employee_name, ability_model, quarter)
+        payload['note'] = '使用备用分析模式'
     
-    for pattern in position_patterns:
-        match = re.search(pattern, text[:1500], re.IGNORECASE)
-        if match:
-            if match.groups():
-                position = ''.join(filter(None, match.groups())).strip()
-            else:
-                position = match.group(0).strip()
-            break
+    # 更新诊断结果中的员工信息
+    diagnosis_result['employee_info']['name'] = employee_name
+    diagnosis_result['employee_info']['quarter'] = quarter
+    if extracted_position != '未知':
+        diagnosis_result['employee_info']['position'] = extracted_position
     
-    return employee_name, position, quarter
+    payload['diagnosis'] = diagnosis_result
+    payload['extracted_info'] = {
+        'name': extracted_name,
+        'position': extracted_position,
+        'quarter': extracted_quarter
+    }
+    return payload
 
-def extract_employee_info_from_content(text, filename):
-    """从文件内容和文件名中提取员工信息（主入口函数）"""
-    return extract_employee_info_with_llm(text, filename)
+def save_diagnosis_result(payload, report_text, employee_name, ability_model, quarter, doc_path):
+    """保存诊断结果并计入群体分析"""
+    record_diagnosis(payload, ability_model)
+    info = payload['diagnosis'].get('employee_info', {})
+    input_key = make_result_key('diagnosis', report_text=report_text, employee_name=employee_name,
+                                ability_model=ability_model, quarter=quarter)
+    return save_result('diagnosis', payload, input_key, employee=info.get('name'), quarter=info.get('quarter'),
+                       ability_model=ability_model, source=doc_path)
 
-@app.route('/api/generate_diagnosis', methods=['POST'])
-def generate_diagnosis():
+def record_diagnosis(payload, ability_model):
+    """将模型给出的诊断评分计入群体分析，备用结果和无法识别的员工不计入"""
+    if 'note' in payload:
+        return
+    diagnosis = payload['diagnosis']
+    info = diagnosis.get('employee_info', {})
+    employee_name = info.get('name')
+    if not employee_name or employee_name in ('未知', '未知员工'):
+        return
+    try:
+        COHORT_STORE.record(employee_name, info.get('position') or payload['extracted_info']['position'],
+                            ability_model, info.get('quarter'), diagnosis.get('abilities'),
+                            diagnosis.get('strengths'))
+    except Exception as e:
+        print(f"记录群体分析数据失败: {str(e)}")
+
+# 诊断报告的流式版本（SSE），优势、待发展领域和建议逐条下发
+@app.route('/api/generate_diagnosis/stream', methods=['POST'])
+def generate_diagnosis_stream():
     data = request.get_json()
     
-    # 获取请求参数
     employee_name = data.get('employee_name', '未知员工')
-    ability_model = data.get('ability_model', '通用能力模型')
+    # 前端传空值时使用通用能力模型，群体分析按该名称筛选
+    ability_model = data.get('ability_model') or '通用能力模型'
     quarter = data.get('quarter', '未知季度')
     doc_path = data.get('doc_path')
-    # 不再使用音频文件
-    # audio_path = data.get('audio_path', '')
+    use_cache = not data.get('bypass_cache', False)
     
-    if not doc_path:
-        return jsonify({'error': 'Missing doc_path'}), 400
+    report_text, error = load_diagnosis_document(doc_path)
+    if error:
+        return jsonify(error[0]), error[1]
+    filename = upload_display_name(doc_path)
+    
+    # 员工信息抽取在后台与流式诊断并发执行，诊断结束后回填
+    info_future = get_executor().submit(contextvars.copy_context().run, extract_employee_info_from_content,
+                                        report_text, filename)
+    
+    def prepare():
+        prompt_text = fit_document_to_budget(
+            report_text, 'qwen-plus',
+            build_diagnosis_prompt('', employee_name or '未知员工', ability_model, quarter or '未知季度'), use_cache)
+        return build_diagnosis_prompt(prompt_text, employee_name or '未知员工', ability_model, quarter or '未知季度')
     
+    def finalize(response_text, prompt):
+        try:
+            diagnosis_result = parse_diagnosis_response(response_text)
+        except json.JSONDecodeError as e:
+            LLM_CLIENT.invalidate('qwen-plus', prompt=prompt)
+            print(f"JSON解析错误: {e}")
+            diagnosis_result = None
+        payload = build_diagnosis_payload(diagnosis_result, employee_name, ability_model, quarter, info_future.result())
+        return save_diagnosis_result(payload, report_text, employee_name, ability_model, quarter, doc_path)
+    
+    events = stream_llm_events(
+        'diagnosis',
+        lambda prompt: LLM_CLIENT.stream('qwen-plus', prompt=prompt, endpoint='diagnosis', use_cache=use_cache),
+        ['strengths', 'weaknesses', 'growth_suggestions', 'manager_suggestions'],
+        finalize,
+        lambda error_msg: save_diagnosis_result(
+            build_diagnosis_payload(None, employee_name, ability_model, quarter, info_future.result()),
+            report_text, employee_name, ability_model, quarter, doc_path),
+        prepare=prepare
+    )
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# ---------- 分析结果 ----------
+
+def save_result(kind, payload, input_key, employee=None, quarter=None, ability_model=None, source=None):
+    """持久化分析结果并把结果ID写入返回内容；存储失败不影响本次返回"""
     try:
-        # 读取文档内容
-        if doc_path.startswith('uploads/') or doc_path.startswith('uploads\\'):
-            full_doc_path = doc_path
-        else:
-            full_doc_path = os.path.join(app.config['UPLOAD_FOLDER'], doc_path)
-            
-        report_text = ''
-        filename = os.path.basename(doc_path)
-        
-        if doc_path.endswith('.pdf'):
-            with open(full_doc_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    report_text += page.extract_text() + '\n'
-        elif doc_path.endswith('.pptx'):
-            prs = Presentation(full_doc_path)
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, 'text'):
-                        report_text += shape.text + '\n'
-        else:
-            return jsonify({'error': 'Unsupported file format'}), 400
-            
-        if not report_text.strip():
-            return jsonify({'error': 'Failed to extract text from document'}), 400
-            
-        # 从文档内容和文件名中提取员工信息
-        extracted_name, extracted_position, extracted_quarter = extract_employee_info_from_content(report_text, filename)
-        
-        # 如果前端没有提供员工信息，则使用提取的信息
-        if employee_name == '未知员工' or not employee_name:
-            employee_name = extracted_name
-        if quarter == '未知季度' or not quarter:
-            quarter = extracted_quarter
-            
-        # 调用千问模型进行诊断分析
-        diagnosis_result = call_qianwen_for_diagnosis(report_text, employee_name, ability_model, quarter)
-        
-        if diagnosis_result:
-            # 更新诊断结果中的员工信息
-            diagnosis_result['employee_info']['name'] = employee_name
-            diagnosis_result['employee_info']['quarter'] = quarter
-            if extracted_position != '未知':
-                diagnosis_result['employee_info']['position'] = extracted_position
-            
-            return jsonify({
-                'success': True,
-                'diagnosis': diagnosis_result,
-                'extracted_info': {
-                    'name': extracted_name,
-                    'position': extracted_position,
-                    'quarter': extracted_quarter
-                }
-            }), 200
-        else:
-            # 如果千问模型调用失败，返回备用诊断结果
-            fallback_result = get_fallback_diagnosis(employee_name, ability_model, quarter)
-            # 更新备用结果中的员工信息
-            fallback_result['employee_info']['name'] = employee_name
-            fallback_result['employee_info']['quarter'] = quarter
-            if extracted_position != '未知':
-                fallback_result['employee_info']['position'] = extracted_position
-                
-            return jsonify({
-                'success': True,
-                'diagnosis': fallback_result,
-                'note': '使用备用分析模式',
-                'extracted_info': {
-                    'name': extracted_name,
-                    'position': extracted_position,
-                    'quarter': extracted_quarter
-                }
-            }), 200
-            
-    except FileNotFoundError:
-        return jsonify({'error': f'Failed to read document: File not found: {doc_path}'}), 400
+        stored = {key: value for key, value in payload.items() if key not in ('result_id', 'timing')}
+        payload['result_id'] = RESULT_STORE.save(kind, input_key, stored, employee=employee, quarter=quarter,
+                                                 ability_model=ability_model, source=source)
     except Exception as e:
-        return jsonify({'error': f'Failed to generate diagnosis: {str(e)}'}), 500
+        print(f"保存{kind}结果失败: {str(e)}")
+    return payload
+
+# 按员工、评估周期、能力模型查询历史结果（不含结果内容）
+@app.route('/api/results', methods=['GET'])
+def list_results():
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit/offset 必须为整数'}), 400
+    total, results = RESULT_STORE.query(
+        kind=request.args.get('kind'),
+        employee=request.args.get('employee'),
+        quarter=request.args.get('quarter'),
+        ability_model=request.args.get('ability_model'),
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({'success': True, 'total': total, 'results': results}), 200
+
+# 按ID读取结果
+@app.route('/api/results/<result_id>', methods=['GET'])
+def get_result(result_id):
+    result = RESULT_STORE.get(result_id)
+    if not result:
+        return jsonify({'success': False, 'error': '结果不存在'}), 404
+    return jsonify({'success': True, 'result': result}), 200
 
-# 群体分析API
+# ---------- 导出 ----------
+
+SCORING_EXPORT_HEADER = ['员工姓名', '能力模型', '评估周期', '能力项', '评分', '评分依据', '提升建议', '结果ID']
+SCORING_EXPORT_WIDTHS = [12, 16, 16, 20, 8, 60, 60, 34]
+SCORING_SUMMARY_HEADER = ['员工姓名', '能力模型', '评估周期', '核心优势', '待发展领域', '结果ID']
+SCORING_SUMMARY_WIDTHS = [12, 16, 16, 50, 50, 34]
+
+def iter_scoring_export_rows(results):
+    """打分建议结果逐条展开为评分明细行"""
+    for result in results:
+        scoring = result['payload'].get('scoring') or {}
+        for suggestion in scoring.get('scoring_suggestions') or []:
+            yield [scoring.get('employee_name'), scoring.get('position'), scoring.get('quarter'),
+                   suggestion.get('ability'), suggestion.get('score'), suggestion.get('basis'),
+                   suggestion.get('suggestion'), result['id']]
+
+def iter_scoring_summary_rows(results):
+    for result in results:
+        scoring = result['payload'].get('scoring') or {}
+        yield [scoring.get('employee_name'), scoring.get('position'), scoring.get('quarter'),
+               scoring.get('core_strengths'), scoring.get('areas_for_development'), result['id']]
+
+def attachment_headers(filename):
+    """下载文件名（中文按 RFC 5987 编码，旧浏览器使用ASCII文件名）"""
+    stem, ext = os.path.splitext(filename)
+    ascii_name = (secure_filename(stem) or 'export') + ext
+    return {'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}",
+            'X-Accel-Buffering': 'no'}
+
+# 导出能力评分Excel：边读结果边生成边发送，不在内存中构建整个工作簿
+# - 传 scoring_results（行列表）与 column_order 时导出页面上的评分表
+# - 否则导出结果库中的打分建议：按 result_ids，或按 employee / quarter / ability_model 筛选（可导出整个团队）；
+#   两者都没有时返回400，不会导出整个结果库
+@app.route('/api/export_scoring_excel', methods=['POST'])
+def export_scoring_excel():
+    data = request.get_json(silent=True) or {}
+    filename = (data.get('file_name') or '能力评分结果').removesuffix('.xlsx') + '.xlsx'
+    if 'scoring_results' in data:
+        rows = data['scoring_results']
+        if not rows or not isinstance(rows, list):
+            return jsonify({'success': False, 'error': '没有可导出的评分结果'}), 400
+        columns = data.get('column_order') or list(rows[0].keys())
+        sheets = [Sheet('能力评分', columns, ([row.get(column) for column in columns] for row in rows))]
+    else:
+        filters = {name: data.get(name) for name in ('employee', 'quarter', 'ability_model')}
+        result_ids = data.get('result_ids') or None
+        if result_ids is None and not any(filters.values()):
+            return jsonify({'success': False,
+                            'error': '请指定要导出的结果（result_ids）或筛选条件（employee / quarter / ability_model）'}), 400
+        if result_ids is None and RESULT_STORE.query(kind='scoring_suggestion', limit=1, **filters)[0] == 0:
+            return jsonify({'success': False, 'error': '没有可导出的评分结果'}), 404
+
+        def results():
+            return RESULT_STORE.iter_results(kind='scoring_suggestion', result_ids=result_ids, **filters)
+
+        sheets = [
+            Sheet('评分明细', SCORING_EXPORT_HEADER, iter_scoring_export_rows(results()), SCORING_EXPORT_WIDTHS),
+            Sheet('综合评价', SCORING_SUMMARY_HEADER, iter_scoring_summary_rows(results()), SCORING_SUMMARY_WIDTHS)
+        ]
+    return Response(stream_with_context(stream_xlsx(sheets)), mimetype=XLSX_MIMETYPE,
+                    headers=attachment_headers(filename))
+
+def pdf_response(content, filename):
+    return Response(content, mimetype='application/pdf', headers=attachment_headers(filename))
+
+# 导出诊断报告PDF：传 result_id（已保存的诊断结果），或直接传 diagnosis（诊断结果）
+@app.route('/api/export_diagnosis_report', methods=['POST'])
+def export_diagnosis_report():
+    data = request.get_json(silent=True) or {}
+    diagnosis = None
+    if data.get('result_id'):
+        result = RESULT_STORE.get(data['result_id'], kind='diagnosis')
+        diagnosis = result['payload'].get('diagnosis') if result else None
+    # 结果库中没有时才使用请求中携带的诊断内容
+    diagnosis = diagnosis or data.get('diagnosis')
+    if not diagnosis:
+        return jsonify({'success': False, 'error': '没有可导出的诊断结果'}), 400
+    info = diagnosis.get('employee_info') or {}
+    try:
+        content = REPORT_ENGINE.render('diagnosis', {'diagnosis': diagnosis})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'生成诊断报告失败: {str(e)}'}), 500
+    return pdf_response(content, f"{info.get('name') or '员工'}_诊断报告_{info.get('quarter') or ''}.pdf")
+
+# 批量导出诊断报告：按 result_ids，或按 employee / quarter / ability_model 筛选已保存的诊断结果；
+# merge 为真时合并为一个PDF，否则每人一个PDF打包为zip
+@app.route('/api/export_diagnosis_reports', methods=['POST'])
+def export_diagnosis_reports():
+    data = request.get_json(silent=True) or {}
+    filters = {name: data.get(name) for name in ('employee', 'quarter', 'ability_model')}
+    results = list(RESULT_STORE.iter_results(kind='diagnosis', result_ids=data.get('result_ids'), **filters))
+    if not results:
+        return jsonify({'success': False, 'error': '没有可导出的诊断结果'}), 404
+    items = [{'diagnosis': result['payload'].get('diagnosis') or {}} for result in results]
+    try:
+        documents = report_pdf.render_batch('diagnosis', items, merge=bool(data.get('merge')))
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'生成诊断报告失败: {str(e)}'}), 500
+    if data.get('merge'):
+        return pdf_response(documents, f"{data.get('quarter') or '团队'}_诊断报告.pdf")
+    buffer = BytesIO()
+    used = set()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for item, result, document in zip(items, results, documents):
+            info = item['diagnosis'].get('employee_info') or {}
+            name = f"{info.get('name') or '员工'}_诊断报告_{info.get('quarter') or ''}"
+            if name in used:
+                name = f"{name}_{result['id'][:8]}"
+            used.add(name)
+            archive.writestr(f'{name}.pdf', document)
+    return Response(buffer.getvalue(), mimetype='application/zip',
+                    headers=attachment_headers(f"{data.get('quarter') or '团队'}_诊断报告.zip"))
+
+# 导出能力评分报告PDF：analysis_data（核心优势、待发展领域）与 scoring_results（评分表行）
+@app.route('/api/export_pdf_report', methods=['POST'])
+def export_pdf_report():
+    data = request.get_json(silent=True) or {}
+    if not data.get('analysis_data') and not data.get('scoring_results'):
+        return jsonify({'success': False, 'error': '没有可导出的评分结果'}), 400
+    filename = (data.get('file_name') or '能力评分报告').removesuffix('.pdf') + '.pdf'
+    try:
+        content = REPORT_ENGINE.render('scoring_report', data)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'生成PDF报告失败: {str(e)}'}), 500
+    return pdf_response(content, filename)
+
+# 导出评估依据PDF：suggestions 为 [{ability, evidence, quote}]
+@app.route('/api/export_scoring_evidence', methods=['POST'])
+def export_scoring_evidence():
+    data = request.get_json(silent=True) or {}
+    if not data.get('suggestions'):
+        return jsonify({'success': False, 'error': '没有可导出的评估依据'}), 400
+    try:
+        content = REPORT_ENGINE.render('scoring_evidence', data)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'生成评估依据失败: {str(e)}'}), 500
+    return pdf_response(content, f"{data.get('employee_name') or '员工'}_评估依据_{data.get('quarter') or ''}.pdf")
+
+# 群体分析API：按能力模型、评估周期、职位筛选历史诊断
 @app.route('/api/generate_cohort_analysis', methods=['POST'])
 def generate_cohort_analysis():
-    # 这里可以实现真实的群体分析报告生成逻辑
-    # 当前返回模拟数据
-    return jsonify({
-        'success': True,
-        'cohort_analysis': {
-            'cohort_name': '所有P6级员工',
-            'model_name': '技术序列P6能力模型',
-            'time_range': '2023年全年',
-            'average_abilities': {
-                'technical_innovation': 4.2,
-                'business_impact': 3.4,
-                'teamwork': 4.3, 
-                'project_management': 4.0,
-                'cost_awareness': 3.1,
-                'strategic_thinking': 3.5
-            },
-            'strengths': [
-                {'name': '技术创新', 'score': 4.2, 'description': '普遍表现突出，能够快速学习新技术'},
-                {'name': '团队协作', 'score': 4.3, 'description': '协作意识强，能有效促进团队合作'},
-                {'name': '执行力', 'score': 4.1, 'description': '任务完成度高，交付质量好'}
-            ],
-            'weaknesses': [
-                {'name': '成本意识', 'score': 3.1, 'description': '普遍缺乏成本效益考量'},
-                {'name': '业务影响力', 'score': 3.4, 'description': '技术工作与业务价值关联不够明确'},
-                {'name': '战略思维', 'score': 3.5, 'description': '全局观和长远规划能力有待加强'}
-            ],
-            'best_practices': [
-                {
-                    'ability': '业务影响力',
-                    'employee': '员工A',
-                    'score': 4.8,
-                    'practice': '在项目启动前主动与业务团队沟通，明确业务目标和预期价值，并在项目过程中持续对齐',
-                    'result': '项目最终用户采纳率超过85%，直接贡献营收增长12%'
-                },
-                {
-                    'ability': '业务影响力',
-                    'employee': '员工B',
-                    'score': 4.6,
-                    'practice': '建立了技术工作业务价值评估框架，对所有开发任务进行价值评分和优先级排序',
-                    'result': '团队资源分配效率提升30%，高价值任务完成量增加40%'
-                }
-            ]
-        }
-    }), 200
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('result_ids'):
+            # 指定一组已保存的诊断结果作为群体
+            rows = []
+            for result in RESULT_STORE.get_many(data['result_ids'], kind='diagnosis'):
+                diagnosis = result['payload']['diagnosis']
+                info = diagnosis.get('employee_info', {})
+                rows.append((info.get('name'), info.get('position'), result['ability_model'], info.get('quarter'),
+                             diagnosis.get('abilities'), diagnosis.get('strengths')))
+            analysis = COHORT_STORE.analyze_records(rows, top_k=int(data.get('top_k', 3)))
+        else:
+            analysis = COHORT_STORE.analyze(
+                ability_model=data.get('ability_model'),
+                quarter=data.get('quarter'),
+                position=data.get('position'),
+                top_k=int(data.get('top_k', 3))
+            )
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'群体分析失败: {str(e)}'}), 500
+    if analysis is None:
+        return jsonify({'success': False, 'error': '没有符合条件的诊断记录'}), 404
+    return jsonify({'success': True, 'cohort_analysis': analysis}), 200
+
+# 群体分析可选的筛选条件
+@app.route('/api/cohort_options', methods=['GET'])
+def cohort_options():
+    return jsonify({'success': True, 'options': COHORT_STORE.options()}), 200
 
 # 打分建议API
 @app.route('/api/generate_scoring_suggestion', methods=['POST'])
 def generate_scoring_suggestion():
-    data = request.get_json()
+    payload, status = run_scoring_suggestion(request.get_json())
+    return jsonify(payload), status
+
+def run_scoring_suggestion(data, progress=None):
+    """生成打分建议，返回 (结果, HTTP状态码)；供同步接口与后台任务共用"""
+    report_text, scoring_table_text, error = load_scoring_inputs(data)
+    if error:
+        return error
+    if progress:
+        progress(0.2, '文档解析完成')
+
+    analysis_result = call_bailian_for_suggestion(report_text, scoring_table_text, use_cache=not data.get('bypass_cache', False))
     
+    if not analysis_result:
+        analysis_result = get_fallback_suggestion(report_text, scoring_table_text)
+
+    if analysis_result:
+        # 为了兼容前端，包装返回结果
+        return save_scoring_result(build_scoring_payload(data, analysis_result, report_text), data, report_text, scoring_table_text), 200
+    else:
+        return {"error": "Failed to get analysis from LLM and fallback"}, 500
+
+def load_scoring_inputs(data):
+    """读取打分所需的述职文本和评分体系文本，返回 (述职文本, 评分体系文本, 错误结果)，错误结果为 (dict, HTTP状态码)"""
     # 支持两种数据格式：新格式（前端发送的）和旧格式（直接传递文本）
     if 'report_text' in data and 'scoring_table_text' in data:
         # 旧格式：直接使用传递的文本
@@ -784,68 +1299,107 @@ def generate_scoring_suggestion():
         doc_path = data.get('doc_path')
         
         if not doc_path:
-            return jsonify({"error": "Missing doc_path"}), 400
+            return None, None, ({"error": "Missing doc_path"}, 400)
             
         # 从文档路径读取文本内容
         try:
             # 检查 doc_path 是否已经包含 uploads 前缀
-            if doc_path.startswith('uploads/') or doc_path.startswith('uploads\\'):
-                full_doc_path = doc_path
-            else:
-                full_doc_path = os.path.join(app.config['UPLOAD_FOLDER'], doc_path)
-            if doc_path.endswith('.pdf'):
-                with open(full_doc_path, 'rb') as file:
-                    reader = PyPDF2.PdfReader(file)
-                    report_text = ''
-                    for page in reader.pages:
-                        report_text += page.extract_text() + '\n'
-            elif doc_path.endswith('.pptx'):
-                prs = Presentation(full_doc_path)
-                report_text = ''
-                for slide in prs.slides:
-                    for shape in slide.shapes:
-                        if hasattr(shape, 'text'):
-                            report_text += shape.text + '\n'
-            else:
-                return jsonify({"error": "Unsupported file format"}), 400
+            full_doc_path = resolve_upload_path(doc_path)
+            if not document_extractor.is_supported(doc_path):
+                return None, None, ({"error": "Unsupported file format"}, 400)
+            report_text = extract_document_text(full_doc_path)
                 
             if not report_text.strip():
-                return jsonify({"error": "No text content found in document"}), 400
+                return None, None, ({"error": "No text content found in document"}, 400)
                 
         except Exception as e:
-            return jsonify({"error": f"Failed to read document: {str(e)}"}), 500
+            return None, None, ({"error": f"Failed to read document: {str(e)}"}, 500)
             
         # 构建评分表文本（基于能力模型）
         scoring_table_text = f"员工：{employee_name}\n职位：{ability_model}\n季度：{quarter}\n\n能力评估维度：\n1. 技术掌握与应用\n2. 项目管理能力\n3. 团队协作与沟通\n4. 业务理解与贡献\n5. 学习能力与创新思维"
 
     if not report_text or not scoring_table_text:
-        return jsonify({"error": "Missing report_text or scoring_table_text"}), 400
+        return None, None, ({"error": "Missing report_text or scoring_table_text"}, 400)
+    return report_text, scoring_table_text, None
+
+def build_scoring_payload(data, analysis_result, report_text=None):
+    if report_text:
+        attach_scoring_citations(analysis_result.get('scoring_suggestions', []), report_text)
+    return {
+        "success": True,
+        "scoring": {
+            "employee_name": data.get('employee_name', '未知员工'),
+            "position": data.get('ability_model', '未知职位'),
+            "quarter": data.get('quarter', '未知季度'),
+            "core_strengths": analysis_result.get('core_strengths', ''),
+            "areas_for_development": analysis_result.get('areas_for_development', ''),
+            "scoring_suggestions": analysis_result.get('scoring_suggestions', []),
+            "abilities": [item.get('ability', '') for item in analysis_result.get('scoring_suggestions', [])]
+        }
+    }
+
+def save_scoring_result(payload, data, report_text, scoring_table_text):
+    scoring = payload['scoring']
+    input_key = make_result_key('scoring_suggestion', report_text=report_text, scoring_table_text=scoring_table_text,
+                                employee_name=scoring['employee_name'], ability_model=scoring['position'],
+                                quarter=scoring['quarter'])
+    return save_result('scoring_suggestion', payload, input_key, employee=data.get('employee_name'),
+                       quarter=data.get('quarter'), ability_model=data.get('ability_model'),
+                       source=data.get('doc_path'))
 
-    analysis_result = call_bailian_for_suggestion(report_text, scoring_table_text)
+# 打分建议的流式版本（SSE），每条评分建议完成即下发
+@app.route('/api/generate_scoring_suggestion/stream', methods=['POST'])
+def generate_scoring_suggestion_stream():
+    data = request.get_json()
     
-    if not analysis_result:
-        analysis_result = get_fallback_suggestion(report_text, scoring_table_text)
+    report_text, scoring_table_text, error = load_scoring_inputs(data)
+    if error:
+        return jsonify(error[0]), error[1]
+    use_cache = not data.get('bypass_cache', False)
+    
+    def prepare():
+        return build_scoring_messages(fit_scoring_report(report_text, scoring_table_text, use_cache), scoring_table_text)
+    
+    def finalize(content, messages):
+        try:
+            analysis_result = parse_scoring_response(content)
+        except json.JSONDecodeError:
+            LLM_CLIENT.invalidate('qwen-max', messages=messages, result_format='message')
+            raise
+        return save_scoring_result(build_scoring_payload(data, analysis_result, report_text), data, report_text, scoring_table_text)
+    
+    events = stream_llm_events(
+        'scoring_suggestion',
+        lambda messages: LLM_CLIENT.stream('qwen-max', messages=messages, result_format='message',
+                                           endpoint='scoring', use_cache=use_cache),
+        ['scoring_suggestions'],
+        finalize,
+        lambda error_msg: save_scoring_result(
+            build_scoring_payload(data, get_fallback_suggestion(report_text, scoring_table_text), report_text),
+            data, report_text, scoring_table_text),
+        prepare=prepare
+    )
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
 
-    if analysis_result:
-        # 为了兼容前端，包装返回结果
-        return jsonify({
-            "success": True,
-            "scoring": {
-                "employee_name": data.get('employee_name', '未知员工'),
-                "position": data.get('ability_model', '未知职位'),
-                "quarter": data.get('quarter', '未知季度'),
-                "core_strengths": analysis_result.get('core_strengths', ''),
-                "areas_for_development": analysis_result.get('areas_for_development', ''),
-                "scoring_suggestions": analysis_result.get('scoring_suggestions', []),
-                "abilities": [item.get('ability', '') for item in analysis_result.get('scoring_suggestions', [])]
-            }
-        })
-    else:
-        return jsonify({"error": "Failed to get analysis from LLM and fallback"}), 500
+def attach_scoring_citations(suggestions, report_text, top_k=2):
+    """为每条评分建议检索述职原文中的证据片段，作为评估依据的引用"""
+    queries = []
+    for suggestion in suggestions:
+        parts = [suggestion.get(key) for key in ('ability', 'basis', 'evidence', 'quote')]
+        queries.append(' '.join(part for part in parts if isinstance(part, str)))
+    if not report_text.strip() or not any(queries):
+        return
+    _, evidence = retrieve_evidence(report_text, [query for query in queries if query], top_k=top_k)
+    for suggestion, query in zip(suggestions, queries):
+        suggestion['citations'] = evidence.get(query, [])
+
+def fit_scoring_report(report_text, scoring_table_text, use_cache=True):
+    template = '\n'.join(message['content'] for message in build_scoring_messages('', scoring_table_text))
+    return fit_document_to_budget(report_text, 'qwen-max', template, use_cache)
 
-def call_bailian_for_suggestion(report_text, scoring_table_text):
+def build_scoring_messages(report_text, scoring_table_text):
     """
-    Calls the Alibaba Cloud Bailian LLM to get scoring suggestions.
+    Builds the chat messages for the scoring suggestion prompt.
     """
     system_prompt = """
 # Role: 资深人力资源专家和绩效评估顾问
@@ -917,23 +1471,40 @@ def call_bailian_for_suggestion(report_text, scoring_table_text):
   ]
 }}
 """
-    messages = [
+    return [
         {'role': 'system', 'content': 'You are a helpful assistant.'},
         {'role': 'user', 'content': system_prompt.format(report_text=report_text, scoring_table_text=scoring_table_text)}
     ]
 
+SCORING_SCHEMA = {
+    'scoring_suggestions': (list, REQUIRED),
+    'core_strengths': (str, ''),
+    'areas_for_development': (str, '')
+}
+
+def parse_scoring_response(content):
+    """
+    Parses the scoring suggestion JSON, tolerating code fences, common defects and
+    truncated output; raises json.JSONDecodeError when it cannot be repaired.
+    """
+    return extract_json(content, SCORING_SCHEMA)
+
+def call_bailian_for_suggestion(report_text, scoring_table_text, use_cache=True):
+    """
+    Calls the Alibaba Cloud Bailian LLM to get scoring suggestions.
+    Set use_cache=False to skip the response cache and force a fresh completion.
+    """
+    messages = build_scoring_messages(fit_scoring_report(report_text, scoring_table_text, use_cache), scoring_table_text)
+
     try:
-        response = dashscope.Generation.call(
-            model='qwen-max',
-            messages=messages,
-            result_format='message',
-        )
+        response = LLM_CLIENT.generate('qwen-max', messages=messages, result_format='message', endpoint='scoring', use_cache=use_cache)
         if response.status_code == HTTPStatus.OK:
-            content = response.output.choices[0].message.content
-            # The response might be wrapped in ```json ... ```, so we need to extract it.
-            if content.strip().startswith("```json"):
-                content = content.strip()[7:-3]
-            return json.loads(content)
+            try:
+                return parse_scoring_response(response.text)
+            except json.JSONDecodeError:
+                # Don't keep unparseable completions in the cache.
+                LLM_CACHE.invalidate(response.cache_key)
+                raise
         else:
             print(f"Error from Bailian API: {response.code} - {response.message}")
             return None
@@ -972,11 +1543,9 @@ def get_fallback_suggestion(report_text, scoring_table_text):
         ]
     }
 
-def call_qianwen_for_diagnosis(report_text, employee_name, ability_model, quarter):
-    """
-    调用千问模型进行员工个人诊断分析
-    """
-    prompt = f"""
+def build_diagnosis_prompt(report_text, employee_name, ability_model, quarter):
+    """构造员工个人诊断提示词"""
+    return f"""
 ## 角色
 你是一位资深的人力资源专家和职业发展顾问，具有丰富的员工能力评估和职业发展指导经验。
 
@@ -1054,31 +1623,39 @@ def call_qianwen_for_diagnosis(report_text, employee_name, ability_model, quarte
 5. 严格按照JSON格式输出，不要添加其他文字说明
 """
     
+
+DIAGNOSIS_SCHEMA = {
+    'employee_info': (dict, {}),
+    'abilities': (dict, REQUIRED),
+    'strengths': (list, []),
+    'weaknesses': (list, []),
+    'growth_suggestions': (list, []),
+    'manager_suggestions': (list, [])
+}
+
+def parse_diagnosis_response(response_text):
+    """解析诊断结果JSON（容忍代码块标记、常见格式问题和截断），无法修复时抛出 json.JSONDecodeError"""
+    return extract_json(response_text, DIAGNOSIS_SCHEMA)
+
+def call_qianwen_for_diagnosis(report_text, employee_name, ability_model, quarter, use_cache=True):
+    """
+    调用千问模型进行员工个人诊断分析
+    use_cache=False 时跳过响应缓存强制重新生成
+    """
+    report_text = fit_document_to_budget(
+        report_text, 'qwen-plus', build_diagnosis_prompt('', employee_name, ability_model, quarter), use_cache)
+    prompt = build_diagnosis_prompt(report_text, employee_name, ability_model, quarter)
+    
     try:
-        response = dashscope.Generation.call(
-            model='qwen-plus',
-            prompt=prompt,
-            result_format='text',
-            api_key=DASHSCOPE_API_KEY
-        )
+        response = LLM_CLIENT.generate('qwen-plus', prompt=prompt, endpoint='diagnosis', use_cache=use_cache)
         
         if response.status_code == HTTPStatus.OK:
-            response_text = response.output.text.strip()
+            response_text = response.text.strip()
             # 尝试解析JSON响应
             try:
-                # 提取JSON部分（去除可能的markdown格式）
-                if '```json' in response_text:
-                    json_start = response_text.find('```json') + 7
-                    json_end = response_text.find('```', json_start)
-                    response_text = response_text[json_start:json_end].strip()
-                elif '```' in response_text:
-                    json_start = response_text.find('```') + 3
-                    json_end = response_text.rfind('```')
-                    response_text = response_text[json_start:json_end].strip()
-                
-                diagnosis_data = json.loads(response_text)
-                return diagnosis_data
+                return parse_diagnosis_response(response_text)
             except json.JSONDecodeError as e:
+                LLM_CACHE.invalidate(response.cache_key)
                 print(f"JSON解析错误: {e}")
                 print(f"原始响应: {response_text[:500]}...")
                 return None
@@ -1138,5 +1715,169 @@ def get_fallback_diagnosis(employee_name, ability_model, quarter):
         ]
     }
 
+# ---------- 批量诊断 ----------
+
+def _zip_member_name(info):
+    """取压缩包成员的文件名；未标记UTF-8的成员按GBK解码（Windows压缩的中文文件名）"""
+    name = info.filename
+    if not info.flag_bits & 0x800:
+        try:
+            name = name.encode('cp437').decode('gbk')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return os.path.basename(name.replace('\\', '/'))
+
+def extract_batch_zip(file):
+    """将上传的zip中受支持的文档逐个写入上传存储，返回文档路径列表"""
+    doc_paths = []
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+            # 只保留文件名，丢弃压缩包内的目录结构，防止路径穿越
+            name = _zip_member_name(info)
+            if not name or name.startswith('.') or not document_extractor.is_supported(name):
+                continue
+            with archive.open(info) as src:
+                doc_paths.append(UPLOAD_STORE.store_stream(src, name)['file_path'])
+    return doc_paths
+
+def run_batch_diagnosis(data, progress=None):
+    """批量诊断整组述职文档，返回每位员工的诊断结果"""
+    doc_paths = data.get('doc_paths') or []
+    ability_model = data.get('ability_model', '通用能力模型')
+    quarter = data.get('quarter', '未知季度')
+    use_cache = not data.get('bypass_cache', False)
+    
+    def prepare(doc_path):
+        # 预先解析并写入解析缓存，诊断阶段直接命中
+        _, error = load_diagnosis_document(doc_path)
+        if error:
+            raise ValueError(error[0]['error'])
+    
+    def process(doc_path):
+        # 诊断的并发阶段使用批量专用线程池，不占用交互请求的流水线线程
+        result, status = run_diagnosis({
+            'doc_path': doc_path,
+            'ability_model': ability_model,
+            'quarter': quarter,
+            'bypass_cache': not use_cache
+        }, executor=get_stage_executor())
+        if status >= 400:
+            raise ValueError(result.get('error', f'HTTP {status}'))
+        return result
+    
+    def report(completed, total):
+        if progress:
+            progress(completed / total, f'已完成 {completed}/{total}')
+    
+    outcomes = run_batch(doc_paths, process, prepare=prepare, progress=report)
+    results = []
+    for doc_path, (result, error) in zip(doc_paths, outcomes):
+        item = {'doc_path': doc_path, 'filename': upload_display_name(doc_path), 'success': error is None}
+        if error is None:
+            item['result_id'] = result.get('result_id')
+            item['diagnosis'] = result['diagnosis']
+            item['extracted_info'] = result['extracted_info']
+            if 'note' in result:
+                item['note'] = result['note']
+        else:
+            item['error'] = error
+        results.append(item)
+    
+    succeeded = sum(1 for item in results if item['success'])
+    return {
+        'success': True,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }, 200
+
+# 提交批量诊断：JSON传 doc_paths 列表，或以 multipart 上传包含多份述职文档的zip
+@app.route('/api/batch_diagnosis', methods=['POST'])
+def batch_diagnosis():
+    if 'file' in request.files:
+        file = request.files['file']
+        if not file.filename.lower().endswith('.zip'):
+            return jsonify({'success': False, 'error': '请上传zip压缩包'}), 400
+        try:
+            doc_paths = extract_batch_zip(file)
+        except zipfile.BadZipFile:
+            return jsonify({'success': False, 'error': '压缩包已损坏或格式不正确'}), 400
+        data = request.form.to_dict()
+        data['bypass_cache'] = data.get('bypass_cache', '').lower() in ('1', 'true')
+    else:
+        data = request.get_json() or {}
+        doc_paths = data.get('doc_paths') or []
+    
+    if not doc_paths:
+        return jsonify({'success': False, 'error': '没有可诊断的文档'}), 400
+    
+    job_id = JOB_QUEUE.submit('batch_diagnosis', {
+        'doc_paths': doc_paths,
+        'ability_model': data.get('ability_model', '通用能力模型'),
+        'quarter': data.get('quarter', '未知季度'),
+        'bypass_cache': bool(data.get('bypass_cache', False)),
+        'requested_by': current_user()
+    })
+    return jsonify({'success': True, 'job_id': job_id, 'total': len(doc_paths)}), 202
+
+# ---------- 后台任务 ----------
+
+def _job_handler(run):
+    """将 run_xxx(data, progress) 包装为任务处理函数，错误状态码视为任务失败；任务中的大模型调用计入提交者的限流队列"""
+    def handler(payload, progress):
+        with user_context(payload.get('requested_by')):
+            result, status = run(payload, progress)
+        if status >= 400:
+            raise ValueError(result.get('error', f'HTTP {status}'))
+        return result
+    return handler
+
+JOB_QUEUE.register('verify', _job_handler(run_verify), lane='interactive')
+JOB_QUEUE.register('generate_diagnosis', _job_handler(run_diagnosis), lane='bulk')
+JOB_QUEUE.register('generate_scoring_suggestion', _job_handler(run_scoring_suggestion), lane='bulk')
+JOB_QUEUE.register('batch_diagnosis', _job_handler(run_batch_diagnosis), lane='bulk')
+JOB_QUEUE.register('transcribe', _job_handler(run_transcription), lane='bulk')
+
+# 提交后台任务，立即返回任务ID
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    data = request.get_json() or {}
+    try:
+        payload = dict(data.get('payload') or {}, requested_by=current_user())
+        job_id = JOB_QUEUE.submit(data.get('type'), payload, lane=data.get('lane'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+# 任务队列深度
+@app.route('/api/jobs/stats', methods=['GET'])
+def job_stats():
+    return jsonify({'success': True, 'stats': JOB_QUEUE.stats()}), 200
+
+# 查询任务状态、进度和结果
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = JOB_QUEUE.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job}), 200
+
+def start_background_workers():
+    """
+    启动后台线程（上传目录清理、任务队列工作线程与心跳）
+
+    导入模块时不启动，只在实际处理请求的进程中调用一次：
+    开发服务器见下方 __main__；gunicorn 等多进程部署在 post_worker_init 钩子中调用。
+    """
+    UPLOAD_JANITOR.start()
+    JOB_QUEUE.start()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    debug = True
+    # debug 模式下重载器的父进程只监控文件变化，后台线程只在实际服务的子进程中启动
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
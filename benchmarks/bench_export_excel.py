@@ -0,0 +1,106 @@
+"""
+评分结果Excel导出基准
+在临时结果库中写入 N 条打分建议明细（默认10000行，每位员工5项），分别用
+- stream: 流式XLSX（modules.xlsx_stream，与 /api/export_scoring_excel 相同的生成路径）
+- openpyxl: 常规 openpyxl 工作簿整体构建后保存到内存
+导出全部行，报告耗时、输出大小与进程峰值RSS。每种方式在独立子进程中运行，峰值RSS互不影响。
+
+    python benchmarks/bench_export_excel.py [行数]
+"""
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUGGESTIONS_PER_EMPLOYEE = 5
+
+
+def build_store(db_path, rows):
+    from modules.results_store import ResultStore
+    store = ResultStore(db_path)
+    for employee in range(rows // SUGGESTIONS_PER_EMPLOYEE):
+        payload = {'scoring': {
+            'employee_name': f'员工{employee:05d}',
+            'position': '研发工程师',
+            'quarter': '2025年第一季度',
+            'core_strengths': '技术创新能力突出，项目交付质量高，团队协作意识强' * 2,
+            'areas_for_development': '战略思维和前瞻性规划需要加强，跨部门沟通协调能力有待提升' * 2,
+            'scoring_suggestions': [{
+                'ability': f'能力项{n}',
+                'score': (employee + n) % 5 + 1,
+                'basis': '报告中明确提到独立设计并实现了核心算法优化方案，系统性能提升40%，获得公司技术创新奖' * 3,
+                'suggestion': '建议将技术创新经验进行系统化总结，通过内部技术分享会带动团队整体技术水平提升' * 3
+            } for n in range(SUGGESTIONS_PER_EMPLOYEE)]
+        }}
+        store.save('scoring_suggestion', f'key{employee}', payload, employee=payload['scoring']['employee_name'],
+                   quarter='2025年第一季度', ability_model='研发工程师')
+
+
+def run(mode, db_path):
+    from modules.results_store import ResultStore
+    from modules.xlsx_stream import Sheet, stream_xlsx
+    from app_backup import (iter_scoring_export_rows, iter_scoring_summary_rows, SCORING_EXPORT_HEADER,
+                            SCORING_EXPORT_WIDTHS, SCORING_SUMMARY_HEADER, SCORING_SUMMARY_WIDTHS)
+    store = ResultStore(db_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    size = rows = 0
+    if mode == 'stream':
+        def counted(iterable):
+            nonlocal rows
+            for row in iterable:
+                rows += 1
+                yield row
+        sheets = [
+            Sheet('评分明细', SCORING_EXPORT_HEADER,
+                  counted(iter_scoring_export_rows(store.iter_results(kind='scoring_suggestion'))),
+                  SCORING_EXPORT_WIDTHS),
+            Sheet('综合评价', SCORING_SUMMARY_HEADER,
+                  iter_scoring_summary_rows(store.iter_results(kind='scoring_suggestion')), SCORING_SUMMARY_WIDTHS)
+        ]
+        for chunk in stream_xlsx(sheets):
+            size += len(chunk)
+    else:
+        from io import BytesIO
+        import openpyxl
+        wb = openpyxl.Workbook()
+        detail = wb.active
+        detail.title = '评分明细'
+        detail.append(SCORING_EXPORT_HEADER)
+        results = list(store.iter_results(kind='scoring_suggestion'))
+        for row in iter_scoring_export_rows(results):
+            detail.append(row)
+            rows += 1
+        summary = wb.create_sheet('综合评价')
+        summary.append(SCORING_SUMMARY_HEADER)
+        for row in iter_scoring_summary_rows(results):
+            summary.append(row)
+        buffer = BytesIO()
+        wb.save(buffer)
+        size = buffer.tell()
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'mode': mode, 'rows': rows, 'seconds': round(elapsed, 2), 'bytes': size,
+                      'peak_rss_mb': round(peak / 1024, 1), 'export_rss_mb': round((peak - baseline) / 1024, 1)}))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'results.db')
+        build_store(db_path, rows)
+        for mode in ('stream', 'openpyxl'):
+            subprocess.run([sys.executable, __file__, '--run', mode, db_path], check=True,
+                           cwd=tmp, env=dict(os.environ, UPLOAD_JANITOR_INTERVAL='0'))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        run(sys.argv[2], sys.argv[3])
+    else:
+        main()
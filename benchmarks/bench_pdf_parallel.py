@@ -0,0 +1,74 @@
+"""
+PDF并行抽取基准
+用 reportlab 生成若干页数的文本PDF（每页60行），分别用
+- serial: 当前进程逐页抽取（modules.pdf_parallel.iter_pdf_pages，workers=1）
+- parallel-N: N 个工作进程按页码分片并行抽取（进程池已预热，与服务中复用常驻进程池的情况一致）
+抽取全部页，报告耗时（取多次运行的中位数）并校验与串行结果一致。每种方式在独立子进程中运行。
+并行的收益取决于可用CPU核数，输出中的 cpus 为本机可用核数；单核机器上只能看到分发开销。
+
+    python benchmarks/bench_pdf_parallel.py [页数,...] [进程数,...]
+    python benchmarks/bench_pdf_parallel.py 10,50,200 2,4
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LINES_PER_PAGE = 60
+REPEAT = 3
+
+
+def build_pdf(path, pages):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(pages):
+        y = 800
+        for line in range(LINES_PER_PAGE):
+            pdf.drawString(40, y, f'Page {page} line {line}: quarterly results, teamwork, '
+                                  f'delivered project milestones 95% on time')
+            y -= 13
+        pdf.showPage()
+    pdf.save()
+
+
+def run(mode, path):
+    from modules.pdf_parallel import iter_pdf_pages
+    workers = 1 if mode == 'serial' else int(mode.split('-')[1])
+
+    def extract():
+        return list(iter_pdf_pages(path, workers=workers, min_pages=1))
+
+    extract()  # 预热进程池（以及PDF文件的页缓存）
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        pages = extract()
+        timings.append(time.perf_counter() - started)
+    print(json.dumps({'mode': mode, 'pages': len(pages), 'cpus': len(os.sched_getaffinity(0)),
+                      'seconds': round(statistics.median(timings), 3),
+                      'sha256': hashlib.sha256('\f'.join(pages).encode('utf-8')).hexdigest()[:16]}))
+
+
+def main():
+    page_counts = [int(n) for n in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10, 50, 200]
+    worker_counts = [int(n) for n in sys.argv[2].split(',')] if len(sys.argv) > 2 else [2, 4]
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = os.path.join(tmp, f'{pages}.pdf')
+            build_pdf(path, pages)
+            for mode in ['serial'] + [f'parallel-{workers}' for workers in worker_counts]:
+                subprocess.run([sys.executable, __file__, '--run', mode, path], check=True, cwd=tmp)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        run(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,3 @@
+"""
+智能述职Agent系统 - 核心业务模块
+"""
@@ -0,0 +1,558 @@
+"""
+流式录音接入
+上传请求体边到达边处理，不等整个文件落盘、也不一次性解码整段录音：
+- 解码：PCM/浮点 WAV 增量解析 RIFF 块直接转换；MP3/M4A 等交给 ffmpeg 子进程（标准输入喂数据，标准输出取 PCM）
+- 重采样为 16kHz 单声道 int16，写入内存映射的环形缓冲区（临时文件），按 30ms 帧计算能量
+- 语音活动检测与分段：静音阈值按已收到的帧滚动估计，分段一确定就从缓冲区取出提交转写，随即释放缓冲区
+内存占用只与缓冲区和尚未转写完的分段有关，与录音时长无关；上传结束时大部分分段已在转写。
+
+    ingest = AudioIngest('mp3', buffer_dir=tmp_dir)
+    for block in request_body: ingest.feed(block)
+    ingest.finish()              # 返回时长、语音段等摘要
+    transcript = ingest.result() # 等待全部分段转写完成
+"""
+import os
+import time
+import struct
+import tempfile
+import threading
+import subprocess
+from array import array
+
+import numpy as np
+
+from modules import transcription
+from modules.transcription import SAMPLE_RATE, FRAME_MS
+
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# 环形缓冲区容量（秒）：需容纳一个最长分段和一次写入的数据
+AUDIO_RING_SECONDS = float(os.getenv('AUDIO_RING_SECONDS', transcription.TRANSCRIBE_MAX_CHUNK_SECONDS + 10))
+
+# 滚动估计静音阈值时参考最近若干帧（默认10分钟），每隔若干帧重新估计一次
+THRESHOLD_HISTORY_FRAMES = 20000
+THRESHOLD_REFRESH_FRAMES = 100
+
+# 解码后的采样按不超过1秒的片段写入缓冲区
+PUSH_SAMPLES = SAMPLE_RATE
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+# 上传时登记的转写超过该时长（秒）仍未被转写任务取走则视为放弃，取消并释放
+AUDIO_PENDING_TTL = float(os.getenv('AUDIO_PENDING_TTL', 3600))
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class PcmRing:
+    """
+    内存映射的 int16 环形缓冲区
+
+    按绝对采样位置读写：written 为已写入的采样数，released 之前的位置可被覆盖。
+    缓冲文件放在上传临时目录（.part 后缀，进程中断遗留的由上传存储的过期清理删除）。
+    """
+
+    def __init__(self, capacity, directory=None):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='pcm-', suffix='.part')
+        os.close(fd)
+        self.capacity = capacity
+        self._map = np.memmap(self.path, dtype='<i2', mode='w+', shape=(capacity,))
+        self.written = 0
+        self.released = 0
+
+    def write(self, samples):
+        count = len(samples)
+        if self.written + count - self.released > self.capacity:
+            raise BufferError('PCM缓冲区已满')
+        position = self.written % self.capacity
+        first = min(count, self.capacity - position)
+        self._map[position:position + first] = samples[:first]
+        if first < count:
+            self._map[:count - first] = samples[first:]
+        self.written += count
+
+    def read(self, start, end):
+        """复制出 [start, end) 的采样"""
+        if start < self.released or end > self.written or start > end:
+            raise IndexError(f'读取范围 [{start}, {end}) 不在缓冲区内')
+        position = start % self.capacity
+        count = end - start
+        first = min(count, self.capacity - position)
+        if first == count:
+            return np.array(self._map[position:position + count])
+        return np.concatenate((self._map[position:], self._map[:count - first]))
+
+    def release(self, position):
+        self.released = max(self.released, position)
+
+    def close(self):
+        if self._map is not None:
+            self._map = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class StreamResampler:
+    """分块线性插值重采样，块与块之间保留滤波与插值所需的尾部采样，结果与整段处理（transcription.resample）一致"""
+
+    def __init__(self, rate, target_rate):
+        self.rate = rate
+        self.target_rate = target_rate
+        self.step = rate / target_rate
+        # 降采样前做滑动平均抑制混叠（与 transcription.resample 相同）
+        self.width = max(1, int(round(self.step))) if rate > target_rate else 1
+        self._kernel = np.full(self.width, 1.0 / self.width, dtype=np.float32)
+        self._history = np.zeros(0, dtype=np.float32)
+        self._previous = None
+        self._base = 0
+        # 滤波结果的第 j 个采样对应原始位置 j + (width - 1) / 2，输出位置相应前移
+        self._next = -(self.width - 1) / 2
+
+    def process(self, samples):
+        if self.rate == self.target_rate:
+            return samples
+        if self.width > 1:
+            joined = np.concatenate((self._history, samples))
+            filtered = np.convolve(joined, self._kernel, mode='valid') if len(joined) >= self.width \
+                else np.zeros(0, dtype=np.float32)
+            self._history = joined[len(joined) - min(len(joined), self.width - 1):]
+        else:
+            filtered = samples
+        if self._previous is not None:
+            window, start = np.concatenate(([self._previous], filtered)), self._base - 1
+        else:
+            window, start = filtered, self._base
+        end = self._base + len(filtered)
+        if len(filtered):
+            self._previous = filtered[-1]
+        self._base = end
+        if end == 0 or self._next > end - 1:
+            return np.zeros(0, dtype=np.float32)
+        count = int((end - 1 - self._next) // self.step) + 1
+        positions = self._next + np.arange(count) * self.step
+        self._next += count * self.step
+        return np.interp(positions - start, np.arange(len(window)), window).astype(np.float32)
+
+
+class WavStreamDecoder:
+    """增量解析 WAV：读到 fmt 与 data 块头后，data 块内容按整帧转换为 16kHz 单声道 PCM 交给 sink"""
+
+    def __init__(self, sink):
+        self._sink = sink
+        self._buffer = bytearray()
+        self._remaining = None
+        self._format = None
+        self._resampler = None
+
+    def feed(self, data):
+        self._buffer += data
+        if self._remaining is None and not self._parse_header():
+            return
+        block_align = self._format['block_align']
+        usable = min(len(self._buffer), self._remaining) // block_align * block_align
+        if not usable:
+            return
+        raw = bytes(self._buffer[:usable])
+        del self._buffer[:usable]
+        self._remaining -= usable
+        samples = transcription.pcm_to_float(raw, self._format['width'], self._format['channels'],
+                                             self._format['is_float'])
+        self._sink(transcription.to_pcm16(self._resampler.process(samples)))
+
+    def _parse_header(self):
+        """解析到 data 块为止，数据不足时返回False等待更多数据"""
+        if len(self._buffer) < 12:
+            return False
+        if self._buffer[:4] not in (b'RIFF', b'RF64') or self._buffer[8:12] != b'WAVE':
+            raise ValueError('不是有效的WAV文件')
+        offset = 12
+        while len(self._buffer) >= offset + 8:
+            chunk_id = bytes(self._buffer[offset:offset + 4])
+            size = struct.unpack('<I', self._buffer[offset + 4:offset + 8])[0]
+            if chunk_id == b'data':
+                if self._format is None:
+                    raise ValueError('WAV文件缺少fmt块')
+                del self._buffer[:offset + 8]
+                # 边录边写的文件 data 块长度可能为0或占位值，按读到文件末尾处理
+                self._remaining = size if size not in (0, 0xFFFFFFFF) else float('inf')
+                return True
+            end = offset + 8 + size + (size & 1)
+            if chunk_id == b'fmt ':
+                if len(self._buffer) < offset + 8 + size:
+                    return False
+                self._format = self._parse_format(bytes(self._buffer[offset + 8:offset + 8 + size]))
+            elif len(self._buffer) < end:
+                return False
+            offset = end
+        return False
+
+    def _parse_format(self, body):
+        audio_format, channels, rate, _, block_align, bits = struct.unpack('<HHIIHH', body[:16])
+        if audio_format == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+            audio_format = struct.unpack('<H', body[24:26])[0]
+        width = (bits + 7) // 8
+        is_float = audio_format == _WAVE_FORMAT_FLOAT and width == 4
+        if not is_float and (audio_format != _WAVE_FORMAT_PCM or width not in (1, 2, 3, 4)):
+            raise ValueError(f'不支持的WAV编码: format={audio_format}, bits={bits}')
+        if not channels or block_align != width * channels:
+            raise ValueError('WAV格式信息不一致')
+        self._resampler = StreamResampler(rate, SAMPLE_RATE)
+        return {'channels': channels, 'rate': rate, 'width': width, 'block_align': block_align,
+                'is_float': is_float}
+
+    def close(self):
+        if self._remaining is None:
+            raise ValueError('WAV文件不完整')
+
+    def abort(self):
+        self._buffer.clear()
+
+
+class FfmpegStreamDecoder:
+    """
+    ffmpeg 子进程解码：feed() 写入标准输入，读线程从标准输出取 16kHz 单声道 PCM 交给 sink；
+    给出 path 时由 ffmpeg 直接读取文件（可定位，适合 moov 在文件末尾的 M4A）
+    """
+
+    def __init__(self, sink, path=None):
+        self._sink = sink
+        self.error = None
+        command = [transcription.AUDIO_FFMPEG, '-v', 'error', '-i', path or 'pipe:0',
+                   '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1']
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL if path else subprocess.PIPE,
+                                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise ValueError('解码该格式需要 ffmpeg（可通过 AUDIO_FFMPEG 指定路径）')
+        self._stderr = b''
+        self._stderr_reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_reader.start()
+        self._reader = threading.Thread(target=self._read, name='audio-ingest-ffmpeg', daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        carry = b''
+        try:
+            while True:
+                block = self._process.stdout.read1(64 * 1024)
+                if not block:
+                    break
+                block = carry + block
+                usable = len(block) & ~1
+                carry = block[usable:]
+                if usable:
+                    self._sink(np.frombuffer(block[:usable], dtype='<i2'))
+        except Exception as e:
+            self.error = str(e)
+            self._process.kill()
+
+    def _read_stderr(self):
+        self._stderr = self._process.stderr.read()
+
+    def feed(self, data):
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg 已退出，错误信息在 close() 中给出
+            pass
+
+    def close(self):
+        if self._process.stdin:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self._reader.join()
+        self._stderr_reader.join()
+        code = self._process.wait()
+        if self.error:
+            raise ValueError(self.error)
+        if code != 0:
+            raise ValueError(f'音频解码失败: {self._stderr.decode("utf-8", "replace").strip()}')
+
+    def abort(self):
+        self._process.kill()
+        self._reader.join()
+        self._stderr_reader.join()
+        self._process.wait()
+
+
+class StreamingSegmenter:
+    """
+    逐帧的语音活动检测与分段
+
+    切分规则与 transcription.split_on_silence 相同（达到目标时长后在足够长的静音处切分，
+    到上限时在最安静处切分），静音阈值按最近的帧滚动估计。
+    push() 返回新确定的分段 [(起始帧, 结束帧, 是否含语音)]；speech 为语音段 [(起始帧, 结束帧)]。
+    """
+
+    def __init__(self, target_frames, max_frames, min_silence_frames):
+        self.target_frames = target_frames
+        self.max_frames = max(target_frames, max_frames)
+        self.min_silence_frames = min_silence_frames
+        self.energy = array('f')
+        self.voiced = bytearray()
+        self.speech = []
+        self.threshold = None
+        self._chunk_start = 0
+        self._chunk_voiced = 0
+        self._silence_run = 0
+        self._speech_start = None
+
+    @property
+    def frames(self):
+        return len(self.energy)
+
+    def _refresh_threshold(self):
+        count = len(self.energy)
+        if self.threshold is None or count <= THRESHOLD_REFRESH_FRAMES or count % THRESHOLD_REFRESH_FRAMES == 0:
+            history = np.frombuffer(self.energy, dtype=np.float32)[-THRESHOLD_HISTORY_FRAMES:]
+            self.threshold = transcription.silence_threshold(history)
+
+    def push(self, energies):
+        cuts = []
+        for energy in energies:
+            self.energy.append(float(energy))
+            self._refresh_threshold()
+            voiced = bool(energy >= self.threshold)
+            self.voiced.append(voiced)
+            count = len(self.energy)
+            if voiced:
+                self._silence_run = 0
+                self._chunk_voiced += 1
+                if self._speech_start is None:
+                    self._speech_start = count - 1
+            else:
+                self._silence_run += 1
+                if self._speech_start is not None and self._silence_run >= self.min_silence_frames:
+                    self.speech.append((self._speech_start, count - self._silence_run))
+                    self._speech_start = None
+
+            length = count - self._chunk_start
+            cut = None
+            if length >= self.target_frames and self._silence_run >= self.min_silence_frames:
+                cut = max(self._chunk_start + 1, count - self._silence_run // 2)
+            elif length >= self.max_frames:
+                window = np.frombuffer(self.energy, dtype=np.float32)[self._chunk_start + self.target_frames:count]
+                cut = self._chunk_start + self.target_frames + int(np.argmin(window)) if len(window) else count
+            if cut is not None:
+                cuts.append(self._cut(cut))
+        return cuts
+
+    def _cut(self, cut):
+        tail_voiced = sum(self.voiced[cut:])
+        chunk = (self._chunk_start, cut, self._chunk_voiced - tail_voiced > 0)
+        self._chunk_start = cut
+        self._chunk_voiced = tail_voiced
+        self._silence_run = min(self._silence_run, len(self.energy) - cut)
+        return chunk
+
+    def finish(self):
+        """输入结束：返回最后一个分段（无剩余帧时为None），并结束进行中的语音段"""
+        count = len(self.energy)
+        if self._speech_start is not None:
+            self.speech.append((self._speech_start, count - self._silence_run))
+            self._speech_start = None
+        if count <= self._chunk_start:
+            return None
+        return self._cut(count)
+
+
+class AudioIngest:
+    """
+    流式录音接入（见模块说明）
+
+    可作为上传临时文件的监听器：feed() 接收请求体分块，abort() 在上传失败时释放资源。
+    解码失败时记录 error，不影响文件本身的上传，转写时改为读取完整文件。
+    """
+
+    def __init__(self, extension, backend=None, transcribe=True, buffer_dir=None, path=None):
+        self.extension = extension.lower().lstrip('.')
+        self.backend = backend or transcription.TRANSCRIBE_BACKEND
+        self.transcribe = transcribe
+        self.error = None
+        self.submitted = []
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._partial = np.zeros(0, dtype=np.int16)
+        self._chunk_offset = 0
+        self._segmenter = StreamingSegmenter(
+            target_frames=int(transcription.TRANSCRIBE_CHUNK_SECONDS * 1000 / FRAME_MS),
+            max_frames=int(transcription.TRANSCRIBE_MAX_CHUNK_SECONDS * 1000 / FRAME_MS),
+            min_silence_frames=max(1, transcription.TRANSCRIBE_MIN_SILENCE_MS // FRAME_MS)
+        )
+        self._ring = PcmRing(int(max(AUDIO_RING_SECONDS, transcription.TRANSCRIBE_MAX_CHUNK_SECONDS + 2)
+                                 * SAMPLE_RATE), buffer_dir)
+        try:
+            if self.extension == 'wav':
+                self._decoder = WavStreamDecoder(self._push)
+            else:
+                self._decoder = FfmpegStreamDecoder(self._push, path=path)
+        except ValueError as e:
+            self._decoder = None
+            self._fail(e)
+
+    @property
+    def samples(self):
+        return self._ring.written
+
+    def feed(self, data):
+        if self._decoder is None or self._finished.is_set():
+            return
+        try:
+            self._decoder.feed(data)
+        except Exception as e:
+            self._fail(e)
+
+    def _push(self, samples):
+        """解码得到的 PCM：写入缓冲区，整帧计算能量并分段（ffmpeg 解码时在读线程中调用）"""
+        with self._lock:
+            if self.error:
+                return
+            for start in range(0, len(samples), PUSH_SAMPLES):
+                piece = samples[start:start + PUSH_SAMPLES]
+                self._ring.write(piece)
+                frames = np.concatenate((self._partial, piece))
+                count = len(frames) // FRAME_SAMPLES
+                self._partial = frames[count * FRAME_SAMPLES:]
+                if not count:
+                    continue
+                blocks = frames[:count * FRAME_SAMPLES].astype(np.float32).reshape(count, FRAME_SAMPLES) / 32768
+                energies = 10 * np.log10(np.mean(blocks * blocks, axis=1) + 1e-10)
+                for chunk in self._segmenter.push(energies):
+                    self._emit(*chunk)
+
+    def _emit(self, start_frame, end_frame, voiced, end_sample=None):
+        start = start_frame * FRAME_SAMPLES
+        end = end_sample if end_sample is not None else end_frame * FRAME_SAMPLES
+        if self.transcribe and voiced:
+            job = (self.backend, start / SAMPLE_RATE, self._ring.read(start, end), SAMPLE_RATE)
+            entry = [job, transcription.submit_chunk(job)]
+            entry[1].add_done_callback(_drop_samples(entry))
+            self.submitted.append(entry)
+        self._ring.release(end)
+
+    def _fail(self, error):
+        self.error = str(error) or error.__class__.__name__
+        for _, future in self.submitted:
+            future.cancel()
+        self._ring.close()
+
+    def finish(self):
+        """输入结束：冲刷解码器，最后一个分段提交转写，返回接入摘要"""
+        if self._finished.is_set():
+            return self.summary()
+        try:
+            if self._decoder is not None and not self.error:
+                self._decoder.close()
+            with self._lock:
+                if not self.error:
+                    chunk = self._segmenter.finish()
+                    if chunk:
+                        # 最后一段包含不足一帧的尾部采样
+                        self._emit(*chunk, end_sample=self._ring.written)
+                    self._ring.close()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._finished.set()
+        return self.summary()
+
+    def abort(self):
+        """上传失败或被丢弃：停止解码、取消未开始的转写"""
+        if self._finished.is_set():
+            return
+        if self._decoder is not None:
+            self._decoder.abort()
+        with self._lock:
+            self._fail(RuntimeError('录音接入已取消'))
+        self._finished.set()
+
+    def cancel(self):
+        """不再需要转写结果（已有缓存、转写任务未执行）：停止解码，取消尚未开始的分段"""
+        self.abort()
+        with self._lock:
+            for _, future in self.submitted:
+                future.cancel()
+
+    def summary(self):
+        frame_seconds = FRAME_MS / 1000
+        speech = self._segmenter.speech
+        return {
+            'duration': round(self.samples / SAMPLE_RATE, 2),
+            'sample_rate': SAMPLE_RATE,
+            'speech_segments': len(speech),
+            'speech_seconds': round(sum(end - start for start, end in speech) * frame_seconds, 2),
+            'chunks': len(self.submitted),
+            'error': self.error
+        }
+
+    def speech_segments(self):
+        """语音段 [{'start': 秒, 'end': 秒}]"""
+        frame_seconds = FRAME_MS / 1000
+        return [{'start': round(start * frame_seconds, 2), 'end': round(end * frame_seconds, 2)}
+                for start, end in self._segmenter.speech]
+
+    def result(self, progress=None):
+        """等待输入结束与全部分段转写完成，返回转写结果（格式同 transcription.transcribe_samples）"""
+        self._finished.wait()
+        if self.error:
+            raise ValueError(self.error)
+        results = transcription.collect_chunks(self.submitted, progress)
+        return transcription.build_transcript(results, self.samples / SAMPLE_RATE, self.backend)
+
+
+def _drop_samples(entry):
+    """分段转写成功后释放其采样（只有进程池异常需要重试时才用得到），内存只与未完成的分段有关"""
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            entry[0] = None
+    return callback
+
+
+def ingest_file(path, backend=None, progress=None, buffer_dir=None):
+    """按块读取录音文件流式转写；非 WAV 格式由 ffmpeg 直接读取文件"""
+    ingest = AudioIngest(os.path.splitext(path)[1], backend=backend, path=path, buffer_dir=buffer_dir)
+    if ingest.extension == 'wav':
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(READ_BLOCK_SIZE), b''):
+                ingest.feed(block)
+                if ingest.error:
+                    break
+    ingest.finish()
+    return ingest.result(progress)
+
+
+# 上传过程中已开始转写的录音，按内容ID登记，转写任务取走后等待结果；内容ID -> (接入, 登记时间)
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def register_pending(content_id, ingest):
+    """登记上传时已开始的转写；同时清理超过 AUDIO_PENDING_TTL 未被取走的登记"""
+    now = time.monotonic()
+    with _pending_lock:
+        stale = [content_id] if content_id in _pending else []
+        stale += [key for key, (_, registered) in _pending.items()
+                  if key != content_id and now - registered > AUDIO_PENDING_TTL]
+        dropped = [_pending.pop(key)[0] for key in stale]
+        _pending[content_id] = (ingest, now)
+    for old in dropped:
+        old.cancel()
+
+
+def take_pending(content_id):
+    with _pending_lock:
+        entry = _pending.pop(content_id, None)
+    return entry[0] if entry else None
+
+
+def discard_pending(content_id):
+    """转写任务未执行（如参数校验失败）时取消登记的转写"""
+    ingest = take_pending(content_id)
+    if ingest is not None:
+        ingest.cancel()
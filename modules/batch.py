@@ -0,0 +1,117 @@
+"""
+批量任务执行
+一次处理整组文档：解析阶段在独立线程池中并行预热解析缓存，
+大模型阶段按并发上限和QPS限制调度，尽量用满配额而不超出。
+单个条目失败只记录错误，不影响其他条目。
+"""
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))
+BATCH_PARSE_WORKERS = int(os.getenv('BATCH_PARSE_WORKERS', 4))
+BATCH_QPS = float(os.getenv('BATCH_QPS', 0))  # 0 表示不限制
+# 每个条目内部的流水线阶段（如信息抽取与诊断并发）使用的线程数
+BATCH_STAGE_WORKERS = int(os.getenv('BATCH_STAGE_WORKERS', BATCH_CONCURRENCY * 2))
+
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+
+def get_stage_executor():
+    """
+    批量条目内部流水线阶段的线程池
+
+    条目的处理函数通常本身是一条多阶段流水线；阶段若提交到全局共享的流水线线程池，
+    每个条目占用多个线程，实际并发会远低于 BATCH_CONCURRENCY，并挤占交互请求的线程。
+    """
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(max_workers=BATCH_STAGE_WORKERS, thread_name_prefix='batch-stage')
+        return _stage_executor
+
+
+class Throttle:
+    """按固定最小间隔放行，使启动速率不超过 qps"""
+
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps and qps > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_batch(items, process, prepare=None, concurrency=None, parse_workers=None, qps=None, progress=None):
+    """
+    批量执行，返回与 items 顺序一致的 [(结果, 错误信息)]
+
+    prepare(item) 为可选的预处理（如解析文档），在解析线程池中执行，抛出异常则该条目失败；
+    process(item) 在大模型线程池中执行，同时运行的条目数不超过 concurrency，
+    启动速率不超过 qps；progress(已完成数, 总数) 在每个条目结束时调用。
+    """
+    items = list(items)
+    total = len(items)
+    outcomes = [None] * total
+    if not total:
+        return outcomes
+
+    concurrency = concurrency or BATCH_CONCURRENCY
+    parse_workers = parse_workers or BATCH_PARSE_WORKERS
+    throttle = Throttle(BATCH_QPS if qps is None else qps)
+    done_lock = threading.Lock()
+    done_count = [0]
+
+    def finish(index, result, error):
+        outcomes[index] = (result, error)
+        with done_lock:
+            done_count[0] += 1
+            completed = done_count[0]
+        if progress:
+            progress(completed, total)
+
+    def run_one(index):
+        throttle.wait()
+        try:
+            result = process(items[index])
+        except Exception as e:
+            finish(index, None, str(e))
+            return
+        finish(index, result, None)
+
+    # 工作线程中沿用提交者的上下文（如限流用的当前用户）
+    context = contextvars.copy_context()
+
+    def in_context(func, *args):
+        return context.copy().run(func, *args)
+
+    with ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix='batch-parse') as parse_pool, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-llm') as llm_pool:
+        if prepare is None:
+            futures = [llm_pool.submit(in_context, run_one, index) for index in range(total)]
+        else:
+            # 先解析完的条目先进入大模型阶段，解析与大模型调用流水并行
+            parse_futures = {parse_pool.submit(in_context, prepare, item): index for index, item in enumerate(items)}
+            futures = []
+            for future in as_completed(parse_futures):
+                index = parse_futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    finish(index, None, str(e))
+                    continue
+                futures.append(llm_pool.submit(in_context, run_one, index))
+        for future in futures:
+            future.result()
+    return outcomes
@@ -0,0 +1,154 @@
+"""
+长文档分块与 map-reduce 压缩
+- estimate_tokens: 离线估算token数（中文约每字1个token，其余字符约每3.5个字符1个token），
+  不依赖分词器和网络，用于判断文本是否超出模型上下文预算
+- chunk_text: 按token预算分块，优先在章节/幻灯片边界（空行）处切分，其次按行、按句，最后才硬切
+- map_reduce: 各分块并发调用摘要函数（map），摘要拼接后仍超出预算时继续逐层压缩（reduce）
+"""
+import os
+import re
+import math
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+MAP_REDUCE_WORKERS = int(os.getenv('MAP_REDUCE_WORKERS', 4))
+
+# 各模型的上下文长度（token），未列出的模型按最小值处理
+MODEL_CONTEXT_TOKENS = {
+    'qwen-turbo': 131072,
+    'qwen-plus': 131072,
+    'qwen-max': 32768
+}
+DEFAULT_CONTEXT_TOKENS = 32768
+
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_WHITESPACE = re.compile(r'\s')
+_SECTION_BREAK = re.compile(r'\n[ \t]*\n+')
+_SENTENCE_END = re.compile(r'(?<=[。！？；!?;])|(?<=\.)\s')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """map 阶段专用线程池，与流水线线程池分开，避免在流水线阶段内提交任务时互相等待"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAP_REDUCE_WORKERS, thread_name_prefix='map-reduce')
+        return _executor
+
+
+def estimate_tokens(text):
+    """估算文本的token数（偏保守）"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    spaces = len(_WHITESPACE.findall(text))
+    other = len(text) - cjk - spaces
+    return cjk + math.ceil(max(other, 0) / 3.5)
+
+
+def context_budget(model, template_tokens=0, reserve_tokens=2000):
+    """模型上下文中可留给文档正文的token数：上下文长度 - 提示词模板 - 输出预留"""
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    return max(context - template_tokens - reserve_tokens, 0)
+
+
+def _split_by_length(text, max_tokens):
+    """按估算长度硬切（单句超出预算时的兜底）"""
+    pieces = []
+    start = 0
+    step = max(max_tokens // 4, 1)
+    while start < len(text):
+        # 按最坏情况（全部为中文）取 max_tokens 个字符，再按实际估算向后扩展
+        end = min(start + max_tokens, len(text))
+        while end < len(text) and estimate_tokens(text[start:min(end + step, len(text))]) <= max_tokens:
+            end = min(end + step, len(text))
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+def _split_unit(text, max_tokens):
+    """把超出预算的章节逐级切成不超出预算的小段：行 -> 句 -> 硬切"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    for splitter in (lambda t: t.split('\n'), lambda t: _SENTENCE_END.split(t)):
+        parts = [part for part in splitter(text) if part and part.strip()]
+        if len(parts) > 1:
+            units = []
+            for part in parts:
+                units.extend(_split_unit(part, max_tokens))
+            return units
+    return _split_by_length(text, max_tokens)
+
+
+def chunk_text(text, max_tokens, overlap_sections=0):
+    """
+    按token预算分块
+
+    先按空行切成章节（文档抽取时各页/各张幻灯片之间以空行分隔），
+    贪心地把相邻章节装入同一块；单个章节超出预算时再按行、按句切分。
+    overlap_sections > 0 时，每块开头重复上一块末尾的若干章节以保留上下文。
+    """
+    if max_tokens <= 0:
+        raise ValueError('max_tokens 必须大于0')
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text.strip() else []
+
+    units = []
+    for section in _SECTION_BREAK.split(text):
+        if section.strip():
+            units.extend(_split_unit(section.strip('\n'), max_tokens))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        tokens = estimate_tokens(unit)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current = current[-overlap_sections:] if overlap_sections else []
+            current_tokens = sum(estimate_tokens(item) for item in current)
+            # 重叠部分放不下新章节时放弃重叠
+            if current_tokens + tokens > max_tokens:
+                current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def map_reduce(text, summarize, budget_tokens, chunk_tokens, max_rounds=3):
+    """
+    将超出预算的文本压缩到预算以内
+
+    summarize(chunk, index, total) 返回该分块的摘要文本，失败时返回None（保留原文截断部分）。
+    文本本身不超出预算时原样返回。返回 (压缩后的文本, 轮数)。
+    """
+    rounds = 0
+    while estimate_tokens(text) > budget_tokens and rounds < max_rounds:
+        rounds += 1
+        chunks = chunk_text(text, chunk_tokens)
+        total = len(chunks)
+        futures = [get_executor().submit(contextvars.copy_context().run, summarize, chunk, index, total)
+                   for index, chunk in enumerate(chunks)]
+        summaries = []
+        for index, (chunk, future) in enumerate(zip(chunks, futures)):
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"[MAP-REDUCE] 第{index + 1}/{total}块摘要失败: {str(e)}")
+                summary = None
+            if not summary:
+                # 摘要失败时保留该块开头部分，按平均份额截断，保证整体仍可收敛
+                share = max(budget_tokens // max(total, 1), 1)
+                summary = _split_by_length(chunk, share)[0]
+            summaries.append(f'【第{index + 1}部分】\n{summary.strip()}')
+        text = '\n\n'.join(summaries)
+    if estimate_tokens(text) > budget_tokens:
+        # 多轮压缩后仍超出预算时按章节截断
+        text = chunk_text(text, budget_tokens)[0]
+    return text, rounds
@@ -0,0 +1,293 @@
+"""
+群体分析
+每次诊断得到的六维能力评分写入SQLite，分析时整体载入为列式的 pandas/NumPy 结构，
+均值、分位数、优劣势和标杆员工全部按列向量化计算，数万条历史诊断也能在毫秒级返回。
+"""
+import json
+import math
+import time
+import sqlite3
+import warnings
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 与诊断提示词中的六个核心维度一一对应
+ABILITY_DIMENSIONS = [
+    ('technical_innovation', '技术创新'),
+    ('business_impact', '业务影响力'),
+    ('teamwork', '团队协作'),
+    ('project_management', '项目管理'),
+    ('cost_awareness', '成本意识'),
+    ('strategic_thinking', '战略思维')
+]
+ABILITY_KEYS = [key for key, _ in ABILITY_DIMENSIONS]
+ABILITY_LABELS = dict(ABILITY_DIMENSIONS)
+
+META_COLUMNS = ['employee', 'position', 'ability_model', 'quarter']
+PERCENTILES = (25, 50, 75, 90)
+
+
+def _to_score(value):
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return score if 0 <= score <= 5 else None
+
+
+def _score_row(employee, position, ability_model, quarter, abilities, strengths=None):
+    """转换为 [元数据..., 六维评分..., 优势JSON]，没有任何有效评分时返回None"""
+    scores = [_to_score((abilities or {}).get(key)) for key in ABILITY_KEYS]
+    if all(score is None for score in scores):
+        return None
+    return [employee, position, ability_model, quarter] + scores + [
+        json.dumps(list(strengths or []), ensure_ascii=False)]
+
+
+_UPSERT_SQL = (
+    f'INSERT OR REPLACE INTO diagnosis_scores ({", ".join(META_COLUMNS + ABILITY_KEYS)}, strengths, created_at) '
+    f'VALUES ({", ".join("?" * (len(META_COLUMNS) + len(ABILITY_KEYS) + 2))})'
+)
+
+
+class CohortStore:
+    """
+    诊断评分的列式存储
+
+    SQLite 为持久层，同一员工在同一能力模型、同一周期下只保留最新一次诊断；
+    首次分析时载入为 DataFrame（元数据列为 category）和 float32 评分矩阵，
+    之后新写入的记录批量追加，不再回读数据库。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS diagnosis_scores (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                employee TEXT,
+                position TEXT,
+                ability_model TEXT,
+                quarter TEXT,
+                {', '.join(f'{key} REAL' for key in ABILITY_KEYS)},
+                strengths TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_diagnosis_scores_key '
+            'ON diagnosis_scores(employee, ability_model, quarter)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_diagnosis_scores_model ON diagnosis_scores(ability_model, quarter)')
+        self._conn.commit()
+        self._meta = None      # DataFrame: 元数据列 + strengths
+        self._scores = None    # np.ndarray (n, 6) float32，缺失维度为 NaN
+        self._pending = []
+
+    def record(self, employee, position, ability_model, quarter, abilities, strengths=None):
+        """写入一条诊断评分，已存在同一员工/能力模型/周期的记录时覆盖"""
+        row = _score_row(employee, position, ability_model, quarter, abilities, strengths)
+        if row is None:
+            return
+        with self._lock:
+            cursor = self._conn.execute(
+                'SELECT id FROM diagnosis_scores WHERE employee = ? AND ability_model = ? AND quarter = ?',
+                (employee, ability_model, quarter)
+            )
+            replaced = cursor.fetchone() is not None
+            self._conn.execute(_UPSERT_SQL, row + [time.time()])
+            self._conn.commit()
+            if self._meta is None:
+                return
+            if replaced:
+                # 覆盖旧记录时内存结构需要整体重建
+                self._meta = None
+                self._scores = None
+                self._pending = []
+            else:
+                self._pending.append((row[:len(META_COLUMNS)], row[len(META_COLUMNS):-1], row[-1]))
+
+    def record_many(self, rows):
+        """批量写入，rows 为 (employee, position, ability_model, quarter, abilities, strengths) 序列"""
+        now = time.time()
+        values = [row + [now] for row in (_score_row(*item) for item in rows) if row is not None]
+        with self._lock:
+            self._conn.executemany(_UPSERT_SQL, values)
+            self._conn.commit()
+            # 大批量写入后直接丢弃内存结构，下次分析时整体重新载入
+            self._meta = None
+            self._scores = None
+            self._pending = []
+
+    def _snapshot(self):
+        """返回当前的 (元数据, 评分矩阵)，必要时载入或合并新记录"""
+        with self._lock:
+            if self._meta is None:
+                frame = pd.read_sql_query(
+                    f'SELECT {", ".join(META_COLUMNS + ABILITY_KEYS)}, strengths FROM diagnosis_scores ORDER BY id',
+                    self._conn
+                )
+                self._scores = frame[ABILITY_KEYS].to_numpy(dtype=np.float32, na_value=np.nan)
+                self._meta = self._categorize(frame[META_COLUMNS + ['strengths']])
+                self._pending = []
+            elif self._pending:
+                rows, scores, strengths = zip(*self._pending)
+                added = pd.DataFrame(list(rows), columns=META_COLUMNS)
+                added['strengths'] = list(strengths)
+                self._meta = self._categorize(pd.concat(
+                    [self._meta.astype({column: object for column in META_COLUMNS}), added], ignore_index=True))
+                self._scores = np.vstack([self._scores, np.array(scores, dtype=np.float32)])
+                self._pending = []
+            return self._meta, self._scores
+
+    @staticmethod
+    def _categorize(frame):
+        frame = frame.copy()
+        for column in META_COLUMNS:
+            frame[column] = frame[column].fillna('未知').astype('category')
+        return frame.reset_index(drop=True)
+
+    def options(self):
+        """可用于筛选的能力模型、职位和评估周期"""
+        meta, _ = self._snapshot()
+        return {column: sorted(meta[column].cat.categories.tolist())
+                for column in ('ability_model', 'position', 'quarter')}
+
+    def analyze(self, ability_model=None, quarter=None, position=None, top_k=3):
+        """
+        按条件筛选后计算群体画像，没有符合条件的记录时返回None
+
+        quarter 与 position 可以是单个值或列表。
+        """
+        meta, scores = self._snapshot()
+        mask = np.ones(len(meta), dtype=bool)
+        for column, value in (('ability_model', ability_model), ('quarter', quarter), ('position', position)):
+            if value:
+                values = value if isinstance(value, (list, tuple)) else [value]
+                mask &= meta[column].isin(values).to_numpy()
+        if not mask.any():
+            return None
+        return self._summarize(meta[mask], scores[mask], ability_model, position, top_k)
+
+    @classmethod
+    def analyze_records(cls, rows, top_k=3):
+        """
+        对指定的一组诊断计算群体画像（如按结果ID选出的诊断），不经过持久层
+
+        rows 为 (employee, position, ability_model, quarter, abilities, strengths) 序列。
+        """
+        values = [row for row in (_score_row(*item) for item in rows) if row is not None]
+        if not values:
+            return None
+        width = len(META_COLUMNS)
+        meta = pd.DataFrame([row[:width] for row in values], columns=META_COLUMNS)
+        meta['strengths'] = [row[-1] for row in values]
+        scores = np.array([row[width:-1] for row in values], dtype=np.float32)
+        models = meta['ability_model'].dropna().unique().tolist()
+        return cls._summarize(cls._categorize(meta), scores, models[0] if len(models) == 1 else None, None, top_k)
+
+    @classmethod
+    def _summarize(cls, cohort_meta, cohort, ability_model, position, top_k):
+        valid = ~np.isnan(cohort)
+        counts = valid.sum(axis=0)
+        with warnings.catch_warnings():
+            # 某个维度在筛选结果中全部缺失时 nanmean/nanpercentile 会告警，结果为 NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            means = np.nanmean(cohort, axis=0)
+            percentiles = np.nanpercentile(cohort, PERCENTILES, axis=0)
+            high_share = (cohort >= 4).sum(axis=0) / np.maximum(counts, 1)
+            low_share = (cohort < 3).sum(axis=0) / np.maximum(counts, 1)
+        overall = float(np.nanmean(means))
+
+        # 均分从高到低取优势，从低到高取待提升领域
+        scored = [i for i in np.argsort(-np.nan_to_num(means, nan=-1)) if counts[i]]
+        strengths = [{
+            'key': ABILITY_KEYS[i],
+            'name': ABILITY_LABELS[ABILITY_KEYS[i]],
+            'score': round(float(means[i]), 2),
+            'description': f'群体均分{means[i]:.1f}，{high_share[i]:.0%}的员工达到4分及以上'
+        } for i in scored[:top_k]]
+        weaknesses = [{
+            'key': ABILITY_KEYS[i],
+            'name': ABILITY_LABELS[ABILITY_KEYS[i]],
+            'score': round(float(means[i]), 2),
+            'description': f'群体均分{means[i]:.1f}，低于各维度平均{max(overall - means[i], 0):.1f}分，'
+                           f'{low_share[i]:.0%}的员工低于3分'
+        } for i in scored[::-1][:top_k]]
+
+        return {
+            'cohort_name': cls._cohort_name(ability_model, position),
+            'model_name': ability_model if isinstance(ability_model, str) and ability_model else '全部能力模型',
+            'time_range': cls._time_range(cohort_meta['quarter']),
+            'sample_size': int(len(cohort)),
+            'employee_count': int(cohort_meta['employee'].nunique()),
+            'average_abilities': {key: round(float(means[i]), 2) if counts[i] else None
+                                  for i, key in enumerate(ABILITY_KEYS)},
+            'percentiles': {key: {f'p{p}': round(float(percentiles[j, i]), 2) if counts[i] else None
+                                  for j, p in enumerate(PERCENTILES)}
+                            for i, key in enumerate(ABILITY_KEYS)},
+            'strengths': strengths,
+            'weaknesses': weaknesses,
+            'best_practices': cls._exemplars(cohort, cohort_meta, counts, top_k)
+        }
+
+    @staticmethod
+    def _exemplars(cohort, cohort_meta, counts, top_k):
+        """每个维度得分最高的 top_k 条记录（一次 argpartition 同时处理六列）"""
+        n = len(cohort)
+        k = min(top_k, n)
+        filled = np.nan_to_num(cohort, nan=-1.0)
+        if k < n:
+            top = np.argpartition(-filled, k - 1, axis=0)[:k]
+        else:
+            top = np.tile(np.arange(n)[:, None], (1, cohort.shape[1]))
+        # 列内按得分降序
+        order = np.argsort(-np.take_along_axis(filled, top, axis=0), axis=0, kind='stable')
+        top = np.take_along_axis(top, order, axis=0)
+        # 得分的群体百分位：严格高于该得分的记录占比
+        sorted_scores = np.sort(filled, axis=0)
+
+        employees = cohort_meta['employee'].to_numpy()
+        strengths = cohort_meta['strengths'].to_numpy()
+        practices = []
+        for i, key in enumerate(ABILITY_KEYS):
+            if not counts[i]:
+                continue
+            for row in top[:, i]:
+                score = float(filled[row, i])
+                if score < 0:
+                    continue
+                higher = n - np.searchsorted(sorted_scores[:, i], score, side='right')
+                # 向上取整到整数百分比：并列最高分在大群体中不会显示为"前0%"
+                rank = max(math.ceil((higher + 1) * 100 / counts[i]), 1)
+                items = json.loads(strengths[row] or '[]')
+                practices.append({
+                    'ability_key': key,
+                    'ability': ABILITY_LABELS[key],
+                    'employee': employees[row],
+                    'score': round(score, 2),
+                    'practice': items[0] if items else '',
+                    'result': f'{ABILITY_LABELS[key]}得分位于群体前{min(rank, 100)}%'
+                })
+        return practices
+
+    @staticmethod
+    def _cohort_name(ability_model, position):
+        parts = []
+        for value in (position, ability_model):
+            if value:
+                parts.append('、'.join(value) if isinstance(value, (list, tuple)) else value)
+        return ' / '.join(parts) + '员工' if parts else '全部员工'
+
+    @staticmethod
+    def _time_range(quarters):
+        values = sorted(quarters.unique().tolist())
+        if not values:
+            return '全部周期'
+        if len(values) == 1:
+            return values[0]
+        return f'{values[0]} 至 {values[-1]}（{len(values)}个周期）'
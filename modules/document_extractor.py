@@ -0,0 +1,124 @@
+"""
+文档文本抽取引擎
+按扩展名分派到各格式的抽取后端（pptx / pdf / docx / xlsx），
+后端以生成器逐页/逐张幻灯片产出文本，最终一次性拼接，避免在循环中反复拼接字符串。
+"""
+import os
+
+import openpyxl
+from docx import Document
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+from modules.pdf_parallel import iter_pdf_pages
+
+# 抽取结果格式发生变化时递增，用于让旧的解析缓存失效
+EXTRACTOR_VERSION = 3
+
+# 页/幻灯片/工作表之间以空行分隔，便于按章节边界分块
+SECTION_SEPARATOR = '\n\n'
+
+_BACKENDS = {}
+
+
+def register_backend(extension, backend):
+    """
+    注册抽取后端
+
+    backend(path) 需返回一个生成器，逐段（页/幻灯片/工作表）产出文本
+    """
+    _BACKENDS[extension.lower().lstrip('.')] = backend
+
+
+def get_extension(path):
+    return os.path.splitext(path)[1].lower().lstrip('.')
+
+
+def is_supported(path):
+    """是否存在对应格式的抽取后端"""
+    return get_extension(path) in _BACKENDS
+
+
+def supported_extensions():
+    return sorted(_BACKENDS)
+
+
+def iter_document_text(path):
+    """逐段产出文档文本"""
+    extension = get_extension(path)
+    backend = _BACKENDS.get(extension)
+    if backend is None:
+        raise ValueError(f'不支持的文件格式: {extension}')
+    return backend(path)
+
+
+def extract_text(path, separator=SECTION_SEPARATOR):
+    """抽取文档全文"""
+    return separator.join(iter_document_text(path))
+
+
+# ---------- PPTX ----------
+
+def _iter_shape_text(shapes):
+    """递归产出形状中的文本，包括组合形状和表格"""
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _iter_shape_text(shape.shapes)
+        elif getattr(shape, 'has_table', False) and shape.has_table:
+            for row in shape.table.rows:
+                cells = [cell.text.strip() for cell in row.cells]
+                if any(cells):
+                    yield '\t'.join(cells)
+        elif getattr(shape, 'has_text_frame', False) and shape.has_text_frame:
+            yield shape.text_frame.text
+
+
+def iter_pptx_text(path):
+    prs = Presentation(path)
+    for slide in prs.slides:
+        yield '\n'.join(_iter_shape_text(slide.shapes))
+
+
+# ---------- PDF ----------
+
+def iter_pdf_text(path):
+    # 大文件按页分片交给进程池并行抽取，小文件串行
+    return iter_pdf_pages(path)
+
+
+# ---------- DOCX ----------
+
+def iter_docx_text(path):
+    document = Document(path)
+    # 按正文顺序产出段落和表格
+    for block in document.iter_inner_content():
+        if hasattr(block, 'rows'):
+            for row in block.rows:
+                cells = [cell.text.strip() for cell in row.cells]
+                if any(cells):
+                    yield '\t'.join(cells)
+        elif block.text:
+            yield block.text
+
+
+# ---------- XLSX ----------
+
+def iter_xlsx_text(path):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            lines = []
+            for row in ws.iter_rows(values_only=True):
+                cells = [str(cell) for cell in row if cell is not None and str(cell).strip()]
+                if cells:
+                    lines.append('\t'.join(cells))
+            if lines:
+                yield '\n'.join(lines)
+    finally:
+        wb.close()
+
+
+register_backend('pptx', iter_pptx_text)
+register_backend('pdf', iter_pdf_text)
+register_backend('docx', iter_docx_text)
+register_backend('xlsx', iter_xlsx_text)
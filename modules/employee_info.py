@@ -0,0 +1,125 @@
+"""
+员工基本信息抽取
+所有规则在模块加载时编译为一条组合正则，对“文件名 + 文档开头”只扫描一次，
+同时抽取姓名、职位、评估周期，并按命中的规则给出置信度。
+置信度足够高时可以直接使用，省去一次大模型调用。
+"""
+import re
+from collections import namedtuple
+
+UNKNOWN = '未知'
+
+# 文档开头参与抽取的长度：评估周期只看前 QUARTER_HEAD 个字符，姓名和职位看前 INFO_HEAD 个字符
+QUARTER_HEAD = 500
+INFO_HEAD = 1500
+
+_CN = r'[\u4e00-\u9fa5]'
+_QUARTER_NUMBERS = {'1': '一', '2': '二', '3': '三', '4': '四',
+                    '一': '一', '二': '二', '三': '三', '四': '四'}
+
+# (分组名, 字段, 规则, 置信度)；同一字段有多个命中时取置信度最高、位置最靠前的
+_RULES = [
+    ('q_cn', 'quarter', r'(?P<q_cn_year>\d{4})年?第?(?P<q_cn_num>[一二三四1234])季度?', 0.95),
+    ('q_yq', 'quarter', r'(?P<q_yq_year>\d{4})q(?P<q_yq_num>[1234])', 0.9),
+    ('q_qy', 'quarter', r'q(?P<q_qy_num>[1234])(?P<q_qy_year>\d{4})', 0.9),
+    ('q_month', 'quarter', r'(?P<q_month_year>\d{4})[年-](?P<q_month_num>\d{1,2})月?', 0.7),
+    ('name_label', 'name', rf'(?:述职人|姓名|汇报人|申请人)[：:]\s*(?P<name_label_value>{_CN}{{2,4}})', 0.9),
+    ('name_alias', 'name', rf'花名[：:]\s*(?P<name_alias_value>{_CN}{{2,4}})', 0.8),
+    ('name_self', 'name', rf'(?:我是|本人)\s*(?P<name_self_value>{_CN}{{2,4}})', 0.6),
+    ('pos_label', 'position', rf'(?:申请岗位|职位|岗位)[：:]\s*(?P<pos_label_value>{_CN}{{2,10}})', 0.9),
+    ('pos_level', 'position', rf'职级[：:]\s*(?P<pos_level_value>p\d+|{_CN}{{2,10}})', 0.85),
+    ('pos_role', 'position', rf'担任\s*(?P<pos_role_value>{_CN}{{2,10}})', 0.7),
+    ('pos_title', 'position', r'(?P<pos_title_value>(?:高级|中级|初级|资深)?(?:工程师|开发|架构师|经理|主管|总监|专员|策划))', 0.5),
+    ('pos_code', 'position', r'(?P<pos_code_value>[ptm]\d+)', 0.45),
+]
+
+# 开头的前瞻只允许各规则可能的首字符，其余位置一次字符集判断即跳过，不必逐条尝试分支。
+# 规则本身也放在前瞻中（零宽匹配），命中后不消耗文本：如“本人姓名：张三”中“本人姓名”命中低优先级规则后，
+# 从“姓”开始的“姓名：张三”仍会被标签规则命中
+_COMBINED = re.compile(
+    r'(?=[\dpqtm述姓汇申花我本职岗担高中初资工开架经主总专策])(?=(?:'
+    + '|'.join(f'(?P<{group}>{pattern})' for group, _, pattern, _ in _RULES)
+    + '))',
+    re.IGNORECASE
+)
+_RULE_INFO = {group: (field, confidence) for group, field, _, confidence in _RULES}
+_FIELD_MAX = {}
+for _, _field, _, _confidence in _RULES:
+    _FIELD_MAX[_field] = max(_FIELD_MAX.get(_field, 0), _confidence)
+
+_LLM_FIELDS = {
+    'name': re.compile(r'员工姓名[：:]\s*([^\n\r]+)'),
+    'position': re.compile(r'职位信息[：:]\s*([^\n\r]+)'),
+    'quarter': re.compile(r'评估周期[：:]\s*([^\n\r]+)')
+}
+
+EmployeeInfo = namedtuple('EmployeeInfo', ['name', 'position', 'quarter', 'confidence', 'field_confidence'])
+
+
+def _quarter_value(group, match):
+    year = match.group(f'{group}_year')
+    number = match.group(f'{group}_num')
+    if group == 'q_month':
+        month = int(number)
+        if not 1 <= month <= 12:
+            return None
+        return f'{year}年第{"一二三四"[(month - 1) // 3]}季度'
+    return f'{year}年第{_QUARTER_NUMBERS[number.lower()]}季度'
+
+
+def extract(text, filename=''):
+    """
+    抽取员工姓名、职位、评估周期
+
+    返回 EmployeeInfo；未抽取到的字段为“未知”、置信度为0，
+    confidence 为三个字段置信度的最小值。
+    """
+    prefix = (filename or '').lower() + '\n'
+    text = text or ''
+    head = prefix + text[:max(QUARTER_HEAD, INFO_HEAD)]
+    quarter_end = len(prefix) + QUARTER_HEAD
+    info_start = len(prefix)
+    info_end = len(prefix) + INFO_HEAD
+
+    best = {}  # 字段 -> (置信度, 值)
+    for match in _COMBINED.finditer(head):
+        group = match.lastgroup
+        field, confidence = _RULE_INFO[group]
+        start = match.start()
+        if field == 'quarter':
+            if start >= quarter_end:
+                continue
+            value = _quarter_value(group, match)
+        else:
+            # 姓名和职位只从文档内容中抽取
+            if start < info_start or start >= info_end:
+                continue
+            value = match.group(f'{group}_value').strip()
+        if value and confidence > best.get(field, (0, None))[0]:
+            best[field] = (confidence, value)
+            # 各字段都已命中最高优先级的规则时提前结束扫描
+            if len(best) == len(_FIELD_MAX) and all(best[f][0] == c for f, c in _FIELD_MAX.items()):
+                break
+
+    field_confidence = {field: best.get(field, (0.0, None))[0] for field in ('name', 'position', 'quarter')}
+    return EmployeeInfo(
+        name=best.get('name', (0, UNKNOWN))[1],
+        position=best.get('position', (0, UNKNOWN))[1],
+        quarter=best.get('quarter', (0, UNKNOWN))[1],
+        confidence=min(field_confidence.values()),
+        field_confidence=field_confidence
+    )
+
+
+def parse_llm_response(response_text):
+    """解析大模型按“员工姓名：/职位信息：/评估周期：”格式输出的结果，返回 (姓名, 职位, 周期)"""
+    values = []
+    for field in ('name', 'position', 'quarter'):
+        match = _LLM_FIELDS[field].search(response_text)
+        values.append(match.group(1).strip() if match else UNKNOWN)
+    return tuple(values)
+
+
+def merge(primary, fallback):
+    """以 primary (姓名, 职位, 周期) 为准，其中为“未知”的字段用 fallback 补齐"""
+    return tuple(value if value and value != UNKNOWN else other for value, other in zip(primary, fallback))
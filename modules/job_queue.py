@@ -0,0 +1,311 @@
+"""
+后台任务队列
+耗时的解析+大模型任务提交后立即返回任务ID，由有界的工作线程池执行，
+任务状态、进度和结果保存在SQLite中，进程重启后未完成的任务会重新排队。
+
+领取任务时记录领取者（进程标识）和租约到期时间，运行期间由心跳线程续租；
+只有租约过期（领取者已退出或失联）的运行中任务才会被重新排队，
+因此多个进程共用同一个任务库时不会重复执行仍在运行的任务。
+
+任务分两条优先级通道：
+- interactive: 交互式任务（如校对），优先执行，并保留专用工作线程
+- bulk: 批量任务（如诊断），只使用非保留的工作线程
+这样大量批量诊断不会占满所有工作线程，交互式任务始终有线程可用。
+"""
+import os
+import json
+import time
+import socket
+import uuid
+import sqlite3
+import threading
+from collections import deque
+
+LANES = ('interactive', 'bulk')
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+DEFAULT_LEASE = 60.0
+
+
+class JobStore:
+    """任务持久化存储"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                lane TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                payload TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                lease_expires REAL
+            )
+        ''')
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        for column, column_type in (('owner', 'TEXT'), ('lease_expires', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+        self._conn.commit()
+
+    def insert(self, job_id, kind, lane, payload):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, lane, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, lane, STATUS_QUEUED, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def claim(self, job_id, owner, lease=DEFAULT_LEASE):
+        """将排队中的任务标记为由 owner 运行并设置租约，已被其他进程领取时返回None"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_expires = ? WHERE id = ? AND status = ?',
+                (STATUS_RUNNING, now, owner, now + lease, job_id, STATUS_QUEUED)
+            )
+            self._conn.commit()
+            if cursor.rowcount == 0:
+                return None
+            return self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def heartbeat(self, owner, lease=DEFAULT_LEASE):
+        """为 owner 运行中的全部任务续租"""
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = ?',
+                               (time.time() + lease, owner, STATUS_RUNNING))
+            self._conn.commit()
+
+    def update_progress(self, job_id, progress, message=None):
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET progress = ?, message = ? WHERE id = ?',
+                               (progress, message, job_id))
+            self._conn.commit()
+
+    def finish(self, job_id, status, result=None, error=None, owner=None):
+        """
+        记录任务结果；给出 owner 时只在任务仍归其所有时写入
+        （租约过期后任务已被其他进程重新领取的情况），返回是否写入
+        """
+        sql = ('UPDATE jobs SET status = ?, progress = COALESCE(?, progress), result = ?, error = ?, '
+               'finished_at = ?, lease_expires = NULL WHERE id = ?')
+        params = [status, 1.0 if status == STATUS_SUCCEEDED else None,
+                  json.dumps(result, ensure_ascii=False) if result is not None else None,
+                  error, time.time(), job_id]
+        if owner is not None:
+            sql += ' AND owner = ? AND status = ?'
+            params += [owner, STATUS_RUNNING]
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def requeue_expired(self):
+        """将租约已过期的运行中任务重新排队，返回 [(任务ID, 通道)]"""
+        with self._lock:
+            now = time.time()
+            rows = self._conn.execute(
+                'SELECT id, lane FROM jobs WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?) '
+                'ORDER BY created_at', (STATUS_RUNNING, now)
+            ).fetchall()
+            requeued = []
+            for row in rows:
+                cursor = self._conn.execute(
+                    'UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires = NULL '
+                    'WHERE id = ? AND status = ? AND (lease_expires IS NULL OR lease_expires < ?)',
+                    (STATUS_QUEUED, row['id'], STATUS_RUNNING, now)
+                )
+                if cursor.rowcount:
+                    requeued.append((row['id'], row['lane']))
+            self._conn.commit()
+        return requeued
+
+    def recover(self):
+        """
+        启动时恢复任务：租约过期的运行中任务重新排队，
+        返回全部排队中的任务 [(任务ID, 通道)]（按提交顺序）；租约有效的任务仍归原进程
+        """
+        self.requeue_expired()
+        with self._lock:
+            rows = self._conn.execute('SELECT id, lane FROM jobs WHERE status = ? ORDER BY created_at',
+                                      (STATUS_QUEUED,)).fetchall()
+        return [(row['id'], row['lane']) for row in rows]
+
+    def purge(self, older_than):
+        """删除 older_than 秒之前已结束的任务"""
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                               (time.time() - older_than,))
+            self._conn.commit()
+
+
+def _row_to_dict(row):
+    job = dict(row)
+    job.pop('payload', None)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+class JobQueue:
+    """
+    有界工作线程池 + 优先级通道
+
+    handler(payload, progress) 返回可JSON序列化的结果，抛出异常则任务失败；
+    progress(进度0-1, 说明) 用于上报进度。
+    """
+
+    def __init__(self, store, workers=4, reserved_interactive=1, retention=7 * 24 * 3600, lease=DEFAULT_LEASE):
+        if reserved_interactive >= workers:
+            raise ValueError('保留给交互式任务的工作线程数必须小于总线程数')
+        self.store = store
+        self.lease = lease
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.workers = workers
+        self.reserved_interactive = reserved_interactive
+        self.retention = retention
+        self._handlers = {}
+        self._queues = {lane: deque() for lane in LANES}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._stopping = False
+
+    def register(self, kind, handler, lane='bulk'):
+        if lane not in LANES:
+            raise ValueError(f'未知的任务通道: {lane}')
+        self._handlers[kind] = (handler, lane)
+
+    def start(self):
+        """
+        启动工作线程与心跳线程，并恢复租约过期的任务
+
+        应只在实际处理请求的进程中调用（见 app_backup.start_background_workers）。
+        """
+        if self._threads:
+            return
+        self.store.purge(self.retention)
+        self._enqueue(self.store.recover())
+        for i in range(self.workers):
+            lanes = ('interactive',) if i < self.reserved_interactive else LANES
+            thread = threading.Thread(target=self._worker, args=(lanes,), name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _enqueue(self, jobs):
+        with self._cond:
+            for job_id, lane in jobs:
+                self._queues[lane if lane in LANES else 'bulk'].append(job_id)
+            self._cond.notify_all()
+
+    def _heartbeat(self):
+        """定期为本进程运行中的任务续租，并接管其他进程遗留的过期任务"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopping, timeout=self.lease / 3)
+                if self._stopping:
+                    return
+            try:
+                self.store.heartbeat(self.owner, self.lease)
+                self._enqueue(self.store.requeue_expired())
+            except sqlite3.Error as e:
+                print(f"任务心跳失败: {str(e)}")
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def submit(self, kind, payload, lane=None):
+        """提交任务，立即返回任务ID"""
+        if kind not in self._handlers:
+            raise ValueError(f'未知的任务类型: {kind}')
+        lane = lane or self._handlers[kind][1]
+        if lane not in LANES:
+            raise ValueError(f'未知的任务通道: {lane}')
+        job_id = uuid.uuid4().hex
+        self.store.insert(job_id, kind, lane, payload)
+        with self._cond:
+            self._queues[lane].append(job_id)
+            self._cond.notify_all()
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': {lane: len(queue) for lane, queue in self._queues.items()},
+                'running': self._running,
+                'workers': self.workers,
+                'reserved_interactive': self.reserved_interactive
+            }
+
+    def _take(self, lanes):
+        with self._cond:
+            while not self._stopping:
+                for lane in lanes:
+                    if self._queues[lane]:
+                        return self._queues[lane].popleft()
+                self._cond.wait()
+            return None
+
+    def _worker(self, lanes):
+        while True:
+            job_id = self._take(lanes)
+            if job_id is None:
+                return
+            row = self.store.claim(job_id, self.owner, self.lease)
+            if row is None:
+                continue
+            with self._cond:
+                self._running += 1
+            try:
+                self._run(row)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def _run(self, row):
+        job_id = row['id']
+        handler_entry = self._handlers.get(row['kind'])
+        if handler_entry is None:
+            self.store.finish(job_id, STATUS_FAILED, error=f'未知的任务类型: {row["kind"]}', owner=self.owner)
+            return
+
+        def progress(value, message=None):
+            self.store.update_progress(job_id, max(0.0, min(1.0, value)), message)
+
+        try:
+            result = handler_entry[0](json.loads(row['payload'] or '{}'), progress)
+            finished = self.store.finish(job_id, STATUS_SUCCEEDED, result=result, owner=self.owner)
+        except Exception as e:
+            print(f"后台任务 {job_id} ({row['kind']}) 执行失败: {str(e)}")
+            finished = self.store.finish(job_id, STATUS_FAILED, error=str(e), owner=self.owner)
+        if not finished:
+            print(f"后台任务 {job_id} 的租约已失效，结果未写入")
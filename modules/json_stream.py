@@ -0,0 +1,355 @@
+"""
+大模型输出的增量JSON解析
+- JsonArrayStreamer: 流式输出过程中逐段喂入文本，指定数组字段中的元素一旦完整即解析产出，
+  前端无需等待整段JSON结束就能渲染已完成的缺失项、评分建议等条目
+- JsonObjectExtractor: 逐段喂入文本，定位第一个完整（括号配平）的JSON对象，忽略前后的
+  markdown代码块标记和说明文字；解析前修复常见格式问题（多余的逗号、中文引号、字符串中的换行、
+  输出被截断），并按接口约定的结构校验。格式略有偏差时不必重新生成
+"""
+import re
+import copy
+import json
+
+
+class JsonArrayStreamer:
+    """
+    监听若干数组字段，增量产出其中已完整的元素
+
+        streamer = JsonArrayStreamer(['missing_items'])
+        for delta in deltas:
+            for field, index, value in streamer.feed(delta):
+                ...
+    """
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self._buffer = ''
+        self._key_patterns = {key: re.compile(r'"%s"\s*:\s*\[' % re.escape(key)) for key in self.keys}
+        self._active = None       # 当前正在扫描的字段
+        self._pos = 0             # 下一次扫描的位置
+        self._item_start = None   # 当前元素起始位置
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._counts = {key: 0 for key in self.keys}
+        self._finished = set()
+
+    @property
+    def text(self):
+        """目前为止收到的全部文本"""
+        return self._buffer
+
+    def feed(self, chunk):
+        """喂入一段新文本，返回本次新完成的 (字段, 序号, 值) 列表"""
+        self._buffer += chunk
+        completed = []
+        while True:
+            if self._active is None and not self._find_next_array():
+                break
+            if not self._scan(completed):
+                break
+        return completed
+
+    def _find_next_array(self):
+        best = None
+        for key, pattern in self._key_patterns.items():
+            if key in self._finished:
+                continue
+            match = pattern.search(self._buffer, self._pos)
+            if match and (best is None or match.start() < best[1].start()):
+                best = (key, match)
+        if best is None:
+            return False
+        self._active = best[0]
+        self._pos = best[1].end()
+        self._item_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        return True
+
+    def _scan(self, completed):
+        """扫描当前数组，数组结束返回True，数据不足返回False"""
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+                if self._item_start is None:
+                    self._item_start = self._pos
+            elif ch in '[{':
+                if self._item_start is None:
+                    self._item_start = self._pos
+                self._depth += 1
+            elif ch in ']}' and self._depth > 0:
+                self._depth -= 1
+            elif ch in ',]' and self._depth == 0:
+                self._emit(buffer[self._item_start:self._pos] if self._item_start is not None else '', completed)
+                self._item_start = None
+                if ch == ']':
+                    self._pos += 1
+                    self._finished.add(self._active)
+                    self._active = None
+                    return True
+            elif not ch.isspace() and self._item_start is None:
+                self._item_start = self._pos
+            self._pos += 1
+        return False
+
+    def _emit(self, raw, completed):
+        raw = raw.strip()
+        if not raw:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        completed.append((self._active, self._counts[self._active], value))
+        self._counts[self._active] += 1
+
+
+class LLMJsonError(json.JSONDecodeError):
+    """大模型输出无法修复为合法JSON，或不符合接口约定的结构"""
+
+    def __init__(self, msg, doc='', pos=0):
+        super().__init__(msg, doc, pos)
+
+
+# 作为字符串定界符出现的中文/全角引号
+_SMART_QUOTES = '\u201c\u201d\uff02'
+_STRING_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_CLOSERS = {'{': '}', '[': ']'}
+# 截断修复时最多回退尝试的次数
+MAX_REPAIR_ATTEMPTS = 20
+
+
+def _closes_smart_string(text, pos):
+    """
+    中文引号开头的字符串内再次出现引号时，只有其后（跳过空白）紧跟 , : } ] 或文本结束才视为结束，
+    否则是内容中的引号；后续文本尚未到达时返回None
+    """
+    for ch in text[pos + 1:]:
+        if not ch.isspace():
+            return ch in ',:}]'
+    return None
+
+
+class JsonObjectExtractor:
+    """
+    增量定位第一个完整的JSON对象
+
+        extractor = JsonObjectExtractor()
+        for delta in deltas:
+            extractor.feed(delta)
+        data = extractor.result(schema)
+
+    扫描是增量的，每个字符只处理一次；对象闭合后的文本不再扫描。
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._start = None
+        self._end = None
+        self._stack = []
+        self._quote = None
+        self._escape = False
+
+    @property
+    def text(self):
+        """目前为止收到的全部文本"""
+        return self._buffer
+
+    @property
+    def complete(self):
+        """第一个JSON对象是否已经闭合"""
+        return self._end is not None
+
+    def feed(self, chunk):
+        """喂入一段新文本，返回对象是否已闭合"""
+        self._buffer += chunk
+        if self._end is None:
+            self._scan()
+        return self._end is not None
+
+    def _scan(self):
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            ch = buffer[pos]
+            pos += 1
+            if self._start is None:
+                if ch == '{':
+                    self._start = pos - 1
+                    self._stack.append('}')
+            elif self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif self._quote == '"':
+                    if ch == '"':
+                        self._quote = None
+                elif ch == '"' or ch in _SMART_QUOTES:
+                    closes = _closes_smart_string(buffer, pos - 1)
+                    if closes is None:
+                        # 等后续文本到达再判断
+                        pos -= 1
+                        break
+                    if closes:
+                        self._quote = None
+            elif ch == '"' or ch in _SMART_QUOTES:
+                self._quote = ch
+            elif ch in _CLOSERS:
+                self._stack.append(_CLOSERS[ch])
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    self._end = pos
+                    break
+        self._pos = pos
+
+    @property
+    def raw(self):
+        """第一个对象的原文；尚未闭合时为从对象开头起的全部文本，没有对象时为None"""
+        if self._start is None:
+            return None
+        return self._buffer[self._start:self._end]
+
+    def result(self, schema=None):
+        """修复并解析第一个对象，按 schema 校验；失败时抛出 LLMJsonError"""
+        raw = self.raw
+        if raw is None:
+            raise LLMJsonError('输出中没有JSON对象', self._buffer)
+        data = loads_lenient(raw)
+        if not isinstance(data, dict):
+            raise LLMJsonError('输出的JSON不是对象', raw)
+        return validate(data, schema) if schema else data
+
+
+def _strip_trailing(out, chars):
+    while out and out[-1].isspace():
+        out.pop()
+    while out and out[-1] in chars:
+        out.pop()
+        while out and out[-1].isspace():
+            out.pop()
+
+
+def repair_json(raw):
+    """
+    修复常见格式问题，返回候选文本列表（按优先级）
+
+    - 中文引号作定界符时替换为英文引号，字符串内的中文引号保持原样（见 _closes_smart_string）
+    - 字符串中未转义的换行、制表符转义
+    - 去掉 } ] 之前多余的逗号、重复的逗号，不匹配的右括号按栈顶补正
+    - 输出被截断时补全字符串和括号；补全后仍不合法时依次回退到之前的逗号处
+    """
+    out, stack, cuts = [], [], []
+    quote, escape = None, False
+    for index, ch in enumerate(raw):
+        if quote:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == '\\':
+                escape = True
+                out.append(ch)
+            elif quote == '"' and ch == '"':
+                quote = None
+                out.append('"')
+            elif quote != '"' and (ch == '"' or ch in _SMART_QUOTES):
+                if _closes_smart_string(raw, index) is not False:
+                    quote = None
+                    out.append('"')
+                else:
+                    out.append('\\"' if ch == '"' else ch)
+            else:
+                out.append(_STRING_ESCAPES.get(ch, ch))
+        elif ch == '"' or ch in _SMART_QUOTES:
+            quote = ch
+            out.append('"')
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            out.append(ch)
+        elif ch in '}]':
+            if not stack:
+                continue
+            _strip_trailing(out, ',')
+            out.append(stack.pop())
+        elif ch == ',':
+            _strip_trailing(out, ',')
+            if out and out[-1] in '[{':
+                continue
+            cuts.append((len(out), tuple(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+    if not quote and not stack:
+        return [''.join(out)]
+
+    # 输出被截断
+    if quote:
+        if escape:
+            out.pop()
+        out.append('"')
+    candidates = []
+    tail = list(out)
+    _strip_trailing(tail, ',:')
+    candidates.append(''.join(tail) + ''.join(reversed(stack)))
+    for length, cut_stack in reversed(cuts[-MAX_REPAIR_ATTEMPTS:]):
+        candidates.append(''.join(out[:length]) + ''.join(reversed(cut_stack)))
+    return candidates
+
+
+def loads_lenient(raw):
+    """先按原文解析，失败后依次尝试修复后的候选文本；全部失败时抛出 LLMJsonError"""
+    try:
+        return json.loads(raw, strict=False)
+    except ValueError as e:
+        first_error = e
+    for candidate in repair_json(raw):
+        try:
+            return json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+    raise LLMJsonError(f'JSON修复失败: {first_error}', raw, getattr(first_error, 'pos', 0))
+
+
+REQUIRED = object()
+
+
+def validate(data, schema):
+    """
+    按接口约定校验结构
+
+    schema 为 {字段: (类型, 默认值)}，默认值为 REQUIRED 的字段必须存在；
+    缺失（或为null）的可选字段填入默认值，期望列表却得到单个字符串时包装为列表，
+    其余类型不符时抛出 LLMJsonError。
+    """
+    for key, (expected, default) in schema.items():
+        value = data.get(key)
+        if value is None:
+            if default is REQUIRED:
+                raise LLMJsonError(f'缺少字段: {key}', json.dumps(data, ensure_ascii=False))
+            data[key] = copy.deepcopy(default)
+        elif expected is list and isinstance(value, str):
+            data[key] = [value]
+        elif not isinstance(value, expected):
+            raise LLMJsonError(f'字段 {key} 类型应为 {expected.__name__}', json.dumps(data, ensure_ascii=False))
+    return data
+
+
+def extract_json(text, schema=None):
+    """从完整文本中提取第一个JSON对象，见 JsonObjectExtractor"""
+    extractor = JsonObjectExtractor()
+    extractor.feed(text)
+    return extractor.result(schema)
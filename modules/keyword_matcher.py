@@ -0,0 +1,159 @@
+"""
+多模式关键词匹配
+基于 Aho–Corasick 自动机，一次扫描文本即可统计任意数量关键词的命中次数与位置，
+耗时与文本长度成正比，与关键词数量基本无关。
+关键词按可配置的分类体系（taxonomy）组织，用于大模型不可用时的备用校对分析。
+"""
+import json
+from collections import deque
+
+# 默认分类体系：无法调用大模型时检查述职文档是否覆盖这些方面
+# problem/suggestion 为空的分类只计入缺失项，不生成修改参考
+DEFAULT_TAXONOMY = {
+    '工作成果展示': {
+        'keywords': ['成果', '业绩', '结果', '产出', '完成'],
+        'problem': '工作成果数据不够具体',
+        'suggestion': '补充项目数量、质量指标等具体数据和案例'
+    },
+    '团队协作能力': {
+        'keywords': ['协作', '团队', '合作', '配合', '沟通'],
+        'problem': '团队协作案例缺失',
+        'suggestion': '添加跨部门协作具体案例和个人贡献描述'
+    },
+    '能力发展体现': {
+        'keywords': ['学习', '成长', '提升', '发展', '进步']
+    },
+    '业务影响说明': {
+        'keywords': ['业务', '价值', '效益', '收益', '贡献'],
+        'problem': '业务价值体现不足',
+        'suggestion': '量化工作对业务的具体贡献和价值影响'
+    },
+    '创新思维展现': {
+        'keywords': ['创新', '改进', '优化', '新方法', '突破']
+    }
+}
+
+
+class AhoCorasick:
+    """
+    Aho–Corasick 自动机
+
+        automaton = AhoCorasick(['团队', '协作'])
+        for start, pattern_id in automaton.iter_matches(text):
+            ...
+    """
+
+    def __init__(self, patterns, ignore_case=True):
+        self.ignore_case = ignore_case
+        self.patterns = [pattern.lower() if ignore_case else pattern for pattern in patterns]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for pattern_id, pattern in enumerate(self.patterns):
+            if pattern:
+                self._insert(pattern, pattern_id)
+        self._build_failure_links()
+
+    def _insert(self, pattern, pattern_id):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = nxt
+        self._output[node] = self._output[node] + (pattern_id,)
+
+    def _build_failure_links(self):
+        """广度优先计算失败指针，并把失败链上的输出合并到各节点，扫描时无需再沿链查找输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter_matches(self, text):
+        """单次扫描产出 (起始位置, 关键词序号)，重叠的命中全部产出"""
+        if self.ignore_case:
+            text = text.lower()
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        root = goto[0]
+        node = 0
+        for position, ch in enumerate(text):
+            if node:
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+            else:
+                # 根节点的快速路径：绝大多数字符不是任何关键词的首字
+                node = root.get(ch, 0)
+                if not node:
+                    continue
+            if output[node]:
+                for pattern_id in output[node]:
+                    yield position - len(patterns[pattern_id]) + 1, pattern_id
+
+
+class KeywordAnalyzer:
+    """按分类体系统计关键词命中，自动机在构造时一次性编译"""
+
+    def __init__(self, taxonomy=None, max_positions=50):
+        self.taxonomy = taxonomy or DEFAULT_TAXONOMY
+        self.max_positions = max_positions
+        keywords = []
+        keyword_ids = {}
+        self._keyword_categories = []
+        for category, spec in self.taxonomy.items():
+            for keyword in spec.get('keywords', []):
+                keyword_id = keyword_ids.get(keyword)
+                if keyword_id is None:
+                    keyword_id = keyword_ids[keyword] = len(keywords)
+                    keywords.append(keyword)
+                    self._keyword_categories.append([])
+                self._keyword_categories[keyword_id].append(category)
+        self.keywords = keywords
+        self._automaton = AhoCorasick(keywords)
+
+    @classmethod
+    def from_file(cls, path=None, **kwargs):
+        """从JSON文件加载分类体系，未指定文件时使用默认分类体系"""
+        if not path:
+            return cls(**kwargs)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    def analyze(self, text):
+        """
+        单次扫描统计各分类的命中情况
+
+        返回 {分类: {'hits': 命中次数, 'keywords': {关键词: 次数}, 'positions': [起始位置...]}}，
+        positions 最多保留 max_positions 个
+        """
+        result = {category: {'hits': 0, 'keywords': {}, 'positions': []} for category in self.taxonomy}
+        keyword_counts = [0] * len(self.keywords)
+        for start, keyword_id in self._automaton.iter_matches(text or ''):
+            keyword_counts[keyword_id] += 1
+            for category in self._keyword_categories[keyword_id]:
+                entry = result[category]
+                entry['hits'] += 1
+                if len(entry['positions']) < self.max_positions:
+                    entry['positions'].append(start)
+        for keyword_id, count in enumerate(keyword_counts):
+            if count:
+                for category in self._keyword_categories[keyword_id]:
+                    result[category]['keywords'][self.keywords[keyword_id]] = count
+        return result
+
+    def missing_categories(self, text):
+        """未命中任何关键词的分类（按分类体系中的顺序）及完整统计"""
+        hits = self.analyze(text)
+        return [category for category, entry in hits.items() if not entry['hits']], hits
@@ -0,0 +1,167 @@
+"""
+大模型响应缓存
+以 (模型, 调用参数, 归一化后的提示词哈希) 为键缓存成功的响应。
+内存层为带TTL、按条数淘汰的LRU，持久层为SQLite，进程重启后仍可命中。
+"""
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(text):
+    """归一化提示词：统一Unicode形式、合并空白，消除缩进和换行差异带来的缓存失配"""
+    if text is None:
+        return ''
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def make_cache_key(model, prompt=None, messages=None, parameters=None):
+    """生成缓存键"""
+    if messages is not None:
+        normalized_input = [
+            {'role': message.get('role', ''), 'content': normalize_prompt(message.get('content', ''))}
+            for message in messages
+        ]
+    else:
+        normalized_input = normalize_prompt(prompt)
+    prompt_hash = hashlib.sha256(
+        json.dumps(normalized_input, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    raw_key = json.dumps({
+        'model': model,
+        'parameters': parameters or {},
+        'prompt': prompt_hash
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    两级响应缓存
+
+    - 内存层：最多 max_entries 条，超出按LRU淘汰
+    - SQLite层：最多 max_rows 条，超出按写入时间淘汰最旧的记录
+    - 每条记录保存原始调用耗时，命中时累计为节省的时间
+    """
+
+    def __init__(self, db_path=None, ttl=24 * 3600, max_entries=256, max_rows=5000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()  # key -> (value, expires_at, latency)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.saved_seconds = 0.0
+
+        if self.db_path:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    value TEXT NOT NULL,
+                    latency REAL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)')
+            self._conn.commit()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, latency = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    self.saved_seconds += latency or 0.0
+                    return value
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    'SELECT value, latency, expires_at FROM llm_cache WHERE cache_key = ?', (key,)
+                ).fetchone()
+                if row and row[2] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[2], row[1])
+                    self.db_hits += 1
+                    self.saved_seconds += row[1] or 0.0
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, latency=None, model=None):
+        """写入缓存，latency 为本次真实调用耗时（秒）"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at, latency)
+            if self._conn is not None:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO llm_cache (cache_key, model, value, latency, created_at, expires_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, model, json.dumps(value, ensure_ascii=False), latency, now, expires_at)
+                )
+                self._prune(now)
+                self._conn.commit()
+
+    def invalidate(self, key):
+        """删除指定缓存，例如响应内容无法解析时"""
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM llm_cache WHERE cache_key = ?', (key,))
+                self._conn.commit()
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'entries': len(self._entries)
+            }
+
+    def _remember(self, key, value, expires_at, latency):
+        """写入内存层并按条数淘汰，调用方需持有锁"""
+        self._entries.pop(key, None)
+        self._entries[key] = (value, expires_at, latency)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune(self, now):
+        """清理过期记录并限制持久层条数，调用方需持有锁"""
+        self._conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,))
+        self._conn.execute(
+            'DELETE FROM llm_cache WHERE cache_key IN ('
+            'SELECT cache_key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_rows,)
+        )
@@ -0,0 +1,496 @@
+"""
+DashScope大模型调用客户端
+所有调用点共用一个带连接池的 requests.Session，避免每次调用都重新建立TCP+TLS连接。
+base_url 可配置，便于在本地桩服务器上测试。
+
+每个模型一个熔断器：上游连续失败后调用直接抛出 CircuitOpenError，调用方立即降级，
+不再逐个等满超时；可重试的错误按带抖动的指数退避重试；
+对时延敏感的业务（hedge_endpoints）在等待超过近期P95耗时后发起对冲请求，取先返回的成功结果。
+配置了 rate_limiter 时，每次请求先按估算token数取得额度（并选定API密钥），超出限额时在本地排队。
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import dashscope
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.llm_cache import make_cache_key
+from modules.resilience import CircuitBreaker, RetryPolicy, LatencyTracker, CLOSED, OPEN
+from modules.chunking import estimate_tokens
+
+DEFAULT_BASE_URL = 'https://dashscope.aliyuncs.com/api/v1'
+GENERATION_PATH = '/services/aigc/text-generation/generation'
+
+# 各业务调用的超时时间（秒）
+DEFAULT_TIMEOUTS = {
+    'verify': 60,
+    'suggestion': 30,
+    'employee_info': 30,
+    'diagnosis': 120,
+    'scoring': 120,
+    'summary': 60
+}
+DEFAULT_TIMEOUT = 60
+
+# 请求未指定 max_tokens 时为输出预估的token数（限流时使用，返回后按实际用量结算）
+DEFAULT_OUTPUT_TOKENS = 1000
+
+
+def timeouts_from_env(prefix='LLM_TIMEOUT_'):
+    """读取形如 LLM_TIMEOUT_DIAGNOSIS=90 的环境变量覆盖各业务超时"""
+    timeouts = {}
+    for key, value in os.environ.items():
+        if key.startswith(prefix) and value:
+            timeouts[key[len(prefix):].lower()] = float(value)
+    return timeouts
+
+
+def default_api_key():
+    """依次从 dashscope 全局配置和环境变量读取API密钥"""
+    return dashscope.api_key or os.getenv('DASHSCOPE_API_KEY', '')
+
+
+def build_payload(model, prompt=None, messages=None, result_format='text', parameters=None):
+    """构造DashScope文本生成请求体"""
+    if messages is not None:
+        model_input = {'messages': messages}
+    else:
+        model_input = {'prompt': prompt}
+    request_parameters = {'result_format': result_format}
+    if parameters:
+        request_parameters.update(parameters)
+    return {
+        'model': model,
+        'input': model_input,
+        'parameters': request_parameters
+    }
+
+
+def estimate_request_tokens(payload):
+    """估算一次调用消耗的token数：输入估算 + 输出上限"""
+    model_input = payload['input']
+    if model_input.get('messages') is not None:
+        text = '\n'.join(message.get('content', '') or '' for message in model_input['messages'])
+    else:
+        text = model_input.get('prompt') or ''
+    return estimate_tokens(text) + int(payload['parameters'].get('max_tokens', DEFAULT_OUTPUT_TOKENS))
+
+
+def usage_tokens(data):
+    """从响应中取实际token用量，没有用量信息时返回None"""
+    usage = (data or {}).get('usage') or {}
+    if 'total_tokens' in usage:
+        return usage['total_tokens']
+    if 'input_tokens' in usage or 'output_tokens' in usage:
+        return usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+    return None
+
+
+class LLMError(Exception):
+    """大模型调用返回错误（非200状态或流中的错误事件）"""
+
+    def __init__(self, status_code, code='', message=''):
+        super().__init__(f'{status_code} {code} {message}'.strip())
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+class CircuitOpenError(LLMError):
+    """熔断期间拒绝调用，不访问上游"""
+
+    def __init__(self, model, retry_after=0.0):
+        super().__init__(503, 'CircuitOpen', f'{model} 调用连续失败，已熔断，约{retry_after:.0f}秒后重新探测')
+        self.retry_after = retry_after
+
+
+class LLMResponse:
+    """统一的调用结果，字段与 dashscope.Generation.call 的返回值保持一致"""
+
+    def __init__(self, status_code, data=None, code='', message=''):
+        self.status_code = status_code
+        self.data = data or {}
+        self.code = code or self.data.get('code', '')
+        self.message = message or self.data.get('message', '')
+        self.request_id = self.data.get('request_id', '')
+        self.cache_key = None
+        self.from_cache = False
+
+    @property
+    def output(self):
+        return self.data.get('output', {}) or {}
+
+    @property
+    def usage(self):
+        return self.data.get('usage', {}) or {}
+
+    @property
+    def text(self):
+        """取出模型输出文本，兼容 text 和 message 两种 result_format"""
+        output = self.output
+        if output.get('text') is not None:
+            return output['text']
+        choices = output.get('choices') or []
+        if choices:
+            return choices[0].get('message', {}).get('content', '') or ''
+        return ''
+
+    @classmethod
+    def from_body(cls, status_code, body):
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return cls(status_code, message=body[:500] if body else '')
+        return cls(status_code, data)
+
+
+def _lookup_cache(cache, payload, use_cache):
+    """查询响应缓存，返回 (缓存键, 命中的响应)"""
+    if cache is None:
+        return None, None
+    model_input = payload['input']
+    key = make_cache_key(payload['model'], prompt=model_input.get('prompt'),
+                         messages=model_input.get('messages'), parameters=payload['parameters'])
+    if not use_cache:
+        # 跳过读取但仍写入，"重新生成"的结果会刷新缓存
+        cache.record_bypass()
+        return key, None
+    data = cache.get(key)
+    if data is None:
+        return key, None
+    response = LLMResponse(200, data)
+    response.cache_key = key
+    response.from_cache = True
+    return key, response
+
+
+def _store_cache(cache, key, response, latency, model):
+    response.cache_key = key
+    if cache is not None and key and response.status_code == 200:
+        cache.put(key, response.data, latency=latency, model=model)
+
+
+class LLMClient:
+    """同步客户端，内部复用带连接池的 requests.Session"""
+
+    def __init__(self, base_url=None, pool_size=10, keepalive=True, timeouts=None,
+                 default_timeout=DEFAULT_TIMEOUT, api_key_provider=default_api_key, cache=None,
+                 retry=None, breaker_threshold=5, breaker_reset=30.0, hedge_endpoints=(), hedge_delay=3.0,
+                 rate_limiter=None, throttle_cooldown=5.0):
+        self.base_url = (base_url or os.getenv('DASHSCOPE_BASE_URL', DEFAULT_BASE_URL)).rstrip('/')
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.cache = cache
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.default_timeout = default_timeout
+        self.api_key_provider = api_key_provider
+        self.retry = retry or RetryPolicy()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.hedge_endpoints = frozenset(hedge_endpoints)
+        self.hedge_delay = hedge_delay  # 耗时样本不足时的对冲等待时间
+        self.rate_limiter = rate_limiter
+        self.throttle_cooldown = throttle_cooldown  # 密钥被上游限流后暂停使用的秒数
+        self.latency = LatencyTracker()
+        self._breakers = {}
+        self._counters = {'retries': 0, 'hedged': 0, 'hedge_wins': 0, 'short_circuited': 0}
+        self._hedge_executor = None
+        self._session = None
+        self._streaming = {}  # 进行中的流式调用：缓存键 -> [并发数, 是否已被调用方判为无效]
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                if not self.keepalive:
+                    session.headers['Connection'] = 'close'
+                self._session = session
+            return self._session
+
+    def timeout_for(self, endpoint):
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+    def headers(self, api_key=None):
+        return {
+            'Authorization': f'Bearer {api_key or self.api_key_provider()}',
+            'Content-Type': 'application/json'
+        }
+
+    def breaker_for(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _acquire(self, model):
+        """熔断器放行时返回熔断器，否则抛出 CircuitOpenError"""
+        breaker = self.breaker_for(model)
+        if not breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(model, breaker.retry_after())
+        return breaker
+
+    def _post(self, model, endpoint, payload, deadline, api_key=None, extra_headers=None, stream=False):
+        """
+        带限流、熔断与重试的POST
+
+        网络异常和5xx计为失败；可重试的状态码和网络异常在截止时间内退避重试。
+        返回 (requests 的响应对象, 限流额度)，重试用尽时为最后一次的响应；网络异常重试用尽时抛出。
+        调用方显式指定 api_key 时不经过限流器。
+        """
+        attempt = 0
+        cost = estimate_request_tokens(payload) if self.rate_limiter is not None and not api_key else 0
+        while True:
+            lease = None
+            done = False
+            try:
+                if cost:
+                    # 已熔断时不必排队
+                    if self.breaker_for(model).state == OPEN:
+                        self._acquire(model)
+                    lease = self.rate_limiter.acquire(model, cost, deadline=deadline)
+                breaker = self._acquire(model)
+                headers = self.headers(api_key or (lease.key if lease else None))
+                if extra_headers:
+                    headers.update(extra_headers)
+                started = time.monotonic()
+                try:
+                    resp = self.session.post(self.base_url + GENERATION_PATH, headers=headers, json=payload,
+                                             timeout=max(deadline - started, 0.1), stream=stream)
+                except requests.RequestException as e:
+                    breaker.record_failure()
+                    delay = self.retry.next_delay(attempt, deadline)
+                    if delay is None:
+                        raise
+                    print(f"[LLM] {endpoint or model} 调用异常，{delay:.2f}秒后重试: {str(e)}")
+                else:
+                    if resp.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    if resp.status_code == 429 and lease is not None:
+                        # 该密钥被上游限流，暂停使用一段时间，重试时换用其他密钥
+                        self.rate_limiter.penalize(lease, self.throttle_cooldown)
+                    if not self.retry.is_retryable_status(resp.status_code):
+                        done = True
+                        return resp, lease
+                    delay = self.retry.next_delay(attempt, deadline)
+                    if delay is None:
+                        done = True
+                        return resp, lease
+                    print(f"[LLM] {endpoint or model} 返回 {resp.status_code}，{delay:.2f}秒后重试")
+                    resp.close()
+            finally:
+                if not done:
+                    # 熔断、异常或进入重试：本次尝试没有交给调用方结算，退回预估额度
+                    self._settle(lease, 0)
+            self._count('retries')
+            time.sleep(delay)
+            attempt += 1
+
+    def _settle(self, lease, actual_tokens):
+        if lease is not None:
+            self.rate_limiter.settle(lease, actual_tokens)
+
+    def _generate_once(self, model, endpoint, payload, api_key, deadline):
+        started = time.monotonic()
+        resp, lease = self._post(model, endpoint, payload, deadline, api_key=api_key)
+        response = LLMResponse.from_body(resp.status_code, resp.text)
+        actual_tokens = usage_tokens(response.data)
+        if actual_tokens is None and response.status_code != 200:
+            # 错误响应没有用量信息，视为未消耗
+            actual_tokens = 0
+        self._settle(lease, actual_tokens)
+        if response.status_code == 200:
+            self.latency.record(endpoint or model, time.monotonic() - started)
+        return response
+
+    def hedge_delay_for(self, endpoint):
+        """对冲等待时间：近期P95耗时，样本不足时用配置值"""
+        p95 = self.latency.percentile(endpoint, 95)
+        return self.hedge_delay if p95 is None else max(p95, 0.05)
+
+    @property
+    def hedge_executor(self):
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.pool_size * 2,
+                                                          thread_name_prefix='llm-hedge')
+            return self._hedge_executor
+
+    def _generate_hedged(self, model, endpoint, payload, api_key, deadline):
+        """先发一个请求，超过对冲等待时间仍未返回时再发一个，取先返回的成功结果"""
+        executor = self.hedge_executor
+        # 复制当前上下文，对冲线程中的调用仍计入当前用户的限流队列
+        primary = executor.submit(contextvars.copy_context().run, self._generate_once,
+                                  model, endpoint, payload, api_key, deadline)
+        done, _ = wait([primary], timeout=self.hedge_delay_for(endpoint))
+        if done or time.monotonic() >= deadline or self.breaker_for(model).state != CLOSED:
+            return primary.result()
+        self._count('hedged')
+        hedge = executor.submit(contextvars.copy_context().run, self._generate_once,
+                                model, endpoint, payload, api_key, deadline)
+        pending = {primary, hedge}
+        fallback, error = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if response.status_code == 200:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return response
+                fallback = fallback or response
+        if fallback is not None:
+            return fallback
+        raise error
+
+    def generate(self, model, prompt=None, messages=None, result_format='text', parameters=None,
+                 endpoint=None, timeout=None, api_key=None, use_cache=True):
+        """
+        调用文本生成接口
+
+        endpoint 为业务调用名，用于选择超时时间，超时时间同时是重试的总截止时间；
+        熔断中抛出 CircuitOpenError，网络异常重试用尽后直接抛出，由调用方决定降级策略。
+        配置了响应缓存时优先返回缓存结果，use_cache=False 时强制重新调用。
+        """
+        payload = build_payload(model, prompt, messages, result_format, parameters)
+        cache_key, cached = _lookup_cache(self.cache, payload, use_cache)
+        if cached is not None:
+            return cached
+        started = time.monotonic()
+        deadline = started + (timeout or self.timeout_for(endpoint))
+        if endpoint in self.hedge_endpoints:
+            response = self._generate_hedged(model, endpoint, payload, api_key, deadline)
+        else:
+            response = self._generate_once(model, endpoint, payload, api_key, deadline)
+        _store_cache(self.cache, cache_key, response, time.monotonic() - started, model)
+        return response
+
+    def invalidate(self, model, prompt=None, messages=None, result_format='text', parameters=None):
+        """删除某次调用对应的缓存结果（例如流式输出无法解析时）"""
+        if self.cache is None:
+            return
+        payload = build_payload(model, prompt, messages, result_format, parameters)
+        model_input = payload['input']
+        key = make_cache_key(payload['model'], prompt=model_input.get('prompt'),
+                             messages=model_input.get('messages'), parameters=payload['parameters'])
+        with self._lock:
+            # 流尚未读完时失效：读完后不再写回缓存
+            if key in self._streaming:
+                self._streaming[key][1] = True
+        self.cache.invalidate(key)
+
+    def stream(self, model, prompt=None, messages=None, result_format='text', parameters=None,
+               endpoint=None, timeout=None, api_key=None, use_cache=True):
+        """
+        流式调用文本生成接口（SSE + incremental_output），逐段产出增量文本
+
+        与 generate() 共用响应缓存：命中时一次性产出完整文本，流结束后写入完整结果。
+        上游返回错误时抛出 LLMError；熔断与重试只作用于建立连接阶段，已产出内容后不再重试。
+        """
+        payload = build_payload(model, prompt, messages, result_format, parameters)
+        cache_key, cached = _lookup_cache(self.cache, payload, use_cache)
+        if cached is not None:
+            yield cached.text
+            return
+
+        wire_payload = dict(payload, parameters=dict(payload['parameters'], incremental_output=True))
+        started = time.monotonic()
+        parts = []
+        self._begin_stream(cache_key)
+        try:
+            yield from self._stream_deltas(model, endpoint, wire_payload, started, timeout, api_key, parts)
+        finally:
+            rejected = self._end_stream(cache_key)
+        if not rejected:
+            response = LLMResponse(200, {'output': {'text': ''.join(parts)}})
+            _store_cache(self.cache, cache_key, response, time.monotonic() - started, model)
+
+    def _stream_deltas(self, model, endpoint, payload, started, timeout, api_key, parts):
+        sse_headers = {'Accept': 'text/event-stream', 'X-DashScope-SSE': 'enable'}
+        resp, lease = self._post(model, endpoint, payload, started + (timeout or self.timeout_for(endpoint)),
+                                 api_key=api_key, extra_headers=sse_headers, stream=True)
+        actual_tokens = None
+        with resp:
+            if resp.status_code != 200:
+                self._settle(lease, 0)
+                error = LLMResponse.from_body(resp.status_code, resp.text)
+                raise LLMError(error.status_code, error.code, error.message)
+            resp.encoding = 'utf-8'
+            try:
+                for line in resp.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    event = LLMResponse.from_body(200, line[5:].strip())
+                    if event.code:
+                        raise LLMError(event.data.get('status_code', 500), event.code, event.message)
+                    actual_tokens = usage_tokens(event.data) or actual_tokens
+                    delta = event.text
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            except requests.RequestException:
+                # 流中途断开同样计为上游失败
+                self.breaker_for(model).record_failure()
+                raise
+            finally:
+                self._settle(lease, actual_tokens)
+
+    def _begin_stream(self, key):
+        if key is None:
+            return
+        with self._lock:
+            self._streaming.setdefault(key, [0, False])[0] += 1
+
+    def _end_stream(self, key):
+        """结束一次流式调用，返回期间是否被 invalidate() 判为无效"""
+        if key is None:
+            return False
+        with self._lock:
+            state = self._streaming[key]
+            state[0] -= 1
+            if state[0] == 0:
+                del self._streaming[key]
+            return state[1]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            breakers = dict(self._breakers)
+        counters['breakers'] = {model: breaker.stats() for model, breaker in breakers.items()}
+        counters['hedge_delays'] = {endpoint: round(self.hedge_delay_for(endpoint), 3)
+                                    for endpoint in sorted(self.hedge_endpoints)}
+        if self.rate_limiter is not None:
+            counters['rate_limiter'] = self.rate_limiter.stats()
+        return counters
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
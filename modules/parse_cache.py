@@ -0,0 +1,235 @@
+"""
+文档解析结果缓存
+按文件内容的SHA-256寻址：同一份PPT/PDF/Excel无论以什么文件名、被哪个接口请求，
+只解析一次。内存中为按字节预算淘汰的LRU，同时落盘到溢出目录，进程重启后仍可命中；
+溢出目录同样有字节预算，超出时按最近使用时间（文件修改时间）删除最旧的副本。
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """分块计算文件内容的SHA-256，避免大文件整体读入内存"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    内容寻址的解析结果缓存
+
+    - 键为 "<命名空间>:<文件SHA-256>"，命名空间区分文档正文、评分表等不同解析器
+    - 值为可JSON序列化的解析结果，内存中保存序列化后的文本，按其字节数计入内存预算；
+      每次读取都反序列化出独立的副本，调用方修改返回值不会影响缓存
+    - 内存超出预算时按LRU淘汰，磁盘溢出目录中的副本仍可在之后命中
+    - 溢出目录超出 max_spill_bytes 时删除最久未使用的副本，降到预算的90%
+    """
+
+    def __init__(self, spill_dir, max_bytes=64 * 1024 * 1024, digest_resolver=None,
+                 max_spill_bytes=512 * 1024 * 1024, max_digests=4096):
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.max_digests = max_digests
+        # digest_resolver(path) 能直接给出内容摘要时（如内容寻址的上传文件）不再读文件计算哈希
+        self.digest_resolver = digest_resolver
+        self._entries = OrderedDict()  # key -> (JSON文本, 字节数)
+        self._current_bytes = 0
+        # (路径, 修改时间, 大小) -> 摘要，避免同一文件每次请求都重新计算哈希；按LRU保留 max_digests 条
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_evictions = 0
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._spill_bytes = sum(size for _, _, size in self._spill_files())
+
+    def digest(self, path):
+        """获取文件内容摘要，文件未变化时复用上次的计算结果"""
+        if self.digest_resolver is not None:
+            resolved = self.digest_resolver(path)
+            if resolved:
+                return resolved
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._digests.get(memo_key)
+            if cached:
+                self._digests.move_to_end(memo_key)
+                return cached
+        value = file_sha256(path)
+        with self._lock:
+            self._digests[memo_key] = value
+            while len(self._digests) > self.max_digests:
+                self._digests.popitem(last=False)
+        return value
+
+    def get(self, key):
+        """按键读取缓存，依次查询内存和磁盘，未命中返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+        if entry is not None:
+            return json.loads(entry[0])
+
+        text, value = self._read_spill(key)
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, text)
+        return value
+
+    def put(self, key, value):
+        """写入缓存：内存LRU + 磁盘副本"""
+        text = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, text)
+        self._write_spill(key, text)
+
+    def cached(self, path, namespace):
+        """文件已缓存的解析结果（键同 get_or_parse），未命中返回None"""
+        return self.get(f'{namespace}:{self.digest(path)}')
+
+    def get_or_parse(self, path, namespace, parser):
+        """
+        读取文件的解析结果，未命中时调用 parser(path) 解析并写入缓存
+        """
+        key = f'{namespace}:{self.digest(path)}'
+        value = self.get(key)
+        if value is None:
+            value = parser(path)
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'spill_bytes': self._spill_bytes,
+                'max_spill_bytes': self.max_spill_bytes,
+                'spill_evictions': self.spill_evictions,
+                'digests': len(self._digests)
+            }
+
+    def clear(self):
+        """清空内存中的缓存（磁盘副本保留）"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def _remember(self, key, text):
+        """写入内存LRU并按字节预算淘汰，调用方需持有锁"""
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            # 单条结果超过整个预算时只保留磁盘副本
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._current_bytes -= old[1]
+        self._entries[key] = (text, size)
+        self._current_bytes += size
+        while self._current_bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._current_bytes -= evicted_size
+            self.evictions += 1
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, key.replace(':', '_') + '.json')
+
+    def _read_spill(self, key):
+        """读取磁盘副本，返回 (JSON文本, 解析结果)，不存在或已损坏时为 (None, None)"""
+        if not self.spill_dir:
+            return None, None
+        path = self._spill_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            value = json.loads(text)
+        except (OSError, ValueError):
+            return None, None
+        try:
+            # 刷新修改时间，溢出目录按最近使用时间淘汰
+            os.utime(path)
+        except OSError:
+            pass
+        return text, value
+
+    def _write_spill(self, key, text):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"解析缓存落盘失败: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._spill_lock:
+            self._spill_bytes += len(text.encode('utf-8'))
+            if self._spill_bytes > self.max_spill_bytes:
+                self._prune_spill()
+
+    def _spill_files(self):
+        """溢出目录中的副本 [(修改时间, 路径, 字节数)]"""
+        files = []
+        try:
+            entries = list(os.scandir(self.spill_dir))
+        except OSError:
+            return files
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
+
+    def _prune_spill(self):
+        """按目录实际占用重新统计（目录可能被多个进程共用），删除最久未使用的副本，调用方需持有 _spill_lock"""
+        files = sorted(self._spill_files())
+        total = sum(size for _, _, size in files)
+        target = self.max_spill_bytes * 0.9
+        for _, path, size in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.spill_evictions += 1
+        self._spill_bytes = total
@@ -0,0 +1,96 @@
+"""
+PDF并行抽取
+将页码区间分片（每个工作进程一片，至少 PDF_PARALLEL_SHARD_PAGES 页）交给常驻的进程池
+并行执行 PyPDF2 的 extract_text()，按页序重新拼装。
+页数较少时进程间开销大于收益，直接在当前进程串行抽取。
+"""
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+PDF_WORKERS = int(os.getenv('PDF_PARALLEL_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 24))
+PDF_SHARD_PAGES = int(os.getenv('PDF_PARALLEL_SHARD_PAGES', 8))
+
+_pools = {}  # 进程数 -> 进程池
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers=None):
+    """
+    获取常驻进程池，首次使用时创建，之后跨请求复用
+
+    不同进程数各用一个进程池，改用其他进程数时不影响正在使用已有进程池的请求。
+    工作进程以 spawn 方式启动：Flask 进程是多线程的，fork 会把其他线程持有的锁一并复制到子进程中。
+    """
+    workers = workers or PDF_WORKERS
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+        return pool
+
+
+def shutdown_pool(workers=None):
+    """关闭指定进程数的进程池，不指定时全部关闭"""
+    with _pool_lock:
+        for size in ([workers] if workers else list(_pools)):
+            pool = _pools.pop(size, None)
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def extract_page_range(path, start, end):
+    """在工作进程中抽取 [start, end) 页的文本"""
+    with open(path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [(reader.pages[i].extract_text() or '') for i in range(start, end)]
+
+
+def page_ranges(page_count, shard_pages):
+    return [(start, min(start + shard_pages, page_count)) for start in range(0, page_count, shard_pages)]
+
+
+def iter_pdf_pages(path, workers=None, min_pages=None, shard_pages=None):
+    """
+    逐页产出PDF文本
+
+    页数达到 min_pages 且工作进程数大于1时按 shard_pages 分片，在 workers 个进程中并行抽取，否则串行。
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    min_pages = PDF_MIN_PAGES if min_pages is None else min_pages
+    shard_pages = PDF_SHARD_PAGES if shard_pages is None else shard_pages
+
+    with open(path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        page_count = len(reader.pages)
+        if workers <= 1 or page_count < min_pages:
+            for page in reader.pages:
+                yield page.extract_text() or ''
+            return
+
+    # 每个分片都要在工作进程中重新打开并解析整个PDF的交叉引用表，分片越多开销越大：
+    # 分片数不超过工作进程数，每个进程只打开一次
+    shard_pages = max(1, shard_pages, -(-page_count // workers))
+    try:
+        pool = get_pool(workers)
+        futures = [pool.submit(extract_page_range, path, start, end)
+                   for start, end in page_ranges(page_count, shard_pages)]
+        results = [future.result() for future in futures]
+    except BrokenProcessPool as e:
+        # 工作进程异常退出时丢弃进程池，下次请求重新创建，本次退回串行
+        print(f"PDF并行抽取进程池异常，回退串行抽取: {str(e)}")
+        shutdown_pool(workers)
+        yield from iter_pdf_pages(path, workers=1)
+        return
+    for pages in results:
+        yield from pages
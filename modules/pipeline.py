@@ -0,0 +1,105 @@
+"""
+轻量级依赖感知流水线
+将一次请求拆成若干阶段（如信息抽取、诊断分析），无依赖关系的阶段在线程池中并发执行，
+端到端耗时接近最慢的一条依赖链，而不是各阶段耗时之和。
+"""
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', 8))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """全局共享的阶段执行线程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='pipeline')
+        return _executor
+
+
+class Pipeline:
+    """
+    有向无环的阶段图
+
+    用法：
+        pipeline = Pipeline()
+        pipeline.add('info', extract_info)
+        pipeline.add('diagnosis', run_diagnosis)
+        pipeline.add('merge', merge, deps=('info', 'diagnosis'))
+        results = pipeline.run()
+
+    阶段函数以关键字参数接收其依赖阶段的结果（参数名即阶段名）。
+    任一阶段抛出异常时不再调度新的阶段，等待已提交的阶段结束后重新抛出该异常。
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor
+        self._stages = {}
+
+    def add(self, name, func, deps=()):
+        if name in self._stages:
+            raise ValueError(f'阶段重复定义: {name}')
+        self._stages[name] = (func, tuple(deps))
+        return self
+
+    def _check(self):
+        for name, (_, deps) in self._stages.items():
+            for dep in deps:
+                if dep not in self._stages:
+                    raise ValueError(f'阶段 {name} 依赖未定义的阶段 {dep}')
+        # 拓扑检查，存在环时无法调度
+        visited, visiting = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f'阶段依赖存在环: {name}')
+            visiting.add(name)
+            for dep in self._stages[name][1]:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self._stages:
+            visit(name)
+
+    def run(self):
+        """执行所有阶段，返回 {阶段名: 结果}"""
+        self._check()
+        executor = self.executor or get_executor()
+        results = {}
+        pending = dict(self._stages)
+        running = {}
+        error = None
+
+        def submit_ready():
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    kwargs = {dep: results[dep] for dep in deps}
+                    # 阶段在调用方的上下文副本中执行（contextvars 不会自动传入线程池）
+                    running[executor.submit(contextvars.copy_context().run, func, **kwargs)] = name
+                    del pending[name]
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+            if error is None:
+                submit_ready()
+
+        if error is not None:
+            raise error
+        return results
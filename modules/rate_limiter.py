@@ -0,0 +1,266 @@
+"""
+大模型调用的客户端限流
+每个 (API密钥, 模型) 维护两个令牌桶：请求数（RPM）和估算token数（TPM），
+调用前按估算token数取令牌，返回后按实际用量多退少补。
+配置多个密钥时，每次调用选择可最早放行的密钥，吞吐量随密钥数量线性增加。
+超出限额的调用在本地排队：按用户分队列、用户之间轮转放行，单个用户的批量任务不会饿死其他用户。
+当前用户通过 contextvars 传递，提交到线程池的任务需用 copy_context().run 保留上下文。
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+
+# 每个密钥各模型的默认限额：(每分钟请求数, 每分钟token数)
+DEFAULT_RATE_LIMITS = {
+    'qwen-turbo': (600, 1000000),
+    'qwen-plus': (600, 1000000),
+    'qwen-max': (60, 100000)
+}
+DEFAULT_RATE_LIMIT = (60, 100000)
+ANONYMOUS = 'anonymous'
+
+_current_user = contextvars.ContextVar('llm_user', default=ANONYMOUS)
+
+
+def current_user():
+    return _current_user.get()
+
+
+def set_current_user(user):
+    return _current_user.set(user or ANONYMOUS)
+
+
+@contextmanager
+def user_context(user):
+    token = set_current_user(user)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+def rate_limits_from_env(prefix='LLM_RATE_LIMIT_'):
+    """读取形如 LLM_RATE_LIMIT_QWEN_MAX=60/100000（每分钟请求数/每分钟token数）的环境变量"""
+    limits = {}
+    for key, value in os.environ.items():
+        if key.startswith(prefix) and value:
+            rpm, _, tpm = value.partition('/')
+            model = key[len(prefix):].lower().replace('_', '-')
+            limits[model] = (float(rpm), float(tpm or DEFAULT_RATE_LIMIT[1]))
+    return limits
+
+
+class QueueTimeout(Exception):
+    """在截止时间内未排到调用额度"""
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒补充，最多存 capacity 个；允许因多退少补出现负数（欠额）"""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.level = self.capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """取出 amount 个令牌需要等待的秒数；超出容量的请求按容量计，桶满即可放行"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount, now):
+        """取出令牌，返回实际取出的数量（超出容量的部分不预扣）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        self.level -= amount
+        return amount
+
+    def adjust(self, delta, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level - delta)
+
+
+class Lease:
+    """
+    一次放行的调用额度，调用结束后用 settle() 按实际用量结算
+
+    tokens 为实际从桶中预扣的数量：估算超过桶容量时按容量预扣，结算时补扣差额。
+    """
+
+    def __init__(self, index, key, model, tokens, waited):
+        self.index = index
+        self.key = key
+        self.model = model
+        self.tokens = tokens
+        self.waited = waited
+
+
+class RateLimiter:
+    """
+    按密钥与模型限流的公平调度器
+
+        lease = limiter.acquire('qwen-plus', estimated_tokens, deadline=...)
+        ... 使用 lease.key 调用 ...
+        limiter.settle(lease, actual_tokens)
+
+    keys 为空时只有一个额度槽位，lease.key 为None（由调用方使用默认密钥）。
+    burst_seconds 为桶容量对应的秒数，限制瞬时突发。
+    """
+
+    def __init__(self, keys=None, limits=None, burst_seconds=10.0, clock=time.monotonic):
+        self.keys = list(keys or []) or [None]
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.burst_seconds = burst_seconds
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._buckets = {}  # (密钥序号, 模型) -> (请求桶, token桶)
+        self._cooldown = {}  # (密钥序号, 模型) -> 被上游限流后暂停使用到的时间
+        self._queues = {}  # 模型 -> OrderedDict(用户 -> deque[排队凭证])，队首用户优先
+        self._next_key = 0
+        self._counters = {'admitted': 0, 'queued': 0, 'timeouts': 0, 'throttled': 0, 'wait_seconds': 0.0}
+
+    def _limit(self, model):
+        return self.limits.get(model, DEFAULT_RATE_LIMIT)
+
+    def _bucket_pair(self, index, model, now):
+        pair = self._buckets.get((index, model))
+        if pair is None:
+            rpm, tpm = self._limit(model)
+            pair = self._buckets[(index, model)] = (
+                TokenBucket(rpm / 60.0, rpm / 60.0 * self.burst_seconds, now),
+                TokenBucket(tpm / 60.0, tpm / 60.0 * self.burst_seconds, now)
+            )
+        return pair
+
+    def _pick_key(self, model, tokens, now):
+        """返回 (密钥序号, 需等待秒数)，优先选择可立即放行的密钥，相同时轮转"""
+        best_index, best_wait = None, None
+        count = len(self.keys)
+        for offset in range(count):
+            index = (self._next_key + offset) % count
+            requests_bucket, tokens_bucket = self._bucket_pair(index, model, now)
+            wait = max(requests_bucket.wait_time(1, now), tokens_bucket.wait_time(tokens, now),
+                       self._cooldown.get((index, model), 0.0) - now)
+            if best_wait is None or wait < best_wait:
+                best_index, best_wait = index, wait
+                if wait <= 0:
+                    break
+        return best_index, max(best_wait, 0.0)
+
+    def acquire(self, model, tokens, user=None, deadline=None):
+        """
+        取得一次调用额度，必要时排队等待
+
+        同一模型的排队请求按用户轮转：每次只放行队首用户的第一个请求，随后该用户移到队尾。
+        deadline（time.monotonic 时间）之前未放行时抛出 QueueTimeout。
+        """
+        user = user or current_user()
+        ticket = object()
+        started = self._clock()
+        with self._cond:
+            queue = self._queues.setdefault(model, OrderedDict())
+            queue.setdefault(user, deque()).append(ticket)
+            queued = False
+            try:
+                while True:
+                    now = self._clock()
+                    wait = None
+                    if next(iter(queue)) == user and queue[user][0] is ticket:
+                        index, wait = self._pick_key(model, tokens, now)
+                        if wait <= 0:
+                            requests_bucket, tokens_bucket = self._bucket_pair(index, model, now)
+                            requests_bucket.consume(1, now)
+                            consumed = tokens_bucket.consume(tokens, now)
+                            self._next_key = (index + 1) % len(self.keys)
+                            self._dequeue(queue, user, ticket, rotate=True)
+                            waited = now - started
+                            self._counters['admitted'] += 1
+                            self._counters['wait_seconds'] += waited
+                            self._cond.notify_all()
+                            return Lease(index, self.keys[index], model, consumed, waited)
+                    if not queued:
+                        queued = True
+                        self._counters['queued'] += 1
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._counters['timeouts'] += 1
+                            raise QueueTimeout(f'{model} 调用排队超时（已等待{now - started:.1f}秒）')
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                self._dequeue(queue, user, ticket)
+                self._cond.notify_all()
+                raise
+
+    @staticmethod
+    def _dequeue(queue, user, ticket, rotate=False):
+        """移除排队凭证；rotate=True（放行）时该用户还有排队请求则移到队尾"""
+        tickets = queue.get(user)
+        if not tickets or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if tickets:
+            if rotate:
+                queue.move_to_end(user)
+        else:
+            del queue[user]
+
+    def settle(self, lease, actual_tokens):
+        """按实际token用量结算：估算偏多时退回，偏少时补扣"""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            now = self._clock()
+            _, tokens_bucket = self._bucket_pair(lease.index, lease.model, now)
+            tokens_bucket.adjust(actual_tokens - lease.tokens, now)
+            self._cond.notify_all()
+
+    def penalize(self, lease, seconds):
+        """上游返回限流时，该密钥在 seconds 秒内不再用于该模型，后续调用转到其他密钥"""
+        with self._cond:
+            key = (lease.index, lease.model)
+            self._cooldown[key] = max(self._cooldown.get(key, 0.0), self._clock() + seconds)
+            self._counters['throttled'] += 1
+            self._cond.notify_all()
+
+    def queue_depth(self, model=None):
+        with self._cond:
+            queues = [self._queues.get(model, {})] if model else list(self._queues.values())
+            return sum(len(tickets) for queue in queues for tickets in queue.values())
+
+    def stats(self):
+        with self._cond:
+            now = self._clock()
+            models = {}
+            for model, queue in self._queues.items():
+                models[model] = {
+                    'queued': sum(len(tickets) for tickets in queue.values()),
+                    'users': {user: len(tickets) for user, tickets in queue.items()}
+                }
+            buckets = {}
+            for (index, model), (requests_bucket, tokens_bucket) in self._buckets.items():
+                requests_bucket._refill(now)
+                tokens_bucket._refill(now)
+                buckets.setdefault(model, []).append({
+                    'key': f'#{index + 1}',
+                    'requests_available': round(requests_bucket.level, 2),
+                    'tokens_available': round(tokens_bucket.level),
+                    'cooldown': round(max(self._cooldown.get((index, model), 0.0) - now, 0.0), 2)
+                })
+            counters = dict(self._counters)
+            counters['wait_seconds'] = round(counters['wait_seconds'], 3)
+            return dict(counters, keys=len(self.keys), models=models, buckets=buckets,
+                        limits={model: {'rpm': rpm, 'tpm': tpm} for model, (rpm, tpm) in self.limits.items()})
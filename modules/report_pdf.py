@@ -0,0 +1,354 @@
+"""
+PDF报告渲染
+- 中文字体每个进程只注册一次：配置了 REPORT_FONT_PATH（TTF/TTC）时嵌入该字体，否则使用 ReportLab 内置的
+  STSong-Light（CID字体，无需字体文件）
+- 段落样式、页眉页脚、评分说明等静态内容在渲染器创建时构建一次，各份报告复用
+- 批量模式：多份报告交给常驻进程池并行渲染（每个工作进程各自初始化一次渲染器），
+  输出为多个独立文件或合并为一个PDF
+
+报告类型：
+- diagnosis: 员工诊断报告（诊断结果 diagnosis 字典）
+- scoring_report: 能力评分报告（analysis_data / scoring_results / employee_name）
+- scoring_evidence: 评估依据（employee_name / quarter / suggestions）
+"""
+import os
+import atexit
+import threading
+import multiprocessing
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Flowable, KeepTogether
+from xml.sax.saxutils import escape
+
+from modules.cohort import ABILITY_DIMENSIONS
+
+REPORT_FONT_PATH = os.getenv('REPORT_FONT_PATH')
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', min(4, os.cpu_count() or 1)))
+# 报告数少于该值时在当前进程串行渲染，进程间开销大于收益
+REPORT_PARALLEL_MIN = int(os.getenv('REPORT_PARALLEL_MIN', 8))
+
+BUILTIN_FONT = 'STSong-Light'
+EMBEDDED_FONT = 'ReportCJK'
+
+SCALE_ROWS = (('分值', '含义'), ('5', '卓越：持续超出预期，可作为标杆'), ('4', '良好：稳定达到并部分超出预期'),
+              ('3', '合格：基本达到岗位要求'), ('2', '待提升：部分达到要求，需要辅导'), ('1', '不足：明显低于岗位要求'))
+DISCLAIMER = '本报告由系统根据述职材料自动生成，评分与建议仅供参考，请结合日常表现综合判断。'
+
+_fonts = {}
+_font_lock = threading.Lock()
+
+
+def register_fonts(font_path=None):
+    """注册中文字体（同一进程内只注册一次），返回字体名"""
+    key = font_path or ''
+    with _font_lock:
+        name = _fonts.get(key)
+        if name is None:
+            if font_path:
+                name = EMBEDDED_FONT
+                pdfmetrics.registerFont(TTFont(name, font_path))
+            else:
+                name = BUILTIN_FONT
+                pdfmetrics.registerFont(UnicodeCIDFont(name))
+            _fonts[key] = name
+        return name
+
+
+def _text(value):
+    """转义为 Paragraph 可用的文本，保留换行"""
+    return escape(str(value if value is not None else '')).replace('\n', '<br/>')
+
+
+class ScoreBar(Flowable):
+    """能力评分条"""
+
+    def __init__(self, score, maximum=5, width=60 * mm, height=4 * mm):
+        super().__init__()
+        self.score = max(0.0, min(float(score or 0), maximum))
+        self.maximum = maximum
+        self.width = width
+        self.height = height
+
+    def draw(self):
+        self.canv.setFillColor(colors.HexColor('#e9ecef'))
+        self.canv.rect(0, 0, self.width, self.height, stroke=0, fill=1)
+        self.canv.setFillColor(colors.HexColor('#0d6efd'))
+        self.canv.rect(0, 0, self.width * self.score / self.maximum, self.height, stroke=0, fill=1)
+
+
+class ReportEngine:
+    """
+    报告渲染器
+
+    创建时注册字体并构建样式；render() 每次新建 flowable，可在多个线程中并发调用。
+    """
+
+    def __init__(self, font_path=None):
+        self.font = register_fonts(font_path)
+        self.styles = self._build_styles()
+        self._scale_style = self._table_style()
+        self._renderers = {
+            'diagnosis': self._diagnosis_story,
+            'scoring_report': self._scoring_report_story,
+            'scoring_evidence': self._scoring_evidence_story
+        }
+
+    def _build_styles(self):
+        font = self.font
+        return {
+            'title': ParagraphStyle('title', fontName=font, fontSize=18, leading=24, alignment=TA_CENTER,
+                                    spaceAfter=4 * mm),
+            'subtitle': ParagraphStyle('subtitle', fontName=font, fontSize=10, leading=14, alignment=TA_CENTER,
+                                       textColor=colors.HexColor('#6c757d'), spaceAfter=6 * mm),
+            'heading': ParagraphStyle('heading', fontName=font, fontSize=13, leading=18, spaceBefore=5 * mm,
+                                      spaceAfter=2 * mm, textColor=colors.HexColor('#0d6efd')),
+            'body': ParagraphStyle('body', fontName=font, fontSize=10, leading=15, wordWrap='CJK'),
+            'bullet': ParagraphStyle('bullet', fontName=font, fontSize=10, leading=15, wordWrap='CJK',
+                                     leftIndent=5 * mm, bulletIndent=1 * mm, spaceAfter=1 * mm),
+            'cell': ParagraphStyle('cell', fontName=font, fontSize=9, leading=12, wordWrap='CJK'),
+            'note': ParagraphStyle('note', fontName=font, fontSize=8, leading=11, wordWrap='CJK',
+                                   textColor=colors.HexColor('#6c757d'))
+        }
+
+    def _table_style(self, header=True):
+        commands = [
+            ('FONTNAME', (0, 0), (-1, -1), self.font),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dee2e6')),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3)
+        ]
+        if header:
+            commands += [('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f1f3f5'))]
+        return TableStyle(commands)
+
+    def static(self, name):
+        """
+        静态内容（评分说明、页尾声明）
+
+        Table/Paragraph 在排版时会记录画布与分页状态，不能跨线程共享；
+        这里只复用表格数据与样式，每份报告新建 flowable。
+        """
+        return getattr(self, f'_static_{name}')()
+
+    def _static_scale(self):
+        table = Table([list(row) for row in SCALE_ROWS], colWidths=[20 * mm, 140 * mm])
+        table.setStyle(self._scale_style)
+        return [Paragraph('评分说明', self.styles['heading']), table]
+
+    def _static_disclaimer(self):
+        return [Spacer(1, 6 * mm), Paragraph(DISCLAIMER, self.styles['note'])]
+
+    def _on_page(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFont(self.font, 8)
+        canvas.setFillColor(colors.HexColor('#6c757d'))
+        canvas.drawString(20 * mm, 12 * mm, doc.title or '')
+        canvas.drawRightString(A4[0] - 20 * mm, 12 * mm, f'第 {doc.page} 页')
+        canvas.restoreState()
+
+    def _bullets(self, items):
+        return [Paragraph(_text(item), self.styles['bullet'], bulletText='•') for item in items or [] if item]
+
+    def _info_table(self, pairs):
+        table = Table([[label, Paragraph(_text(value), self.styles['cell'])] for label, value in pairs],
+                      colWidths=[30 * mm, 130 * mm])
+        table.setStyle(self._table_style(header=False))
+        return table
+
+    def _diagnosis_story(self, data):
+        diagnosis = data.get('diagnosis', data)
+        info = diagnosis.get('employee_info') or {}
+        name = info.get('name') or '未知员工'
+        title = f'{name} 能力诊断报告'
+        story = [
+            Paragraph(_text(title), self.styles['title']),
+            Paragraph(f'生成时间：{datetime.now():%Y-%m-%d %H:%M}', self.styles['subtitle']),
+            self._info_table([('员工姓名', name), ('职位', info.get('position') or '未知'),
+                              ('评估周期', info.get('quarter') or '未知')])
+        ]
+        abilities = diagnosis.get('abilities') or {}
+        if abilities:
+            rows = [['能力维度', '评分', '']]
+            for key, label in ABILITY_DIMENSIONS:
+                if key in abilities:
+                    score = abilities.get(key)
+                    rows.append([label, score if score is not None else '-', ScoreBar(_to_float(score))])
+            table = Table(rows, colWidths=[40 * mm, 20 * mm, 100 * mm])
+            table.setStyle(self._table_style())
+            story += [Paragraph('能力评分', self.styles['heading']), table]
+        for key, heading in (('strengths', '核心优势'), ('weaknesses', '待发展领域'),
+                             ('growth_suggestions', '成长建议'), ('manager_suggestions', '管理者建议')):
+            items = diagnosis.get(key)
+            if items:
+                story.append(KeepTogether([Paragraph(heading, self.styles['heading'])] + self._bullets(items)))
+        story += self.static('scale') + self.static('disclaimer')
+        return title, story
+
+    def _scoring_report_story(self, data):
+        name = data.get('employee_name') or ''
+        title = f'{name} 能力评分报告' if name else '能力评分报告'
+        story = [Paragraph(_text(title), self.styles['title']),
+                 Paragraph(f'生成时间：{datetime.now():%Y-%m-%d %H:%M}', self.styles['subtitle'])]
+        analysis = data.get('analysis_data') or {}
+        for key, heading in (('core_strengths', '核心优势'), ('areas_for_development', '待发展领域')):
+            if analysis.get(key):
+                story += [Paragraph(heading, self.styles['heading']),
+                          Paragraph(_text(analysis[key]), self.styles['body'])]
+        rows = data.get('scoring_results') or []
+        if rows:
+            columns = data.get('column_order') or list(rows[0].keys())
+            cell = self.styles['cell']
+            table_rows = [[Paragraph(_text(column), cell) for column in columns]]
+            table_rows += [[Paragraph(_text(row.get(column, '')), cell) for column in columns] for row in rows]
+            table = Table(table_rows, colWidths=[170 * mm / len(columns)] * len(columns), repeatRows=1)
+            table.setStyle(self._table_style())
+            story += [Paragraph('能力评分明细', self.styles['heading']), table]
+        story += self.static('scale') + self.static('disclaimer')
+        return title, story
+
+    def _scoring_evidence_story(self, data):
+        name = data.get('employee_name') or ''
+        title = f'{name} 评估依据' if name else '评估依据'
+        story = [Paragraph(_text(title), self.styles['title']),
+                 Paragraph(_text(data.get('quarter') or ''), self.styles['subtitle'])]
+        for suggestion in data.get('suggestions') or []:
+            story.append(KeepTogether([
+                Paragraph(_text(suggestion.get('ability') or '未知能力'), self.styles['heading']),
+                Paragraph('评估依据：' + _text(suggestion.get('evidence') or '无评估依据'), self.styles['body']),
+                Spacer(1, 2 * mm),
+                Paragraph('原文引用：' + _text(suggestion.get('quote') or '无原文引用'), self.styles['note'])
+            ]))
+        story += self.static('disclaimer')
+        return title, story
+
+    def render(self, kind, data, output=None):
+        """渲染一份报告；output 为文件路径或可写文件对象，为空时返回PDF字节"""
+        renderer = self._renderers.get(kind)
+        if renderer is None:
+            raise ValueError(f'未知的报告类型: {kind}')
+        title, story = renderer(data or {})
+        target = output if output is not None else BytesIO()
+        doc = SimpleDocTemplate(target, pagesize=A4, title=title, author='述职分析系统',
+                                leftMargin=20 * mm, rightMargin=20 * mm, topMargin=18 * mm, bottomMargin=20 * mm)
+        doc.build(story, onFirstPage=self._on_page, onLaterPages=self._on_page)
+        if output is None:
+            return target.getvalue()
+        return output
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# ---------- 进程级渲染器与批量渲染 ----------
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """当前进程的渲染器，首次使用时创建（字体与静态内容只准备一次）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ReportEngine(REPORT_FONT_PATH)
+        return _engine
+
+
+def render(kind, data, output=None):
+    return get_engine().render(kind, data, output)
+
+
+def _render_job(job):
+    """在工作进程中渲染一份报告：job 为 (类型, 数据, 输出路径或None)"""
+    kind, data, path = job
+    result = get_engine().render(kind, data, path)
+    return path if path else result
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取常驻进程池，首次使用时创建；工作进程以 spawn 方式启动，启动时即初始化渲染器"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS, initializer=get_engine,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def render_batch(kind, items, output_dir=None, filenames=None, merge=False, workers=None):
+    """
+    批量渲染多份同类报告
+
+    - output_dir 不为空：每份报告写入 output_dir/filenames[i]，返回文件路径列表
+    - merge=True：返回合并后的单个PDF字节
+    - 否则返回每份报告的PDF字节列表
+    报告数达到 REPORT_PARALLEL_MIN 且 workers（默认 REPORT_WORKERS）大于1时使用进程池并行渲染；
+    进程池大小由 REPORT_WORKERS 决定，workers 只影响是否并行及分块大小。
+    """
+    items = list(items)
+    paths = [None] * len(items)
+    if output_dir and not merge:
+        os.makedirs(output_dir, exist_ok=True)
+        names = filenames or [f'report_{index + 1}.pdf' for index in range(len(items))]
+        paths = [os.path.join(output_dir, name) for name in names]
+    jobs = [(kind, item, path) for item, path in zip(items, paths)]
+
+    workers = REPORT_WORKERS if workers is None else workers
+    if workers <= 1 or len(jobs) < REPORT_PARALLEL_MIN:
+        results = [_render_job(job) for job in jobs]
+    else:
+        try:
+            # 每批若干份，减少进程间往返
+            chunksize = max(1, len(jobs) // (workers * 4))
+            results = list(get_pool().map(_render_job, jobs, chunksize=chunksize))
+        except BrokenProcessPool as e:
+            print(f"报告渲染进程池异常，回退串行渲染: {str(e)}")
+            shutdown_pool()
+            results = [_render_job(job) for job in jobs]
+
+    if merge:
+        return merge_pdfs(results)
+    return results
+
+
+def merge_pdfs(documents):
+    """合并多个PDF（字节）为一个"""
+    writer = PyPDF2.PdfWriter()
+    for document in documents:
+        writer.append(BytesIO(document))
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
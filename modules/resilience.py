@@ -0,0 +1,164 @@
+"""
+上游调用的容错组件
+- CircuitBreaker: 熔断器。连续失败达到阈值后熔断，熔断期间调用直接失败（毫秒级进入降级逻辑）；
+  冷却时间过后进入半开状态，只放行少量探测请求，探测成功则恢复，失败则重新熔断并延长冷却时间
+- RetryPolicy: 带抖动的指数退避重试，只重试可重试的错误，且总耗时不超过调用的截止时间
+- LatencyTracker: 记录最近的调用耗时，用于确定对冲请求的发起时机
+"""
+import time
+import random
+import threading
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+        if not breaker.allow():
+            raise ...            # 熔断中，直接降级
+        try:
+            call()
+        except Exception:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0, half_open_max_calls=1,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._current_reset = reset_timeout
+        self._probes = 0
+        self._rejected = 0
+        self._trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self._current_reset:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self):
+        """是否放行本次调用；半开状态下只放行 half_open_max_calls 个探测请求"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def retry_after(self):
+        """距离下一次允许探测的秒数"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(self._current_reset - (self._clock() - self._opened_at), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._current_reset = self.reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                # 探测失败：重新熔断，冷却时间翻倍
+                self._current_reset = min(self._current_reset * 2, self.max_reset_timeout)
+                self._trip()
+                return
+            self._failures += 1
+            if state == CLOSED and self._failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._failures = 0
+        self._trips += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._failures,
+                'reset_timeout': self._current_reset,
+                'trips': self._trips,
+                'rejected': self._rejected
+            }
+
+
+class RetryPolicy:
+    """带完全抖动（full jitter）的指数退避：第n次重试前等待 uniform(0, min(max_delay, base_delay * 2^n)) 秒"""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max(int(max_attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def is_retryable_status(self, status_code):
+        return status_code in self.retry_statuses
+
+    def backoff(self, attempt):
+        """第 attempt 次（从0开始）失败后的等待时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def next_delay(self, attempt, deadline, clock=time.monotonic):
+        """
+        决定是否继续重试：返回等待秒数，不再重试时返回None
+
+        等待后剩余时间不足以完成一次调用（至少保留 base_delay）时放弃重试。
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        if deadline is not None and clock() + delay + self.base_delay >= deadline:
+            return None
+        return delay
+
+
+class LatencyTracker:
+    """按业务记录最近若干次成功调用的耗时"""
+
+    def __init__(self, window=100):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, latency):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def percentile(self, key, q, min_samples=20):
+        """最近耗时的第 q 百分位数，样本不足时返回None"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(int(len(samples) * q / 100), len(samples) - 1)]
@@ -0,0 +1,176 @@
+"""
+分析结果持久化
+诊断、打分建议、校对的结果按输入内容去重后写入SQLite（WAL），返回稳定的结果ID，
+导出、群体分析等接口按ID读取，无需重新调用大模型，也无需前端回传整段结果JSON。
+"""
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+
+RESULT_KINDS = ('diagnosis', 'scoring_suggestion', 'verify')
+
+
+def make_result_key(kind, **inputs):
+    """由结果类型和输入内容生成去重键，长文本先单独哈希"""
+    normalized = {}
+    for name, value in inputs.items():
+        if isinstance(value, str) and len(value) > 256:
+            value = 'sha256:' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+        normalized[name] = value
+    raw = json.dumps({'kind': kind, 'inputs': normalized}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResultStore:
+    """
+    结果存储
+
+    同一 (类型, 输入) 只保存一条记录，重新生成时覆盖内容、保留原ID；
+    员工、评估周期、能力模型建有索引，便于按人或按周期查询。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                input_key TEXT NOT NULL,
+                employee TEXT,
+                quarter TEXT,
+                ability_model TEXT,
+                source TEXT,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_results_input ON results(kind, input_key)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_employee ON results(employee, quarter)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_quarter ON results(quarter, ability_model)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_model ON results(ability_model, quarter)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_kind ON results(kind, updated_at)')
+        self._conn.commit()
+
+    def save(self, kind, input_key, payload, employee=None, quarter=None, ability_model=None, source=None):
+        """保存结果并返回结果ID"""
+        if kind not in RESULT_KINDS:
+            raise ValueError(f'未知的结果类型: {kind}')
+        now = time.time()
+        body = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            row = self._conn.execute('SELECT id FROM results WHERE kind = ? AND input_key = ?',
+                                     (kind, input_key)).fetchone()
+            if row:
+                result_id = row['id']
+                self._conn.execute(
+                    'UPDATE results SET employee = ?, quarter = ?, ability_model = ?, source = ?, payload = ?, '
+                    'updated_at = ? WHERE id = ?',
+                    (employee, quarter, ability_model, source, body, now, result_id)
+                )
+            else:
+                result_id = uuid.uuid4().hex
+                self._conn.execute(
+                    'INSERT INTO results (id, kind, input_key, employee, quarter, ability_model, source, payload, '
+                    'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (result_id, kind, input_key, employee, quarter, ability_model, source, body, now, now)
+                )
+            self._conn.commit()
+        return result_id
+
+    def get(self, result_id, kind=None):
+        """按ID读取结果，不存在（或类型不符）时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM results WHERE id = ?', (result_id,)).fetchone()
+        if row is None or (kind and row['kind'] != kind):
+            return None
+        return _row_to_dict(row)
+
+    def get_many(self, result_ids, kind=None):
+        """批量读取，按传入ID的顺序返回存在的结果"""
+        result_ids = list(dict.fromkeys(result_ids))
+        rows = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(result_ids), 500):
+                batch = result_ids[start:start + 500]
+                for row in self._conn.execute(
+                        f'SELECT * FROM results WHERE id IN ({", ".join("?" * len(batch))})', batch):
+                    rows[row['id']] = row
+        return [_row_to_dict(rows[result_id]) for result_id in result_ids
+                if result_id in rows and (not kind or rows[result_id]['kind'] == kind)]
+
+    def query(self, kind=None, employee=None, quarter=None, ability_model=None, limit=50, offset=0):
+        """按条件查询结果摘要（不含结果内容），按更新时间倒序"""
+        conditions, params = [], []
+        for column, value in (('kind', kind), ('employee', employee), ('quarter', quarter),
+                              ('ability_model', ability_model)):
+            if value:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM results {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT id, kind, employee, quarter, ability_model, source, created_at, updated_at '
+                f'FROM results {where} ORDER BY updated_at DESC LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def iter_results(self, kind=None, employee=None, quarter=None, ability_model=None, result_ids=None,
+                     page_size=200):
+        """
+        逐条读取结果（含内容），按更新时间从新到旧；分页查询，每页读完即释放，
+        导出大量结果时内存占用只与页大小有关。给出 result_ids 时按其顺序读取。
+        """
+        if result_ids is not None:
+            result_ids = list(dict.fromkeys(result_ids))
+            for start in range(0, len(result_ids), page_size):
+                yield from self.get_many(result_ids[start:start + page_size], kind=kind)
+            return
+        conditions, params = [], []
+        for column, value in (('kind', kind), ('employee', employee), ('quarter', quarter),
+                              ('ability_model', ability_model)):
+            if value:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        cursor = None
+        while True:
+            # 以 (更新时间, ID) 为游标翻页，结果在导出期间被更新也不会重复或遗漏其他记录
+            page_conditions, page_params = list(conditions), list(params)
+            if cursor is not None:
+                page_conditions.append('(updated_at < ? OR (updated_at = ? AND id < ?))')
+                page_params += [cursor[0], cursor[0], cursor[1]]
+            where = f'WHERE {" AND ".join(page_conditions)}' if page_conditions else ''
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT * FROM results {where} ORDER BY updated_at DESC, id DESC LIMIT ?',
+                    page_params + [page_size]
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _row_to_dict(row)
+            cursor = (rows[-1]['updated_at'], rows[-1]['id'])
+
+    def delete(self, result_id):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM results WHERE id = ?', (result_id,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+
+def _row_to_dict(row):
+    result = dict(row)
+    result.pop('input_key', None)
+    result['payload'] = json.loads(result['payload'])
+    return result
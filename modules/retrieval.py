@@ -0,0 +1,121 @@
+"""
+本地词法检索
+文档按页/幻灯片边界切成短片段，建立 BM25 倒排索引（中文按相邻二字切分，英文按单词，
+不依赖分词器和网络）。每个评价项只检索最相关的若干片段送入大模型，
+同时作为评估依据的原文引用。
+同一文档的索引按内容哈希缓存，只构建一次。
+"""
+import re
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from modules.chunking import chunk_text
+
+PASSAGE_TOKENS = 200
+
+_TERM = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z]+|\d+(?:\.\d+)?')
+
+
+def tokenize(text):
+    """中文连续片段切成相邻二字（单字片段保留单字），英文单词与数字整体保留"""
+    terms = []
+    for run in _TERM.findall(text.lower()):
+        if '\u3400' <= run[0] <= '\u9fff':
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+class BM25Index:
+    """BM25 倒排索引"""
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = list(passages)
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)  # 词 -> [(片段序号, 词频)]
+        self._lengths = []
+        for index, passage in enumerate(self.passages):
+            counts = Counter(tokenize(passage))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((index, tf))
+        total = len(self.passages)
+        self._avg_length = (sum(self._lengths) / total) if total else 0.0
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    @classmethod
+    def from_text(cls, text, passage_tokens=PASSAGE_TOKENS):
+        return cls(chunk_text(text, passage_tokens))
+
+    def search(self, query, top_k=3):
+        """返回 [(片段序号, 得分)]，按得分降序，不含零分片段"""
+        scores = defaultdict(float)
+        k1, b, avg = self.k1, self.b, self._avg_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self._postings[term]:
+                norm = k1 * (1 - b + b * self._lengths[index] / avg)
+                scores[index] += idf * tf * (k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+
+class IndexCache:
+    """按文档内容哈希缓存索引（LRU）"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, passage_tokens=PASSAGE_TOKENS):
+        key = (hashlib.sha256(text.encode('utf-8')).hexdigest(), passage_tokens)
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+        # 构建索引不持锁，同一文档并发构建时以先写入的为准
+        index = BM25Index.from_text(text, passage_tokens)
+        with self._lock:
+            index = self._entries.setdefault(key, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+
+INDEX_CACHE = IndexCache()
+
+
+def retrieve_evidence(text, queries, top_k=3, snippet_chars=200):
+    """
+    为每个查询检索证据片段
+
+    返回 (索引, {查询: [{'passage': 片段序号, 'score': 得分, 'text': 片段摘录}]})
+    """
+    index = INDEX_CACHE.get(text)
+    evidence = {}
+    for query in queries:
+        hits = []
+        for passage, score in index.search(query, top_k):
+            content = index.passages[passage].strip()
+            hits.append({
+                'passage': passage + 1,
+                'score': round(score, 3),
+                'text': content if len(content) <= snippet_chars else content[:snippet_chars] + '...'
+            })
+        evidence[query] = hits
+    return index, evidence
@@ -0,0 +1,239 @@
+"""
+评分表解析
+以只读流式模式逐行读取全部工作表（不构建整个工作簿的对象图），
+识别每张表的表头行以及考核项、类别、说明、权重、分值等列，输出结构化的评分体系：
+
+    {
+        'version': 解析格式版本,
+        'sheets': [{
+            'name': 工作表名,
+            'header_row': 表头所在行号（从1开始，未识别到表头为None）,
+            'columns': [{'index': 列序号（从0开始）, 'name': 表头文字, 'role': 列类型}],
+            'weight_total': 权重合计（无权重列为None；百分比权重统一为小数，合计约为1）,
+            'items': [{'row', 'name', 'category', 'description', 'weight', 'max_score', 'score', 'text'}]
+        }]
+    }
+
+列类型为 item / category / description / weight / max_score / score / index / other。
+text 为整行非空单元格以空格拼接的文本，与原先 score_items 的格式一致。
+结果可JSON序列化，由解析缓存按文件内容哈希缓存。
+"""
+import re
+import openpyxl
+
+# 解析结果格式发生变化时递增，用于让旧的解析缓存失效
+SCHEMA_VERSION = 2
+
+# 只在每张表的前若干行中寻找表头
+HEADER_SCAN_ROWS = 10
+
+# (列类型, 表头关键字)；按顺序匹配：“评分标准”属于说明列，“满分”需先于“分数”判断
+_COLUMN_ROLES = [
+    ('index', re.compile(r'^(序号|编号|no\.?|#)$', re.IGNORECASE)),
+    ('weight', re.compile(r'权重|占比|比重|weight', re.IGNORECASE)),
+    ('description', re.compile(r'说明|描述|标准|要求|定义|细则|desc', re.IGNORECASE)),
+    ('max_score', re.compile(r'满分|分值|总分|最高分|max', re.IGNORECASE)),
+    ('score', re.compile(r'得分|评分|分数|打分|score', re.IGNORECASE)),
+    ('category', re.compile(r'类别|分类|模块|一级|category', re.IGNORECASE)),
+    ('item', re.compile(r'考核项|评估项|指标|项目|维度|能力|名称|^项$|item|name', re.IGNORECASE)),
+]
+_TOTAL_ROW = re.compile(r'^\s*(合计|总计|小计|总分|total)\s*$', re.IGNORECASE)
+_NUMBER = re.compile(r'^\s*([-+]?\d+(?:\.\d+)?)\s*(%|分)?\s*$')
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _to_number(value):
+    """
+    将 30 / 0.3 / '30%' / '10分' 转为数值，无法识别时返回None
+
+    '30%' 按百分比转为 0.3，与百分比格式的单元格（data_only 读取时为 0.3）一致。
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.match(_cell_text(value))
+    if not match:
+        return None
+    number = float(match.group(1))
+    return number / 100 if match.group(2) == '%' else number
+
+
+def _normalize_weights(items):
+    """权重按百分点填写（如 30、20、50，合计约100）时统一换算为小数，与百分比单元格的刻度一致"""
+    weights = [item['weight'] for item in items if item['weight'] is not None]
+    if not weights or abs(sum(weights) - 100) > 0.5 or any(weight > 100 for weight in weights):
+        return
+    for item in items:
+        if item['weight'] is not None:
+            item['weight'] = round(item['weight'] / 100, 6)
+
+
+def _is_total_row(row):
+    return any(_TOTAL_ROW.match(_cell_text(value)) for value in row if isinstance(value, str))
+
+
+def _column_role(header):
+    for role, pattern in _COLUMN_ROLES:
+        if pattern.search(header):
+            return role
+    return None
+
+
+def _header_score(row):
+    """表头行评分：命中关键字的文本单元格数；含数值单元格的行不视为表头"""
+    hits = 0
+    texts = 0
+    for value in row:
+        if value is None or _cell_text(value) == '':
+            continue
+        if _to_number(value) is not None:
+            return 0
+        texts += 1
+        if _column_role(_cell_text(value)):
+            hits += 1
+    return hits if texts >= 2 else 0
+
+
+def _build_columns(header):
+    columns = []
+    used = set()
+    for index, value in enumerate(header):
+        name = _cell_text(value)
+        if not name:
+            continue
+        role = _column_role(name) or 'other'
+        # 同一类型出现多列时只有第一列生效，其余按普通列处理
+        if role in used and role != 'other':
+            role = 'other'
+        used.add(role)
+        columns.append({'index': index, 'name': name, 'role': role})
+    return columns
+
+
+def _detect_weight_column(columns, rows):
+    """表头未标明权重列时，按数据识别：某个数值列合计为100或1"""
+    if any(column['role'] == 'weight' for column in columns):
+        return
+    for column in columns:
+        if column['role'] not in ('other', 'score', 'max_score'):
+            continue
+        values = [_to_number(row[column['index']]) for row in rows if column['index'] < len(row)]
+        numbers = [value for value in values if value is not None]
+        if len(numbers) < 2 or len(numbers) < len(values) * 0.8:
+            continue
+        total = sum(numbers)
+        if abs(total - 100) <= 0.5 or abs(total - 1) <= 0.01:
+            column['role'] = 'weight'
+            return
+
+
+def _parse_sheet(ws):
+    rows = ws.iter_rows(values_only=True)
+    head = []
+    for row in rows:
+        head.append(row)
+        if len(head) >= HEADER_SCAN_ROWS:
+            break
+
+    header_index, best = None, 0
+    for index, row in enumerate(head):
+        score = _header_score(row)
+        if score > best:
+            header_index, best = index, score
+    if header_index is None:
+        # 没有关键字时，首个非空且全为文本的行仍视为表头（与原先跳过第一行的行为一致）
+        for index, row in enumerate(head):
+            if any(_cell_text(value) for value in row):
+                if all(_to_number(value) is None for value in row if _cell_text(value)):
+                    header_index = index
+                break
+
+    if header_index is not None:
+        columns = _build_columns(head[header_index])
+    else:
+        # 无表头时各列按普通列处理，仍可按数据识别权重列
+        width = max((len(row) for row in head), default=0)
+        columns = [{'index': index, 'name': '', 'role': 'other'} for index in range(width)]
+    start = header_index + 1 if header_index is not None else 0
+    data_rows = []
+    for offset, row in enumerate(head[start:]):
+        data_rows.append((start + offset + 1, row))
+    for row_number, row in enumerate(rows, len(head) + 1):
+        data_rows.append((row_number, row))
+
+    _detect_weight_column(columns, [row for _, row in data_rows
+                                    if any(_cell_text(value) for value in row) and not _is_total_row(row)])
+    roles = {column['role']: column['index'] for column in columns if column['role'] != 'other'}
+
+    def field(row, role):
+        index = roles.get(role)
+        return row[index] if index is not None and index < len(row) else None
+
+    items = []
+    category = None
+    for row_number, row in data_rows:
+        cells = [value for value in row if value]
+        if not cells:
+            continue
+        # 合并单元格在只读模式下只有第一行有值，类别向下填充
+        if 'category' in roles:
+            category = _cell_text(field(row, 'category')) or category
+        name = _cell_text(field(row, 'item'))
+        if not name:
+            name = next((_cell_text(value) for value in row
+                         if _cell_text(value) and _to_number(value) is None), '')
+        if _TOTAL_ROW.match(name):
+            continue
+        items.append({
+            'row': row_number,
+            'name': name,
+            'category': category,
+            'description': _cell_text(field(row, 'description')) or None,
+            'weight': _to_number(field(row, 'weight')),
+            'max_score': _to_number(field(row, 'max_score')),
+            'score': _to_number(field(row, 'score')),
+            'text': ' '.join(str(value) for value in cells)
+        })
+
+    _normalize_weights(items)
+    weights = [item['weight'] for item in items if item['weight'] is not None]
+    return {
+        'name': ws.title,
+        'header_row': header_index + 1 if header_index is not None else None,
+        'columns': columns,
+        'weight_total': round(sum(weights), 4) if weights else None,
+        'items': items
+    }
+
+
+def parse_scoring_table(path):
+    """流式解析评分表的全部工作表，返回结构化的评分体系（见模块说明）"""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = []
+        for ws in wb.worksheets:
+            # 部分工具生成的文件记录的表格范围不准确，按实际内容读取
+            ws.reset_dimensions()
+            sheet = _parse_sheet(ws)
+            if sheet['items']:
+                sheets.append(sheet)
+        return {'version': SCHEMA_VERSION, 'sheets': sheets}
+    finally:
+        wb.close()
+
+
+def score_items(schema):
+    """评分体系中全部考核项的文本（原 score_items 列表格式）"""
+    return [item['text'] for sheet in schema['sheets'] for item in sheet['items']]
+
+
+def summarize(schema):
+    """各工作表的表头识别结果与考核项数量（不含考核项明细）"""
+    return [dict({key: value for key, value in sheet.items() if key != 'items'}, item_count=len(sheet['items']))
+            for sheet in schema['sheets']]
@@ -0,0 +1,112 @@
+"""
+Server-Sent Events 流式响应工具
+将大模型的增量输出转换为SSE事件：
+- progress: 调用大模型之前的准备阶段（如长文档分段摘要） {"stage": ..., "message": ...}
+- delta: 增量文本 {"text": ...}
+- item:  数组字段中新完成的条目 {"field": ..., "index": ..., "value": ...}
+- done:  最终结果（与对应非流式接口的返回结构一致），附带耗时统计
+并记录首字耗时（time to first token）用于监控。
+"""
+import json
+import time
+import threading
+from collections import defaultdict, deque
+
+from modules.json_stream import JsonArrayStreamer, JsonObjectExtractor
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # 关闭反向代理缓冲，保证事件即时下发
+}
+
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+class StreamTimings:
+    """按接口统计流式响应的首字耗时与总耗时（保留最近 window 次）"""
+
+    def __init__(self, window=200):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, name, first_token_ms, total_ms):
+        with self._lock:
+            self._samples[name].append((first_token_ms, total_ms))
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for name, samples in self._samples.items():
+                first = sorted(s[0] for s in samples if s[0] is not None)
+                total = sorted(s[1] for s in samples)
+                result[name] = {
+                    'count': len(samples),
+                    'first_token_ms_p50': _percentile(first, 50),
+                    'first_token_ms_p95': _percentile(first, 95),
+                    'total_ms_p50': _percentile(total, 50),
+                    'total_ms_p95': _percentile(total, 95)
+                }
+            return result
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+STREAM_TIMINGS = StreamTimings()
+
+
+def stream_llm_events(name, open_stream, array_keys, finalize, fallback, prepare=None):
+    """
+    生成SSE事件流
+
+    prepare() 在生成器内执行（先下发 progress 事件，响应头已发出），返回值记为 context，
+    用于长文档压缩等可能调用大模型的耗时准备；
+    open_stream(context) 返回增量文本迭代器；finalize(完整文本, context) 返回最终结果字典，
+    解析失败时抛出异常；fallback(错误信息) 返回备用结果字典。
+    准备、流式调用或解析中任一步出错都走 fallback，客户端总能收到 done 事件。
+
+    输出中的JSON对象一闭合就解析并下发 done，不等模型输出其后的代码块结束标记或说明文字；
+    剩余输出在 done 之后读完（不再下发），以便写入响应缓存并结算token用量。
+    """
+    started = time.monotonic()
+    first_token_ms = None
+    streamer = JsonArrayStreamer(array_keys)
+    extractor = JsonObjectExtractor()
+    deltas = None
+    try:
+        context = None
+        if prepare is not None:
+            yield sse_event('progress', {'stage': 'prepare', 'message': '正在整理文档'})
+            context = prepare()
+        deltas = iter(open_stream(context))
+        for delta in deltas:
+            if first_token_ms is None:
+                first_token_ms = round((time.monotonic() - started) * 1000, 1)
+            yield sse_event('delta', {'text': delta})
+            for field, index, value in streamer.feed(delta):
+                yield sse_event('item', {'field': field, 'index': index, 'value': value})
+            if extractor.feed(delta):
+                break
+        result = finalize(streamer.text, context)
+    except Exception as e:
+        print(f"[STREAM] {name} 流式调用失败，使用备用结果: {str(e)}")
+        result = fallback(str(e))
+
+    total_ms = round((time.monotonic() - started) * 1000, 1)
+    STREAM_TIMINGS.record(name, first_token_ms, total_ms)
+    print(f"[STREAM] {name} 首字耗时: {first_token_ms if first_token_ms is not None else '-'}ms, 总耗时: {total_ms}ms")
+    result['timing'] = {'first_token_ms': first_token_ms, 'total_ms': total_ms}
+    yield sse_event('done', result)
+
+    if deltas is not None:
+        try:
+            for _ in deltas:
+                pass
+        except Exception as e:
+            print(f"[STREAM] {name} 结果下发后读取剩余输出失败: {str(e)}")
@@ -0,0 +1,429 @@
+"""
+语音转写
+录音先解码为 16kHz 单声道 PCM，按静音切分为约30秒的分段，各段并发转写后按时间顺序拼接，
+分段内的时间戳加上分段起点换算为整段录音的时间。
+录音文件的解码与切分以流式进行（modules.audio_ingest），上传过程中即可开始转写。
+
+转写后端可插拔（register_backend 注册）：
+- faster_whisper: 本地离线模型（CPU，需安装 faster-whisper 并准备模型文件），
+  分段交给常驻进程池，每个工作进程只加载一次模型
+- dashscope: 阿里云实时语音识别（paraformer），分段以线程并发调用
+"""
+import os
+import io
+import wave
+import atexit
+import tempfile
+import threading
+import multiprocessing
+import subprocess
+import contextvars
+from http import HTTPStatus
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# 转写结果格式发生变化时递增，用于让旧的解析缓存失效
+TRANSCRIPT_VERSION = 1
+
+SAMPLE_RATE = 16000
+
+TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'dashscope')
+TRANSCRIBE_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS', min(4, os.cpu_count() or 1)))
+# 云端后端同时转写的分段数（专用线程池，长录音的上百个分段不会占满流水线线程池）
+TRANSCRIBE_REMOTE_CONCURRENCY = int(os.getenv('TRANSCRIBE_REMOTE_CONCURRENCY', 4))
+# 分段目标时长与上限（秒）：达到目标时长后在下一处足够长的静音处切分，超过上限时在最安静处强制切分
+TRANSCRIBE_CHUNK_SECONDS = float(os.getenv('TRANSCRIBE_CHUNK_SECONDS', 30))
+TRANSCRIBE_MAX_CHUNK_SECONDS = float(os.getenv('TRANSCRIBE_MAX_CHUNK_SECONDS', 60))
+TRANSCRIBE_MIN_SILENCE_MS = int(os.getenv('TRANSCRIBE_MIN_SILENCE_MS', 400))
+TRANSCRIBE_LANGUAGE = os.getenv('TRANSCRIBE_LANGUAGE', 'zh')
+# 本地模型：模型规格（tiny/base/small/medium）或本地模型目录
+TRANSCRIBE_MODEL = os.getenv('TRANSCRIBE_MODEL', 'small')
+TRANSCRIBE_COMPUTE_TYPE = os.getenv('TRANSCRIBE_COMPUTE_TYPE', 'int8')
+TRANSCRIBE_BEAM_SIZE = int(os.getenv('TRANSCRIBE_BEAM_SIZE', 1))
+# 每个工作进程的推理线程数，默认按工作进程数均分CPU
+TRANSCRIBE_CPU_THREADS = int(os.getenv('TRANSCRIBE_CPU_THREADS', max(1, (os.cpu_count() or 1) // TRANSCRIBE_WORKERS)))
+DASHSCOPE_ASR_MODEL = os.getenv('DASHSCOPE_ASR_MODEL', 'paraformer-realtime-v2')
+AUDIO_FFMPEG = os.getenv('AUDIO_FFMPEG', 'ffmpeg')
+
+FRAME_MS = 30
+# 低于该电平（dBFS）的帧总是视为静音
+SILENCE_DBFS = -55.0
+
+
+# ---------- 解码 ----------
+
+def decode_audio(path, sample_rate=SAMPLE_RATE):
+    """解码为单声道 int16 PCM（numpy数组）：PCM 编码的 WAV 直接读取，其他格式交给 ffmpeg"""
+    if path.lower().endswith('.wav'):
+        try:
+            with wave.open(path, 'rb') as wav:
+                return _read_wav(wav, sample_rate)
+        except wave.Error:
+            # 浮点、ADPCM 等非PCM编码的WAV
+            pass
+    return _ffmpeg_decode(path, sample_rate)
+
+
+def _read_wav(wav, sample_rate):
+    channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+    samples = pcm_to_float(wav.readframes(wav.getnframes()), width, channels)
+    return to_pcm16(resample(samples, rate, sample_rate))
+
+
+def pcm_to_float(raw, width, channels=1, is_float=False):
+    """整数（或32位浮点）PCM 转为 int16 量程的单声道浮点采样"""
+    if is_float:
+        samples = np.frombuffer(raw, dtype='<f4') * 32768
+    elif width == 1:
+        samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128
+        samples *= 256
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32)
+    elif width == 3:
+        bytes3 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        samples = (bytes3[:, 0].astype(np.int32) | (bytes3[:, 1].astype(np.int32) << 8)
+                   | (bytes3[:, 2].astype(np.int8).astype(np.int32) << 16)).astype(np.float32) / 256
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 65536
+    else:
+        raise wave.Error(f'不支持的采样位宽: {width}')
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def _ffmpeg_decode(path, sample_rate):
+    try:
+        completed = subprocess.run(
+            [AUDIO_FFMPEG, '-nostdin', '-v', 'error', '-i', path, '-f', 's16le', '-ac', '1',
+             '-ar', str(sample_rate), '-'],
+            capture_output=True, check=False
+        )
+    except FileNotFoundError:
+        raise ValueError(f'解码 {os.path.splitext(path)[1]} 格式需要 ffmpeg（可通过 AUDIO_FFMPEG 指定路径）')
+    if completed.returncode != 0:
+        raise ValueError(f'音频解码失败: {completed.stderr.decode("utf-8", "replace").strip()}')
+    return np.frombuffer(completed.stdout, dtype='<i2')
+
+
+def resample(samples, rate, target_rate):
+    """线性插值重采样；降采样前先做滑动平均，抑制高频混叠"""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if rate > target_rate:
+        width = int(round(rate / target_rate))
+        if width > 1:
+            samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode='same')
+    count = int(len(samples) * target_rate / rate)
+    positions = np.arange(count, dtype=np.float64) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def to_pcm16(samples):
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+
+
+def to_wav_bytes(samples, sample_rate=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+    return buffer.getvalue()
+
+
+# ---------- 静音切分 ----------
+
+def frame_energy(samples, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+    """逐帧能量（dBFS），不足一帧的尾部不计"""
+    frame = int(sample_rate * frame_ms / 1000)
+    count = len(samples) // frame
+    energy = np.empty(count, dtype=np.float32)
+    # 分块换算为浮点，长录音不必整体复制一份
+    block = 2000
+    for start in range(0, count, block):
+        end = min(start + block, count)
+        frames = samples[start * frame:end * frame].astype(np.float32).reshape(end - start, frame) / 32768
+        energy[start:end] = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    return energy
+
+
+def silence_threshold(energy):
+    """
+    按录音自身的底噪与语音电平确定静音阈值，不依赖录音音量；
+    几乎没有停顿（动态范围不足）时只有低于 SILENCE_DBFS 的帧算静音，整体都很安静时全部算静音
+    """
+    floor, level = np.percentile(energy, 5), np.percentile(energy, 95)
+    if level < SILENCE_DBFS:
+        return level + 1
+    if level - floor < 10:
+        return min(floor, SILENCE_DBFS)
+    return floor + max(6.0, (level - floor) * 0.3)
+
+
+def split_on_silence(samples, sample_rate=SAMPLE_RATE, target_seconds=None, max_seconds=None,
+                     min_silence_ms=None, frame_ms=FRAME_MS):
+    """
+    按静音切分，返回各分段的 (起始采样, 结束采样)
+
+    分段达到目标时长后，在其后第一处不短于 min_silence_ms 的静音中点切分；
+    到上限仍无足够长的静音时，在目标时长与上限之间能量最低的帧处切分。整段都是静音的分段丢弃。
+    """
+    target_seconds = TRANSCRIBE_CHUNK_SECONDS if target_seconds is None else target_seconds
+    max_seconds = TRANSCRIBE_MAX_CHUNK_SECONDS if max_seconds is None else max_seconds
+    min_silence_ms = TRANSCRIBE_MIN_SILENCE_MS if min_silence_ms is None else min_silence_ms
+    frame = int(sample_rate * frame_ms / 1000)
+    energy = frame_energy(samples, sample_rate, frame_ms)
+    count = len(energy)
+    if count == 0:
+        return [(0, len(samples))] if len(samples) else []
+    silent = energy < silence_threshold(energy)
+
+    # 静音区间（帧序号，左闭右开），只保留足够长的
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+    min_frames = max(1, int(min_silence_ms / frame_ms))
+    gaps = [(start, end) for start, end in zip(edges[::2], edges[1::2]) if end - start >= min_frames]
+
+    target_frames = max(1, int(target_seconds * 1000 / frame_ms))
+    max_frames = max(target_frames, int(max_seconds * 1000 / frame_ms))
+    cuts = []
+    start, gap_index = 0, 0
+    while count - start > max_frames:
+        while gap_index < len(gaps) and (gaps[gap_index][0] + gaps[gap_index][1]) // 2 < start + target_frames:
+            gap_index += 1
+        if gap_index < len(gaps) and (gaps[gap_index][0] + gaps[gap_index][1]) // 2 <= start + max_frames:
+            cut = (gaps[gap_index][0] + gaps[gap_index][1]) // 2
+        else:
+            window = energy[start + target_frames:start + max_frames]
+            cut = start + target_frames + int(np.argmin(window))
+        cuts.append(cut)
+        start = cut
+
+    spans = []
+    for begin, end in zip([0] + cuts, cuts + [count]):
+        if silent[begin:end].all():
+            continue
+        spans.append((int(begin) * frame, int(end) * frame if end < count else len(samples)))
+    return spans
+
+
+# ---------- 转写后端 ----------
+
+class TranscriptionBackend:
+    """转写后端：transcribe() 转写一段音频，返回 [{'start': 秒, 'end': 秒, 'text': 文本}]（相对本段开头）"""
+
+    # 本地模型占用CPU，分段交给进程池；云端接口以线程并发
+    local = False
+
+    def transcribe(self, samples, sample_rate):
+        raise NotImplementedError
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """本地离线转写（faster-whisper，CTranslate2 在CPU上以 int8 推理）"""
+
+    local = True
+
+    def __init__(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError('离线转写需要安装 faster-whisper：pip install faster-whisper')
+        self.model = WhisperModel(TRANSCRIBE_MODEL, device='cpu', compute_type=TRANSCRIBE_COMPUTE_TYPE,
+                                  cpu_threads=TRANSCRIBE_CPU_THREADS)
+
+    def transcribe(self, samples, sample_rate):
+        audio = samples.astype(np.float32) / 32768
+        # 分段已按静音切好，不再启用模型自带的VAD；分段之间互相独立，不沿用上一段文本作为提示
+        segments, _ = self.model.transcribe(audio, language=TRANSCRIBE_LANGUAGE or None,
+                                            beam_size=TRANSCRIBE_BEAM_SIZE, condition_on_previous_text=False)
+        return [{'start': segment.start, 'end': segment.end, 'text': segment.text.strip()}
+                for segment in segments if segment.text.strip()]
+
+
+class DashScopeBackend(TranscriptionBackend):
+    """阿里云实时语音识别（paraformer），按句返回时间戳"""
+
+    def transcribe(self, samples, sample_rate):
+        from dashscope.audio.asr import Recognition
+        from modules.llm_client import default_api_key
+        fd, path = tempfile.mkstemp(suffix='.wav')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(to_wav_bytes(samples, sample_rate))
+            result = Recognition(model=DASHSCOPE_ASR_MODEL, callback=None, format='wav', sample_rate=sample_rate,
+                                 api_key=default_api_key()).call(path)
+        finally:
+            os.remove(path)
+        if result.status_code != HTTPStatus.OK:
+            raise RuntimeError(f'语音识别失败: {result.code}, {result.message}')
+        return [{'start': sentence['begin_time'] / 1000, 'end': sentence['end_time'] / 1000,
+                 'text': sentence['text'].strip()}
+                for sentence in result.get_sentence() or [] if sentence.get('text', '').strip()]
+
+
+_BACKENDS = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_backend(name, factory):
+    """注册转写后端，factory() 返回 TranscriptionBackend 实例"""
+    _BACKENDS[name] = factory
+
+
+def backend_names():
+    return sorted(_BACKENDS)
+
+
+def get_backend_class(name):
+    if name not in _BACKENDS:
+        raise ValueError(f'未知的转写后端: {name}')
+    return _BACKENDS[name]
+
+
+def get_backend(name=None):
+    """当前进程的后端实例，首次使用时创建（本地模型每个进程只加载一次）"""
+    name = name or TRANSCRIBE_BACKEND
+    factory = get_backend_class(name)
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            backend = _instances[name] = factory()
+        return backend
+
+
+register_backend('faster_whisper', FasterWhisperBackend)
+register_backend('dashscope', DashScopeBackend)
+
+
+# ---------- 分段并发转写 ----------
+
+_pools = {}  # 后端名 -> 进程池
+_pool_lock = threading.Lock()
+
+
+def get_pool(backend):
+    """
+    获取常驻进程池（工作进程启动时即加载后端模型），每个后端各用一个
+
+    工作进程以 spawn 方式启动，不继承 Flask 进程中其他线程持有的锁。
+    """
+    with _pool_lock:
+        pool = _pools.get(backend)
+        if pool is None:
+            pool = _pools[backend] = ProcessPoolExecutor(max_workers=TRANSCRIBE_WORKERS, initializer=get_backend,
+                                                         initargs=(backend,),
+                                                         mp_context=multiprocessing.get_context('spawn'))
+        return pool
+
+
+def shutdown_pool(backend=None):
+    """关闭指定后端的进程池，不指定时全部关闭"""
+    with _pool_lock:
+        for name in ([backend] if backend else list(_pools)):
+            pool = _pools.pop(name, None)
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+_remote_executor = None
+_remote_lock = threading.Lock()
+
+
+def get_remote_executor():
+    """云端后端的分段转写线程池，与流水线线程池分开，避免长录音挤占诊断等任务的线程"""
+    global _remote_executor
+    with _remote_lock:
+        if _remote_executor is None:
+            _remote_executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_REMOTE_CONCURRENCY,
+                                                  thread_name_prefix='transcribe')
+        return _remote_executor
+
+
+def _transcribe_chunk(job):
+    """转写一个分段，时间戳换算为整段录音的时间：job 为 (后端名, 分段起点秒数, 采样, 采样率)"""
+    backend, offset, samples, sample_rate = job
+    return [{'start': round(offset + segment['start'], 2), 'end': round(offset + segment['end'], 2),
+             'text': segment['text']}
+            for segment in get_backend(backend).transcribe(samples, sample_rate)]
+
+
+def submit_chunk(job):
+    """异步转写一个分段，返回 Future：本地后端交给进程池，云端后端交给转写专用线程池"""
+    backend = job[0]
+    if get_backend_class(backend).local:
+        try:
+            return get_pool(backend).submit(_transcribe_chunk, job)
+        except BrokenProcessPool:
+            shutdown_pool(backend)
+            return get_pool(backend).submit(_transcribe_chunk, job)
+    return get_remote_executor().submit(contextvars.copy_context().run, _transcribe_chunk, job)
+
+
+def chunk_result(future, job):
+    """取分段的转写结果；进程池异常时在当前线程重新转写该分段"""
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        print(f"转写进程池异常，回退串行转写: {str(e)}")
+        shutdown_pool(job[0])
+        return _transcribe_chunk(job)
+
+
+def collect_chunks(submitted, progress=None):
+    """按完成顺序收集 [(job, future)] 的结果并汇报进度，返回按分段顺序排列的结果（job 仅在需要重试时使用）"""
+    results = [None] * len(submitted)
+    index_of = {future: index for index, (_, future) in enumerate(submitted)}
+    for finished, future in enumerate(as_completed(index_of), 1):
+        index = index_of[future]
+        results[index] = chunk_result(future, submitted[index][0])
+        if progress:
+            progress(finished / len(submitted), f'已转写 {finished}/{len(submitted)} 段')
+    return results
+
+
+def build_transcript(chunk_results, duration, backend):
+    """拼接各分段的转写结果"""
+    segments = [segment for chunk in chunk_results for segment in chunk]
+    return {
+        'text': '\n'.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'duration': round(duration, 2),
+        'backend': backend,
+        'chunks': len(chunk_results)
+    }
+
+
+def transcribe_samples(samples, sample_rate=SAMPLE_RATE, backend=None, workers=None, progress=None):
+    """
+    按静音切分后并发转写，返回
+    {'text': 全文, 'segments': [{'start', 'end', 'text'}], 'duration': 秒, 'backend': 后端名, 'chunks': 分段数}
+    """
+    backend = backend or TRANSCRIBE_BACKEND
+    workers = TRANSCRIBE_WORKERS if workers is None else workers
+    spans = split_on_silence(samples, sample_rate)
+    jobs = [(backend, start / sample_rate, samples[start:end], sample_rate) for start, end in spans]
+    if workers <= 1 or len(jobs) <= 1:
+        results = []
+        for index, job in enumerate(jobs):
+            results.append(_transcribe_chunk(job))
+            if progress:
+                progress((index + 1) / len(jobs), f'已转写 {index + 1}/{len(jobs)} 段')
+    else:
+        results = collect_chunks([(job, submit_chunk(job)) for job in jobs], progress)
+    return build_transcript(results, len(samples) / sample_rate, backend)
+
+
+def transcribe_file(path, backend=None, progress=None, buffer_dir=None):
+    """
+    流式解码录音文件并转写（见 audio_ingest）：按块读取文件，分段一确定就提交转写，
+    内存占用与录音时长无关；buffer_dir 为PCM缓冲文件所在目录
+    """
+    from modules.audio_ingest import ingest_file
+    return ingest_file(path, backend=backend, progress=progress, buffer_dir=buffer_dir)
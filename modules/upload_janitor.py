@@ -0,0 +1,152 @@
+"""
+上传目录清理
+后台线程定期执行：
+- 将上传存储中累积的访问时间写回数据库
+- 删除超过保留期未被访问的文件（retention）
+- 占用超过配额时按最近访问时间从早到晚淘汰（LRU），直到降至低水位；最近 min_idle 秒内访问过的文件不淘汰，
+  避免删除排队中的任务即将读取的文件
+- 删除上传目录中旧版本遗留的平铺文件与 batch_* 目录（按修改时间判断保留期）
+- 删除中断上传遗留的临时文件
+淘汰顺序来自上传存储的访问时间索引，不扫描存储目录。
+"""
+import os
+import time
+import threading
+
+DAY = 24 * 3600
+
+
+class UploadJanitor:
+    """
+    上传文件清理器
+
+    retention 为0时不按保留期删除，quota_bytes 为0时不限配额。
+    """
+
+    def __init__(self, store, upload_dir, retention=30 * DAY, quota_bytes=0, low_watermark=0.9,
+                 min_idle=3600, interval=600, clock=time.time):
+        self.store = store
+        self.upload_dir = upload_dir
+        self.retention = retention
+        self.quota_bytes = quota_bytes
+        self.low_watermark = low_watermark
+        self.min_idle = min_idle
+        self.interval = interval
+        self._clock = clock
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+        self._managed_dirs = {os.path.abspath(store.blob_dir), os.path.abspath(store.tmp_dir)}
+        self.runs = 0
+        self.last_run = None
+        self.last_result = None
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._loop, name='upload-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"上传目录清理失败: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """执行一轮清理，返回本轮清理统计"""
+        with self._run_lock:
+            started = self._clock()
+            result = {
+                'flushed': self.store.flush_access(),
+                'expired': 0,
+                'evicted': 0,
+                'freed_bytes': 0,
+                'legacy_removed': 0,
+                'spools_removed': self.store.clear_stale_spools()
+            }
+            if self.retention > 0:
+                count, freed = self._evict_before(started - self.retention)
+                result['expired'] = count
+                result['freed_bytes'] += freed
+                result['legacy_removed'] = self._sweep_legacy(started - self.retention)
+            if self.quota_bytes > 0 and self.store.total_bytes() > self.quota_bytes:
+                target = int(self.quota_bytes * self.low_watermark)
+                count, freed = self._evict_before(started - self.min_idle, target_bytes=target)
+                result['evicted'] = count
+                result['freed_bytes'] += freed
+            result['seconds'] = round(self._clock() - started, 3)
+            self.runs += 1
+            self.last_run = started
+            self.last_result = result
+            return result
+
+    def _evict_before(self, cutoff, target_bytes=None):
+        """按访问时间从早到晚删除 cutoff 之前访问的文件；给出 target_bytes 时降至该占用即停止"""
+        count = freed = 0
+        while target_bytes is None or self.store.total_bytes() > target_bytes:
+            candidates = self.store.least_recently_used(cutoff)
+            if not candidates:
+                break
+            progressed = False
+            for content_id, _, _ in candidates:
+                if target_bytes is not None and self.store.total_bytes() <= target_bytes:
+                    break
+                released = self.store.evict(content_id, accessed_before=cutoff)
+                if released:
+                    count += 1
+                    freed += released
+                    progressed = True
+            if not progressed:
+                break
+        return count, freed
+
+    def _sweep_legacy(self, cutoff):
+        """删除上传目录顶层（及 batch_* 子目录）中修改时间早于 cutoff 的旧文件"""
+        removed = 0
+        try:
+            entries = list(os.scandir(self.upload_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                elif (entry.is_dir(follow_symlinks=False) and entry.name.startswith('batch_')
+                      and os.path.abspath(entry.path) not in self._managed_dirs):
+                    removed += self._sweep_dir(entry.path, cutoff)
+            except OSError:
+                pass
+        return removed
+
+    @staticmethod
+    def _sweep_dir(path, cutoff):
+        removed = 0
+        remaining = False
+        for entry in os.scandir(path):
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+            else:
+                remaining = True
+        if not remaining:
+            os.rmdir(path)
+        return removed
+
+    def stats(self):
+        return {
+            'retention_days': round(self.retention / DAY, 2),
+            'quota_bytes': self.quota_bytes,
+            'used_bytes': self.store.total_bytes(),
+            'interval': self.interval,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'last_result': self.last_result
+        }
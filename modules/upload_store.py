@@ -0,0 +1,366 @@
+"""
+内容寻址的上传存储
+上传文件在 multipart 解析时即分块写入存储目录下的临时文件并同时计算SHA-256，
+解析完成后按内容哈希改名为 blobs/<前两位>/<SHA-256>.<扩展名>：
+相同内容只保存一份（引用计数），不同用户上传的同名文件也不会互相覆盖。
+返回的内容ID即SHA-256，解析缓存可直接以此为键，无需再读一遍文件计算哈希。
+文件清单以SQLite为准，内存索引只是本进程的缓存（按访问时间排序的淘汰顺序由SQLite索引给出）：
+索引未命中时回查数据库（其他工作进程上传的文件），命中时确认文件仍在磁盘上
+（其他进程可能已淘汰），因此多个工作进程共用同一存储目录时结果一致；
+最近访问时间先记在内存中，批量回写数据库。
+"""
+import os
+import re
+import time
+import uuid
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_BLOB_NAME = re.compile(r'^([0-9a-f]{64})(\.[0-9a-z]+)?$')
+
+
+class HashingSpool:
+    """
+    边写边计算SHA-256的临时文件
+
+    可作为 werkzeug 的上传文件容器（write / seek / read）；未提交就关闭时删除临时文件。
+    listener 不为空时，写入的每一块同时交给 listener.feed()（如录音的流式解码），
+    上传未保存（解析失败、超出大小限制、被丢弃）就关闭时调用 listener.abort()。
+    """
+
+    def __init__(self, tmp_dir, listener=None):
+        fd, self.path = tempfile.mkstemp(dir=tmp_dir, prefix='upload-', suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        # stored: 内容已保存（重复内容只增加引用，临时文件随后删除）；committed: 临时文件已改名为存储文件
+        self.stored = False
+        self.committed = False
+        self.listener = listener
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        written = self._file.write(data)
+        if self.listener is not None:
+            self.listener.feed(data)
+        return written
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.listener is not None and not self.stored:
+            self.listener.abort()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadStore:
+    """
+    上传文件存储
+
+    - blobs 表：内容ID、扩展名、大小、引用计数
+    - refs 表：每次上传一条引用，记录原始文件名（含中文，仅作展示与信息抽取，不用于路径）
+    - 引用全部释放后删除文件
+    """
+
+    def __init__(self, root, db_path):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self._blob_dir_abs = os.path.abspath(self.blob_dir)
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_id TEXT PRIMARY KEY,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL
+            )
+        ''')
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(blobs)')}
+        if 'last_access' not in columns:
+            self._conn.execute('ALTER TABLE blobs ADD COLUMN last_access REAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS refs (
+                id TEXT PRIMARY KEY,
+                content_id TEXT NOT NULL,
+                filename TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_refs_content ON refs(content_id, created_at)')
+        self._conn.execute('UPDATE blobs SET last_access = created_at WHERE last_access IS NULL')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_access ON blobs(last_access)')
+        self._conn.commit()
+        # 内容ID -> [扩展名, 大小]；pending_access 为尚未写回数据库的访问时间
+        self._index = {row['content_id']: [row['ext'], row['size']]
+                       for row in self._conn.execute('SELECT content_id, ext, size FROM blobs')}
+        self._pending_access = {}
+        self.dedup_hits = 0
+        self.bytes_saved = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.clear_stale_spools()
+
+    def clear_stale_spools(self, max_age=3600):
+        """清理超过 max_age 秒未完成的临时文件（进程中断遗留；进行中的上传不会这么久），返回清理个数"""
+        cutoff = time.time() - max_age
+        removed = 0
+        for entry in os.scandir(self.tmp_dir):
+            if not entry.name.endswith('.part'):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def open_spool(self, listener=None):
+        """新建一个边写边哈希的临时文件（与最终位置在同一文件系统，提交时只需改名）"""
+        return HashingSpool(self.tmp_dir, listener)
+
+    def blob_path(self, content_id, ext):
+        return os.path.join(self.blob_dir, content_id[:2], content_id + ext)
+
+    def content_id_for_path(self, path):
+        """存储内文件路径对应的内容ID（由文件名直接得出，不读文件），其他路径返回None"""
+        if not path:
+            return None
+        head, name = os.path.split(path)
+        shard_dir, shard = os.path.split(head)
+        if shard != name[:2]:
+            return None
+        match = _BLOB_NAME.match(name)
+        if not match:
+            return None
+        # 上传接口返回的相对路径直接比较，其他写法再规范化比较
+        if shard_dir != self.blob_dir and os.path.abspath(shard_dir) != self._blob_dir_abs:
+            return None
+        return match.group(1)
+
+    def store(self, file_storage, filename):
+        """
+        保存一个上传文件（werkzeug FileStorage），返回
+        {'content_id', 'ref_id', 'file_path', 'size', 'deduplicated'}
+
+        上传内容已由 open_spool() 写入临时文件时直接提交，否则分块复制一遍。
+        """
+        stream = file_storage.stream
+        if isinstance(stream, HashingSpool) and not stream.committed:
+            return self._commit(stream, filename)
+        return self.store_stream(stream, filename)
+
+    def store_stream(self, stream, filename):
+        """从任意可读流分块写入并保存"""
+        with self.open_spool() as spool:
+            for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+                spool.write(chunk)
+            return self._commit(spool, filename)
+
+    def _commit(self, spool, filename):
+        content_id = spool.hexdigest()
+        ext = os.path.splitext(filename or '')[1].lower()
+        spool.flush()
+        spool._file.close()
+        now = time.time()
+        ref_id = uuid.uuid4().hex
+        with self._lock:
+            entry = self._entry(content_id)
+            deduplicated = entry is not None and os.path.exists(self.blob_path(content_id, entry[0]))
+            if deduplicated:
+                ext = entry[0]
+                self._conn.execute('UPDATE blobs SET refcount = refcount + 1, last_access = ? WHERE content_id = ?',
+                                   (now, content_id))
+                self._pending_access.pop(content_id, None)
+                self.dedup_hits += 1
+                self.bytes_saved += spool.size
+            else:
+                target = self.blob_path(content_id, ext)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(spool.path, target)
+                spool.committed = True
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO blobs (content_id, ext, size, refcount, created_at, last_access) '
+                    'VALUES (?, ?, ?, 1, ?, ?)',
+                    (content_id, ext, spool.size, now, now)
+                )
+                self._index[content_id] = [ext, spool.size]
+            self._conn.execute('INSERT INTO refs (id, content_id, filename, created_at) VALUES (?, ?, ?, ?)',
+                               (ref_id, content_id, filename, now))
+            self._conn.commit()
+        spool.stored = True
+        # 重复内容的临时文件在这里删除
+        spool.close()
+        return {
+            'content_id': content_id,
+            'ref_id': ref_id,
+            'file_path': self.blob_path(content_id, ext).replace('\\', '/'),
+            'size': spool.size,
+            'deduplicated': deduplicated
+        }
+
+    def _entry(self, content_id):
+        """内容ID对应的 [扩展名, 大小]：先查内存索引，未命中时回查数据库并补入索引；调用方需持有锁"""
+        entry = self._index.get(content_id)
+        if entry is None:
+            row = self._conn.execute('SELECT ext, size FROM blobs WHERE content_id = ?', (content_id,)).fetchone()
+            if row is not None:
+                entry = self._index[content_id] = [row['ext'], row['size']]
+        return entry
+
+    def exists(self, path):
+        """
+        文件是否存在：存储内的文件查索引（未命中时回查数据库）并确认文件仍在磁盘上，
+        存在时记录一次访问（供淘汰排序）；其他路径查文件系统
+        """
+        content_id = self.content_id_for_path(path)
+        if content_id is None:
+            return bool(path) and os.path.exists(path)
+        with self._lock:
+            entry = self._entry(content_id)
+            if entry is None:
+                return False
+            if not os.path.exists(self.blob_path(content_id, entry[0])):
+                # 已被其他进程释放或淘汰
+                self._index.pop(content_id, None)
+                self._pending_access.pop(content_id, None)
+                return False
+            self._pending_access[content_id] = time.time()
+        return True
+
+    def flush_access(self):
+        """将内存中累积的访问时间批量写回数据库，返回写回条数"""
+        with self._lock:
+            if not self._pending_access:
+                return 0
+            pending = list(self._pending_access.items())
+            self._pending_access.clear()
+            self._conn.executemany('UPDATE blobs SET last_access = MAX(COALESCE(last_access, 0), ?) '
+                                   'WHERE content_id = ?', [(when, cid) for cid, when in pending])
+            self._conn.commit()
+        return len(pending)
+
+    def total_bytes(self):
+        """存储占用的字节数（以数据库为准，包含其他进程上传的文件）"""
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def least_recently_used(self, accessed_before, limit=100):
+        """最近访问时间早于 accessed_before 的文件，按访问时间从早到晚，返回 [(内容ID, 大小, 最近访问时间)]"""
+        self.flush_access()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT content_id, size, last_access FROM blobs WHERE last_access < ? '
+                'ORDER BY last_access LIMIT ?', (accessed_before, limit)).fetchall()
+        return [(row['content_id'], row['size'], row['last_access']) for row in rows]
+
+    def evict(self, content_id, accessed_before=None):
+        """
+        删除文件及其全部引用，返回释放的字节数
+
+        accessed_before 不为空时，若文件在此之后又被访问（淘汰期间的并发请求）则保留并返回0。
+        """
+        with self._lock:
+            entry = self._entry(content_id)
+            if entry is None:
+                return 0
+            if accessed_before is not None:
+                recent = self._pending_access.get(content_id)
+                if recent is not None and recent >= accessed_before:
+                    return 0
+                row = self._conn.execute('SELECT last_access FROM blobs WHERE content_id = ?',
+                                         (content_id,)).fetchone()
+                if row is not None and (row['last_access'] or 0) >= accessed_before:
+                    return 0
+            self._conn.execute('DELETE FROM refs WHERE content_id = ?', (content_id,))
+            deleted = self._conn.execute('DELETE FROM blobs WHERE content_id = ?', (content_id,)).rowcount
+            self._conn.commit()
+            self._drop(content_id, entry[0])
+            if not deleted:
+                # 其他进程已删除，只清理本进程的索引
+                return 0
+            self.evicted += 1
+            self.evicted_bytes += entry[1]
+        return entry[1]
+
+    def _drop(self, content_id, ext):
+        """从索引中移除并删除文件，调用方需持有锁"""
+        self._index.pop(content_id, None)
+        self._pending_access.pop(content_id, None)
+        try:
+            os.remove(self.blob_path(content_id, ext))
+        except FileNotFoundError:
+            pass
+
+    def display_name(self, path):
+        """文件的原始文件名：存储内的文件取最近一次上传时的文件名，其他路径取文件名部分"""
+        content_id = self.content_id_for_path(path)
+        if content_id:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT filename FROM refs WHERE content_id = ? AND filename IS NOT NULL '
+                    'ORDER BY created_at DESC LIMIT 1', (content_id,)).fetchone()
+            if row and row['filename']:
+                return row['filename']
+        return os.path.basename(path or '')
+
+    def release(self, ref_id):
+        """释放一次上传引用，引用计数归零时删除文件；引用不存在时返回False"""
+        with self._lock:
+            row = self._conn.execute('SELECT content_id FROM refs WHERE id = ?', (ref_id,)).fetchone()
+            if row is None:
+                return False
+            content_id = row['content_id']
+            self._conn.execute('DELETE FROM refs WHERE id = ?', (ref_id,))
+            self._conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE content_id = ?', (content_id,))
+            blob = self._conn.execute('SELECT ext, refcount FROM blobs WHERE content_id = ?',
+                                      (content_id,)).fetchone()
+            if blob is not None and blob['refcount'] <= 0:
+                self._conn.execute('DELETE FROM blobs WHERE content_id = ?', (content_id,))
+                self._drop(content_id, blob['ext'])
+            self._conn.commit()
+        return True
+
+    def stats(self):
+        with self._lock:
+            refs = self._conn.execute('SELECT COUNT(*) FROM refs').fetchone()[0]
+            blobs, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+            return {
+                'blobs': blobs,
+                'bytes': total,
+                'refs': refs,
+                'dedup_hits': self.dedup_hits,
+                'bytes_saved': self.bytes_saved,
+                'evicted': self.evicted,
+                'evicted_bytes': self.evicted_bytes
+            }
@@ -0,0 +1,220 @@
+"""
+流式生成XLSX
+直接写出 XLSX 的 zip 包（SpreadsheetML），边产生行边压缩边输出：
+- 字符串使用内联字符串（inlineStr），不需要事先收集共享字符串表
+- zip 写入不可定位的输出流（数据描述符模式），已压缩的字节随时交给响应体发送
+内存占用只与单次输出的缓冲块大小有关，与行数无关，适合导出整个团队的结果。
+
+    sheets = [Sheet('评分明细', ['员工', '能力项', '评分'], rows_iterable, widths=[12, 20, 8])]
+    return Response(stream_xlsx(sheets), mimetype=XLSX_MIMETYPE)
+"""
+import io
+import re
+import zipfile
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 缓冲的压缩数据达到该大小时输出一次
+FLUSH_BYTES = 64 * 1024
+
+# Excel 单元格文本长度上限
+MAX_CELL_CHARS = 32767
+
+# 工作表名：最长31个字符，不能包含 []:*?/\
+_INVALID_TITLE = re.compile(r'[\[\]:*?/\\]')
+# XML 1.0 不允许的控制字符
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+Sheet = namedtuple('Sheet', ['title', 'header', 'rows', 'widths'], defaults=(None,))
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}'
+    '</Types>'
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{index}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}'
+    '<Relationship Id="rIdStyles" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# 样式：0 为默认，1 为表头（加粗），2 为自动换行
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+    '<alignment wrapText="1" vertical="top"/></xf></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '{cols}<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _ChunkSink(io.RawIOBase):
+    """不可定位的输出流：收集 zip 写出的字节，由生成器取走"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def pending(self):
+        return len(self._buffer)
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def column_letter(index):
+    """列序号（从0开始）转为 A、B、...、AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def sheet_title(title, used):
+    """生成合法且不重复的工作表名"""
+    base = _INVALID_TITLE.sub('_', str(title or 'Sheet')).strip("'")[:31] or 'Sheet'
+    candidate, n = base, 1
+    while candidate.lower() in used:
+        n += 1
+        suffix = f'_{n}'
+        candidate = base[:31 - len(suffix)] + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+def _cell_xml(ref, value, style):
+    if value is None or value == '':
+        return ''
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if value != value or value in (float('inf'), float('-inf')):
+            value = str(value)
+        else:
+            return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    text = _ILLEGAL_XML.sub('', str(value))[:MAX_CELL_CHARS]
+    space = ' xml:space="preserve"' if text[:1].isspace() or text[-1:].isspace() or '\n' in text else ''
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def _row_xml(number, values, letters, style=0, wrap=None):
+    cells = []
+    for index, value in enumerate(values):
+        while index >= len(letters):
+            letters.append(column_letter(len(letters)))
+        cell_style = style or (2 if wrap and index in wrap else 0)
+        cells.append(_cell_xml(f'{letters[index]}{number}', value, cell_style))
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def stream_xlsx(sheets, flush_bytes=FLUSH_BYTES):
+    """
+    逐块生成XLSX文件内容
+
+    sheets 为 Sheet 列表；rows 可以是生成器，每行为值序列，按需读取。
+    widths 为各列宽度（字符数），宽度不小于30的列自动换行。
+    """
+    sink = _ChunkSink()
+    used_titles = set()
+    titles = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        for number, sheet in enumerate(sheets, 1):
+            titles.append(sheet_title(sheet.title, used_titles))
+            widths = list(sheet.widths or [])
+            wrap = {index for index, width in enumerate(widths) if width and width >= 30}
+            cols = ''
+            if widths:
+                cols = '<cols>' + ''.join(
+                    f'<col min="{index + 1}" max="{index + 1}" width="{width}" customWidth="1"/>'
+                    for index, width in enumerate(widths) if width) + '</cols>'
+            letters = []
+            with archive.open(f'xl/worksheets/sheet{number}.xml', 'w', force_zip64=True) as part:
+                part.write(_SHEET_HEAD.format(cols=cols).encode('utf-8'))
+                row_number = 0
+                if sheet.header:
+                    row_number = 1
+                    part.write(_row_xml(1, sheet.header, letters, style=1).encode('utf-8'))
+                for values in sheet.rows:
+                    row_number += 1
+                    part.write(_row_xml(row_number, values, letters, wrap=wrap).encode('utf-8'))
+                    if sink.pending() >= flush_bytes:
+                        yield sink.drain()
+                part.write(_SHEET_TAIL.encode('utf-8'))
+            if sink.pending():
+                yield sink.drain()
+
+        if not titles:
+            # Excel 要求至少有一张工作表
+            titles.append('Sheet1')
+            archive.writestr('xl/worksheets/sheet1.xml', _SHEET_HEAD.format(cols='') + _SHEET_TAIL)
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES.format(
+            sheets=''.join(_SHEET_CONTENT_TYPE.format(index=index) for index in range(1, len(titles) + 1))))
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(sheets=''.join(
+            f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{index}" r:id="rId{index}"/>'
+            for index, title in enumerate(titles, 1))))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS.format(sheets=''.join(
+            f'<Relationship Id="rId{index}" '
+            f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{index}.xml"/>'
+            for index in range(1, len(titles) + 1))))
+        archive.writestr('xl/styles.xml', _STYLES)
+    yield sink.drain()
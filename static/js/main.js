@@ -295,6 +295,7 @@ function initPageNavigation() {
                     if (typeof initCohortChart === 'function') {
                         initCohortChart();
                     }
+                    loadCohortOptions();
                 }
             }
         });
@@ -815,6 +816,87 @@ function checkVerifyButtonState() {
     }
 }
 
+// 以POST方式请求SSE流式接口，逐个事件回调 onEvent(事件名, 数据)
+// 返回最终 done 事件的数据
+async function streamSSE(url, body, onEvent) {
+    const requestStart = performance.now();
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'Accept': 'text/event-stream'},
+        body: JSON.stringify(body)
+    });
+    if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || `HTTP ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let firstEventMs = null;
+    let result = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let eventName = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length === 0) continue;
+            
+            if (firstEventMs === null) {
+                firstEventMs = Math.round(performance.now() - requestStart);
+            }
+            const data = JSON.parse(dataLines.join('\n'));
+            if (eventName === 'done') {
+                result = data;
+                console.log(`${url} 首个事件耗时: ${firstEventMs}ms, 服务端首字耗时: ${data.timing?.first_token_ms}ms`);
+            }
+            if (onEvent) onEvent(eventName, data);
+        }
+    }
+    
+    if (!result) {
+        throw new Error('流式响应意外中断');
+    }
+    return result;
+}
+
+// 流式校对过程中逐条展示已识别的缺失项
+function showStreamingMissingItem(item, index) {
+    const resultCard = document.querySelector('#verification .col-md-6:last-child .card-body');
+    if (!resultCard) return;
+    
+    let list = document.getElementById('streamingMissingItems');
+    if (!list || index === 0) {
+        resultCard.innerHTML = `
+            <div class="alert alert-info">
+                <span class="spinner-border spinner-border-sm me-2" role="status" aria-hidden="true"></span>正在校对，已发现的问题：
+            </div>
+            <div class="inconsistency">
+                <ul class="mb-1" id="streamingMissingItems"></ul>
+            </div>
+        `;
+        list = document.getElementById('streamingMissingItems');
+    }
+    const li = document.createElement('li');
+    li.textContent = item;
+    list.appendChild(li);
+}
+
 // 表单提交逻辑
 function initFormSubmissions() {
     // 文档校对提交
@@ -831,12 +913,11 @@ function initFormSubmissions() {
             this.disabled = true;
             this.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> 校对中...`;
             
-            fetch('/api/verify', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({doc_text: docText, score_items: scoreItems})
+            streamSSE('/api/verify/stream', {doc_text: docText, score_items: scoreItems}, (eventName, data) => {
+                if (eventName === 'item' && data.field === 'missing_items') {
+                    showStreamingMissingItem(data.value, data.index);
+                }
             })
-            .then(response => response.json())
             .then(data => {
                 // 恢复按钮状态
                 this.disabled = false;
@@ -952,28 +1033,34 @@ function initFormSubmissions() {
             const employeeAnalysis = document.getElementById('employeeAnalysis').checked;
             const growthSuggestions = document.getElementById('growthSuggestions').checked;
             
-            // 调用后端API生成诊断报告
-            fetch('/api/generate_diagnosis', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({
-                    employee_name: employeeName,
-                    ability_model: abilityModel,
-                    quarter: quarter,
-                    doc_path: window.docPath,
-                    include_employee_analysis: employeeAnalysis,
-                    include_growth_suggestions: growthSuggestions,
-                    judge_score_path: window.judgeScoreFilePath || '', // 评委打分结果文件路径
-                    pdf_analysis_path: window.pdfAnalysisFilePath || '', // PDF文件路径
-                    audio_analysis_path: window.audioAnalysisFilePath || '' // 录音文件路径
-                })
+            // 调用后端流式API生成诊断报告，按已生成的条目数更新进度
+            let streamedItems = 0;
+            streamSSE('/api/generate_diagnosis/stream', {
+                employee_name: employeeName,
+                ability_model: abilityModel,
+                quarter: quarter,
+                doc_path: window.docPath,
+                include_employee_analysis: employeeAnalysis,
+                include_growth_suggestions: growthSuggestions,
+                judge_score_path: window.judgeScoreFilePath || '', // 评委打分结果文件路径
+                pdf_analysis_path: window.pdfAnalysisFilePath || '', // PDF文件路径
+                audio_analysis_path: window.audioAnalysisFilePath || '' // 录音文件路径
+            }, (eventName, data) => {
+                if (eventName === 'progress') {
+                    this.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> ${data.message}...`;
+                } else if (eventName === 'item') {
+                    streamedItems += 1;
+                    this.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> 生成中（已完成 ${streamedItems} 条）...`;
+                }
             })
-            .then(response => response.json())
             .then(data => {
                 this.disabled = false;
                 this.textContent = '生成诊断报告';
                 
                 if (data.success) {
+                    // 结果已保存在服务端，导出时按ID读取
+                    window.currentDiagnosisResultId = data.result_id || null;
+                    
                     // 更新诊断报告显示
                     updateDiagnosisReport(data.diagnosis);
                     
@@ -1019,16 +1106,72 @@ function initFormSubmissions() {
             this.disabled = true;
             this.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> 生成中...`;
             
-            // 模拟API调用延迟
-            setTimeout(() => {
+            // 空值表示不按该条件筛选
+            const selectedValue = id => {
+                const select = document.getElementById(id);
+                return select && select.value ? select.value : null;
+            };
+            
+            fetch('/api/generate_cohort_analysis', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    position: selectedValue('cohortSelect'),
+                    ability_model: selectedValue('cohortModelSelect'),
+                    quarter: selectedValue('cohortTimeSelect')
+                })
+            })
+            .then(response => response.json())
+            .then(data => {
+                this.disabled = false;
+                this.textContent = '生成分析报告';
+                
+                if (data.success) {
+                    generateCohortAnalysis(data);
+                    showToast('群体分析报告已生成', 'success');
+                } else {
+                    showToast(data.error || '生成群体分析失败', 'danger');
+                }
+            })
+            .catch(error => {
                 this.disabled = false;
                 this.textContent = '生成分析报告';
-                showToast('群体分析报告已生成', 'success');
-            }, 1500);
+                showToast('生成群体分析错误: ' + error.message, 'danger');
+            });
         });
     }
 }
 
+// 用已有诊断记录中的职位、能力模型和评估周期填充群体分析的筛选条件
+function loadCohortOptions() {
+    fetch('/api/cohort_options')
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) return;
+        const selects = {
+            cohortSelect: data.options.position,
+            cohortModelSelect: data.options.ability_model,
+            cohortTimeSelect: data.options.quarter
+        };
+        Object.entries(selects).forEach(([id, values]) => {
+            const select = document.getElementById(id);
+            if (!select) return;
+            const current = select.value;
+            // 保留第一项"全部"，其余按最新选项重建
+            while (select.options.length > 1) {
+                select.remove(1);
+            }
+            (values || []).forEach(value => {
+                select.add(new Option(value, value));
+            });
+            select.value = (values || []).includes(current) ? current : '';
+        });
+    })
+    .catch(error => {
+        console.error('获取群体分析筛选条件失败:', error);
+    });
+}
+
 // 生成述职分析
 function generateReportAnalysis() {
     // 检查是否有述职文件
@@ -1642,6 +1785,7 @@ function initCharts() {
         console.log('analysis页面已激活，雷达图将在生成报告时创建');
     } else if (activePageId === 'cohort') {
         initCohortChart();
+        loadCohortOptions();
     }
     
     // 为全局使用暴露图表初始化函数
@@ -1866,13 +2010,14 @@ function exportDiagnosisReport() {
         exportBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>导出中...';
     }
     
-    // 调用后端API导出PDF
+    // 调用后端API导出PDF：已保存的结果只发送ID，未保存时才发送完整诊断内容
+    const exportBody = window.currentDiagnosisResultId
+        ? {result_id: window.currentDiagnosisResultId}
+        : {diagnosis: window.currentDiagnosis};
     fetch('/api/export_diagnosis_report', {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({
-            diagnosis: window.currentDiagnosis
-        })
+        body: JSON.stringify(exportBody)
     })
     .then(response => {
         if (!response.ok) {
@@ -2277,6 +2422,9 @@ function generateTestDiagnosisReport() {
         ]
     };
     
+    // 测试报告未保存在服务端，导出时发送完整内容
+    window.currentDiagnosisResultId = null;
+    
     // 更新诊断报告显示
     updateDiagnosisReport(testDiagnosis);
     showToast('测试诊断报告已生成，雷达图应该正常显示', 'success');
@@ -0,0 +1,153 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from modules import audio_ingest, transcription
+from modules.audio_ingest import AudioIngest, PcmRing, StreamResampler
+from modules.transcription import SAMPLE_RATE, TranscriptionBackend, register_backend
+
+
+class SampleCountBackend(TranscriptionBackend):
+    """每段返回一句，内容为本段的采样数"""
+
+    def transcribe(self, samples, sample_rate):
+        return [{'start': 0.0, 'end': len(samples) / sample_rate, 'text': str(len(samples))}]
+
+
+register_backend('sample_count', SampleCountBackend)
+
+
+def recording():
+    """3秒语音 + 1秒静音，重复三次（末尾无静音）"""
+    rng = np.random.default_rng(0)
+    t = np.arange(3 * SAMPLE_RATE) / SAMPLE_RATE
+    speech = 8000 * np.sin(2 * np.pi * 440 * t)
+    pause = rng.normal(0, 10, SAMPLE_RATE)
+    samples = np.concatenate((speech, pause, speech, pause, speech))
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+
+
+@pytest.fixture(autouse=True)
+def short_chunks(monkeypatch):
+    monkeypatch.setattr(transcription, 'TRANSCRIBE_CHUNK_SECONDS', 2)
+    monkeypatch.setattr(transcription, 'TRANSCRIBE_MAX_CHUNK_SECONDS', 5)
+
+
+def feed_wav(ingest, samples, block=4097):
+    data = transcription.to_wav_bytes(samples)
+    for start in range(0, len(data), block):
+        ingest.feed(data[start:start + block])
+
+
+def test_streamed_wav_is_segmented_and_transcribed_with_offsets(tmp_path):
+    samples = recording()
+    ingest = AudioIngest('wav', backend='sample_count', buffer_dir=str(tmp_path))
+    feed_wav(ingest, samples)
+    # 上传尚未结束时前两段已提交转写
+    assert len(ingest.submitted) == 2
+    summary = ingest.finish()
+    assert (summary['duration'], summary['chunks'], summary['speech_segments'], summary['error']) == (11.0, 3, 3, None)
+    assert os.listdir(str(tmp_path)) == []
+
+    transcript = ingest.result()
+    starts = [segment['start'] for segment in transcript['segments']]
+    assert starts[0] == 0.0
+    assert 3 < starts[1] < 4 and 7 < starts[2] < 8
+    # 各分段首尾相接，覆盖整段录音
+    assert sum(int(segment['text']) for segment in transcript['segments']) == len(samples)
+    assert transcript['segments'][-1]['end'] == 11.0
+
+
+def test_speech_segments_without_transcription():
+    ingest = AudioIngest('wav', transcribe=False)
+    feed_wav(ingest, recording())
+    ingest.finish()
+    assert ingest.submitted == []
+    segments = ingest.speech_segments()
+    assert len(segments) == 3
+    assert segments[0]['start'] == 0.0 and abs(segments[0]['end'] - 3) < 0.1
+    assert abs(segments[2]['start'] - 8) < 0.1
+
+
+def test_invalid_wav_records_error_and_result_raises():
+    ingest = AudioIngest('wav', backend='sample_count')
+    ingest.feed(b'not a wave file at all')
+    assert ingest.finish()['error'] == '不是有效的WAV文件'
+    with pytest.raises(ValueError):
+        ingest.result()
+
+
+def test_cancel_stops_ingest_and_removes_buffer(tmp_path):
+    ingest = AudioIngest('wav', backend='sample_count', buffer_dir=str(tmp_path))
+    feed_wav(ingest, recording()[:SAMPLE_RATE])
+    ingest.cancel()
+    assert ingest.error
+    assert os.listdir(str(tmp_path)) == []
+    ingest.feed(b'\x00' * 1024)
+    assert ingest.finish()['error'] == ingest.error
+
+
+@pytest.mark.parametrize('rate', [8000, 44100])
+def test_stream_resampler_matches_whole_file_resample(rate):
+    samples = np.random.default_rng(1).normal(0, 3000, rate * 2).astype(np.float32)
+    resampler = StreamResampler(rate, SAMPLE_RATE)
+    pieces = [resampler.process(samples[start:start + 997]) for start in range(0, len(samples), 997)]
+    streamed = np.concatenate(pieces)
+    expected = transcription.resample(samples, rate, SAMPLE_RATE)
+    count = min(len(streamed), len(expected)) - 2
+    assert abs(len(streamed) - len(expected)) <= 2
+    # 边缘处滑动平均的补零方式不同，只比较中间部分
+    assert np.allclose(streamed[2:count], expected[2:count], atol=1.0)
+
+
+def test_pcm_ring_wraps_and_guards_capacity(tmp_path):
+    ring = PcmRing(10, str(tmp_path))
+    ring.write(np.arange(8, dtype=np.int16))
+    ring.release(6)
+    ring.write(np.arange(8, 16, dtype=np.int16))
+    assert ring.read(6, 16).tolist() == list(range(6, 16))
+    with pytest.raises(IndexError):
+        ring.read(2, 8)
+    with pytest.raises(BufferError):
+        ring.write(np.zeros(1, dtype=np.int16))
+    ring.close()
+    assert not os.path.exists(ring.path)
+
+
+class FakeIngest:
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def test_pending_take_and_discard():
+    first, second = FakeIngest(), FakeIngest()
+    audio_ingest.register_pending('c1', first)
+    audio_ingest.register_pending('c2', second)
+    assert audio_ingest.take_pending('c1') is first
+    assert audio_ingest.take_pending('c1') is None
+    audio_ingest.discard_pending('c2')
+    assert second.cancelled.is_set() and not first.cancelled.is_set()
+    assert audio_ingest.take_pending('c2') is None
+
+
+def test_pending_reregistration_and_ttl_cancel_stale_entries(monkeypatch):
+    old, replacement, abandoned, fresh = FakeIngest(), FakeIngest(), FakeIngest(), FakeIngest()
+    audio_ingest.register_pending('same', old)
+    audio_ingest.register_pending('same', replacement)
+    assert old.cancelled.is_set()
+
+    now = [1000.0]
+    monkeypatch.setattr(audio_ingest.time, 'monotonic', lambda: now[0])
+    audio_ingest.register_pending('abandoned', abandoned)
+    now[0] += audio_ingest.AUDIO_PENDING_TTL + 1
+    audio_ingest.register_pending('fresh', fresh)
+    assert abandoned.cancelled.is_set()
+    assert audio_ingest.take_pending('abandoned') is None
+    assert audio_ingest.take_pending('fresh') is fresh
+    audio_ingest.discard_pending('same')
+    assert replacement.cancelled.is_set()
@@ -0,0 +1,76 @@
+import time
+import threading
+import contextvars
+
+from modules import batch
+from modules.batch import Throttle, get_stage_executor, run_batch
+from modules.pipeline import Pipeline
+
+request_user = contextvars.ContextVar('request_user', default=None)
+
+
+def test_results_keep_item_order_and_failures_are_isolated():
+    def process(item):
+        if item == 2:
+            raise ValueError('坏文件')
+        time.sleep(0.01 * (5 - item))
+        return item * 10
+
+    outcomes = run_batch(range(5), process, concurrency=3)
+    assert outcomes == [(0, None), (10, None), (None, '坏文件'), (30, None), (40, None)]
+
+
+def test_prepare_failure_skips_process_and_progress_counts_every_item():
+    processed, progress = [], []
+
+    def prepare(item):
+        if item == 'bad.pdf':
+            raise ValueError('无法解析')
+
+    outcomes = run_batch(['a.pdf', 'bad.pdf', 'b.pdf'], processed.append, prepare=prepare,
+                         progress=lambda done, total: progress.append((done, total)))
+    assert outcomes[1] == (None, '无法解析')
+    assert sorted(processed) == ['a.pdf', 'b.pdf']
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_concurrency_limit_and_context_propagation():
+    lock = threading.Lock()
+    running, peak, users = [0], [0], []
+
+    def process(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            users.append(request_user.get())
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    request_user.set('alice')
+    run_batch(range(12), process, concurrency=3)
+    assert peak[0] == 3
+    assert set(users) == {'alice'}
+
+
+def test_throttle_spaces_starts():
+    throttle = Throttle(qps=50)
+    started = time.monotonic()
+    for _ in range(5):
+        throttle.wait()
+    assert time.monotonic() - started >= 0.08
+
+
+def test_item_pipelines_reach_full_concurrency():
+    # 每个条目是两个并发阶段的流水线：所有条目的阶段必须能同时运行，才能全部通过栅栏
+    concurrency = batch.BATCH_CONCURRENCY
+    barrier = threading.Barrier(concurrency * 2, timeout=5)
+
+    def process(item):
+        pipeline = Pipeline(get_stage_executor())
+        pipeline.add('info', barrier.wait)
+        pipeline.add('diagnosis', barrier.wait)
+        return sorted(pipeline.run())
+
+    outcomes = run_batch(range(concurrency), process, concurrency=concurrency)
+    assert outcomes == [(['diagnosis', 'info'], None)] * concurrency
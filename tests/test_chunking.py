@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from modules.chunking import chunk_text, context_budget, estimate_tokens, map_reduce
+
+
+def test_estimate_tokens_counts_cjk_per_char_and_other_per_3_5():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('你好') == 2
+    assert estimate_tokens('abcdefg') == 2
+    # 空白不计入
+    assert estimate_tokens('你 好\n') == 2
+
+
+def test_context_budget_uses_model_context_minus_template_and_reserve():
+    assert context_budget('qwen-max', template_tokens=1000) == 32768 - 1000 - 2000
+    assert context_budget('unknown-model') == 32768 - 2000
+    assert context_budget('qwen-max', template_tokens=40000) == 0
+
+
+def test_short_text_is_single_chunk_and_blank_is_empty():
+    assert chunk_text('一段话', 10) == ['一段话']
+    assert chunk_text('  \n ', 10) == []
+    with pytest.raises(ValueError):
+        chunk_text('文本', 0)
+
+
+def test_chunks_respect_budget_and_split_on_section_breaks():
+    sections = ['第%d页' % index + '内容' * 20 for index in range(6)]
+    text = '\n\n'.join(sections)
+    chunks = chunk_text(text, 100)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    # 章节不被拆开，且按原顺序完整保留
+    assert '\n\n'.join(chunks).split('\n\n') == sections
+
+
+def test_oversized_section_falls_back_to_lines_sentences_and_hard_cut():
+    text = '。'.join(['句子' * 10] * 5) + '\n' + '长' * 130
+    chunks = chunk_text(text, 30)
+    assert all(estimate_tokens(chunk) <= 30 for chunk in chunks)
+    assert ''.join(chunks).replace('\n', '') == text.replace('\n', '')
+
+
+def test_overlap_repeats_previous_section():
+    sections = ['章节%d' % index + '字' * 30 for index in range(4)]
+    chunks = chunk_text('\n\n'.join(sections), 80, overlap_sections=1)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split('\n\n')[0] == previous.split('\n\n')[-1]
+
+
+def test_map_reduce_returns_text_unchanged_within_budget():
+    calls = []
+    assert map_reduce('短文本', lambda *args: calls.append(args), 100, 50) == ('短文本', 0)
+    assert calls == []
+
+
+def test_map_reduce_summarizes_each_chunk_concurrently():
+    text = '\n\n'.join('第%d章' % index + '内' * 40 for index in range(5))
+    seen = []
+    lock = threading.Lock()
+
+    def summarize(chunk, index, total):
+        with lock:
+            seen.append((index, total))
+        return '摘要%d' % index
+
+    result, rounds = map_reduce(text, summarize, budget_tokens=100, chunk_tokens=50)
+    assert rounds == 1
+    assert sorted(seen) == [(index, 5) for index in range(5)]
+    assert result == '\n\n'.join('【第%d部分】\n摘要%d' % (index + 1, index) for index in range(5))
+
+
+def test_map_reduce_failed_summary_keeps_truncated_chunk_and_converges():
+    text = '\n\n'.join('字' * 60 for _ in range(4))
+
+    def summarize(chunk, index, total):
+        if index == 0:
+            raise RuntimeError('upstream failed')
+        return None
+
+    result, rounds = map_reduce(text, summarize, budget_tokens=200, chunk_tokens=60)
+    # 失败或空摘要的分块按平均份额保留开头部分，逐轮压缩直到不超出预算
+    assert 1 <= rounds <= 3
+    assert estimate_tokens(result) <= 200
+    parts = result.split('\n\n')
+    assert parts[0].startswith('【第1部分】')
+    assert all(part.rstrip('字') != part for part in parts)
@@ -0,0 +1,22 @@
+from modules.cohort import ABILITY_KEYS, CohortStore
+
+
+def make_store(tmp_path, count, model='通用能力模型'):
+    store = CohortStore(str(tmp_path / 'cohort.db'))
+    store.record_many([(f'员工{i}', 'P6', model, '2025Q3', {key: 5 for key in ABILITY_KEYS}, ['实践'])
+                       for i in range(count)])
+    return store
+
+
+def test_tied_top_scores_rank_at_least_one_percent(tmp_path):
+    analysis = make_store(tmp_path, 300).analyze()
+    results = {practice['result'] for practice in analysis['best_practices']}
+    assert results == {f'{label}得分位于群体前1%' for label in
+                       ('技术创新', '业务影响力', '团队协作', '项目管理', '成本意识', '战略思维')}
+
+
+def test_filters_by_recorded_model_and_options(tmp_path):
+    store = make_store(tmp_path, 3)
+    assert store.options() == {'ability_model': ['通用能力模型'], 'position': ['P6'], 'quarter': ['2025Q3']}
+    assert store.analyze(ability_model='通用能力模型', position='P6', quarter='2025Q3')['sample_size'] == 3
+    assert store.analyze(ability_model='技术序列P6能力模型') is None
@@ -0,0 +1,30 @@
+from modules.employee_info import UNKNOWN, extract, merge, parse_llm_response
+
+
+def test_label_after_lower_priority_prefix():
+    # “本人姓名”先命中“本人”规则，不能因此跳过其后的“姓名：”标签
+    info = extract('本人姓名：张三\n2025年第三季度述职报告')
+    assert (info.name, info.field_confidence['name']) == ('张三', 0.9)
+
+
+def test_overlapping_position_label():
+    info = extract('担任职位：高级工程师')
+    assert (info.position, info.field_confidence['position']) == ('高级工程师', 0.9)
+
+
+def test_highest_confidence_rule_wins_regardless_of_order():
+    info = extract('我是王五。\n述职人：赵六\n岗位：后端开发', filename='2025q1述职.pdf')
+    assert (info.name, info.position, info.quarter) == ('赵六', '后端开发', '2025年第一季度')
+    assert info.confidence == 0.9
+
+
+def test_name_and_position_ignore_filename():
+    info = extract('今年的工作总结', filename='姓名：张三_p6_2025年3月.pdf')
+    assert (info.name, info.position, info.quarter) == (UNKNOWN, UNKNOWN, '2025年第一季度')
+    assert info.confidence == 0.0
+
+
+def test_parse_llm_response_and_merge():
+    parsed = parse_llm_response('员工姓名：张三\n职位信息：P6\n')
+    assert parsed == ('张三', 'P6', UNKNOWN)
+    assert merge(parsed, ('李四', 'P7', '2025年第二季度')) == ('张三', 'P6', '2025年第二季度')
@@ -0,0 +1,93 @@
+import time
+import threading
+
+from modules.job_queue import JobQueue, JobStore, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED
+
+
+def make_store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def test_claim_is_exclusive(tmp_path):
+    store = make_store(tmp_path)
+    store.insert('a', 'verify', 'interactive', {'x': 1})
+    row = store.claim('a', 'owner-1', lease=30)
+    assert row['status'] == STATUS_RUNNING
+    assert row['owner'] == 'owner-1'
+    assert row['lease_expires'] > time.time()
+    assert store.claim('a', 'owner-2', lease=30) is None
+
+
+def test_claim_from_two_stores_on_same_db(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    first.insert('a', 'verify', 'bulk', {})
+    claimed = [store.claim('a', name) for store, name in ((first, 'p1'), (second, 'p2'))]
+    assert sum(row is not None for row in claimed) == 1
+
+
+def test_recover_keeps_jobs_with_live_lease(tmp_path):
+    store = make_store(tmp_path)
+    store.insert('live', 'verify', 'bulk', {})
+    store.insert('queued', 'verify', 'interactive', {})
+    store.claim('live', 'other-process', lease=30)
+    assert store.recover() == [('queued', 'interactive')]
+    assert store.get('live')['status'] == STATUS_RUNNING
+
+
+def test_recover_requeues_expired_lease(tmp_path):
+    store = make_store(tmp_path)
+    store.insert('dead', 'verify', 'bulk', {})
+    store.claim('dead', 'crashed-process', lease=-1)
+    assert store.recover() == [('dead', 'bulk')]
+    job = store.get('dead')
+    assert job['status'] == STATUS_QUEUED
+    assert job['owner'] is None
+    assert store.claim('dead', 'new-owner') is not None
+
+
+def test_heartbeat_extends_lease(tmp_path):
+    store = make_store(tmp_path)
+    store.insert('a', 'verify', 'bulk', {})
+    store.claim('a', 'me', lease=-1)
+    store.heartbeat('me', lease=30)
+    assert store.requeue_expired() == []
+    assert store.get('a')['lease_expires'] > time.time()
+
+
+def test_finish_ignored_after_lease_lost(tmp_path):
+    store = make_store(tmp_path)
+    store.insert('a', 'verify', 'bulk', {})
+    store.claim('a', 'slow', lease=-1)
+    store.requeue_expired()
+    store.claim('a', 'fast')
+    assert store.finish('a', STATUS_SUCCEEDED, result={'by': 'slow'}, owner='slow') is False
+    assert store.finish('a', STATUS_SUCCEEDED, result={'by': 'fast'}, owner='fast') is True
+    assert store.get('a')['result'] == {'by': 'fast'}
+
+
+def test_queue_runs_each_job_once_across_processes(tmp_path):
+    runs = []
+    lock = threading.Lock()
+
+    def handler(payload, progress):
+        with lock:
+            runs.append(payload['n'])
+        time.sleep(0.01)
+        return payload
+
+    queues = []
+    for _ in range(2):
+        queue = JobQueue(make_store(tmp_path), workers=2, reserved_interactive=1, lease=5)
+        queue.register('echo', handler, lane='bulk')
+        queues.append(queue)
+    job_ids = [queues[0].submit('echo', {'n': n}) for n in range(10)]
+    for queue in queues:
+        queue.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        if all(queues[0].get(job_id)['status'] == STATUS_SUCCEEDED for job_id in job_ids):
+            break
+        time.sleep(0.05)
+    for queue in queues:
+        queue.shutdown()
+    assert sorted(runs) == list(range(10))
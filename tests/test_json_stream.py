@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from modules.json_stream import (REQUIRED, JsonArrayStreamer, JsonObjectExtractor, LLMJsonError, extract_json,
+                                 loads_lenient, repair_json, validate)
+
+
+def test_repair_trailing_and_duplicate_commas():
+    assert json.loads(repair_json('{"a": [1, 2,], "b": 3,,}')[0]) == {'a': [1, 2], 'b': 3}
+
+
+def test_repair_escapes_raw_newlines_in_strings():
+    assert loads_lenient('{"text": "第一行\n第二行"}') == {'text': '第一行\n第二行'}
+
+
+def test_repair_smart_quote_delimiters_keep_inner_quotes():
+    raw = '{“name”: “他说“好”就行”}'
+    assert loads_lenient(raw) == {'name': '他说“好”就行'}
+
+
+def test_repair_truncated_output():
+    data = loads_lenient('{"missing_items": ["工作成果", "团队协')
+    assert data['missing_items'][0] == '工作成果'
+
+
+def test_repair_falls_back_to_previous_comma():
+    candidates = repair_json('{"a": 1, "b": {"c": tru')
+    assert any(json.loads(c) == {'a': 1} for c in candidates if _valid(c))
+
+
+def _valid(text):
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def test_loads_lenient_raises_llm_json_error():
+    with pytest.raises(LLMJsonError):
+        loads_lenient('{"a": }')
+
+
+def test_validate_fills_defaults_and_wraps_strings():
+    schema = {'analysis': (str, REQUIRED), 'missing_items': (list, []), 'suggestions': (list, [])}
+    data = validate({'analysis': 'ok', 'suggestions': '补充数据'}, schema)
+    assert data == {'analysis': 'ok', 'missing_items': [], 'suggestions': ['补充数据']}
+
+
+def test_validate_defaults_are_not_shared():
+    schema = {'items': (list, [])}
+    first = validate({}, schema)
+    first['items'].append(1)
+    assert validate({}, schema)['items'] == []
+
+
+def test_validate_rejects_missing_required_and_wrong_type():
+    with pytest.raises(LLMJsonError):
+        validate({}, {'analysis': (str, REQUIRED)})
+    with pytest.raises(LLMJsonError):
+        validate({'score': 'high'}, {'score': (int, 0)})
+
+
+def test_extractor_ignores_fences_and_text_after_object():
+    extractor = JsonObjectExtractor()
+    closed = [extractor.feed(part) for part in ['好的：\n```json\n{"a": "x}', '", "b": [1, {"c": 2}]}', '\n```\n说明']]
+    assert closed == [False, True, True]
+    assert extractor.result() == {'a': 'x}', 'b': [1, {'c': 2}]}
+    with pytest.raises(LLMJsonError):
+        extract_json('没有对象')
+
+
+def test_array_streamer_emits_items_as_they_complete():
+    streamer = JsonArrayStreamer(['missing_items'])
+    assert streamer.feed('{"missing_items": ["a", {"b"') == [('missing_items', 0, 'a')]
+    assert streamer.feed(': 1}]}') == [('missing_items', 1, {'b': 1})]
@@ -0,0 +1,71 @@
+import json
+import random
+
+from modules.keyword_matcher import DEFAULT_TAXONOMY, AhoCorasick, KeywordAnalyzer
+
+
+def naive_matches(patterns, text):
+    """逐个关键词做重叠子串查找，作为自动机的对照"""
+    text = text.lower()
+    matches = []
+    for pattern_id, pattern in enumerate(patterns):
+        pattern = pattern.lower()
+        if not pattern:
+            continue
+        start = text.find(pattern)
+        while start != -1:
+            matches.append((start, pattern_id))
+            start = text.find(pattern, start + 1)
+    return sorted(matches)
+
+
+def test_overlapping_and_nested_patterns_all_reported():
+    patterns = ['he', 'she', 'his', 'hers']
+    assert sorted(AhoCorasick(patterns).iter_matches('ushers')) == [(1, 1), (2, 0), (2, 3)]
+    assert sorted(AhoCorasick(['aa']).iter_matches('aaaa')) == [(0, 0), (1, 0), (2, 0)]
+
+
+def test_case_insensitive_by_default():
+    assert list(AhoCorasick(['KPI']).iter_matches('kpi')) == [(0, 0)]
+    assert list(AhoCorasick(['KPI'], ignore_case=False).iter_matches('kpi')) == []
+
+
+def test_matches_agree_with_naive_search_on_random_input():
+    rng = random.Random(7)
+    alphabet = 'ab团队协'
+    for _ in range(50):
+        patterns = [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        assert sorted(AhoCorasick(patterns).iter_matches(text)) == naive_matches(patterns, text)
+
+
+def test_analyze_counts_hits_keywords_and_positions():
+    analyzer = KeywordAnalyzer(max_positions=2)
+    result = analyzer.analyze('团队沟通顺畅，团队协作良好，团队成长')
+    entry = result['团队协作能力']
+    assert entry['keywords'] == {'团队': 3, '沟通': 1, '协作': 1}
+    assert entry['hits'] == 5
+    assert entry['positions'] == [0, 2]
+    assert result['能力发展体现']['keywords'] == {'成长': 1}
+    assert result['创新思维展现'] == {'hits': 0, 'keywords': {}, 'positions': []}
+
+
+def test_keyword_shared_by_categories_counts_in_each():
+    analyzer = KeywordAnalyzer({'甲': {'keywords': ['目标']}, '乙': {'keywords': ['目标', '计划']}})
+    result = analyzer.analyze('目标')
+    assert (result['甲']['hits'], result['乙']['hits']) == (1, 1)
+    assert analyzer.keywords == ['目标', '计划']
+
+
+def test_missing_categories_in_taxonomy_order():
+    missing, hits = KeywordAnalyzer().missing_categories('今年完成了团队建设')
+    assert missing == ['能力发展体现', '业务影响说明', '创新思维展现']
+    assert set(hits) == set(DEFAULT_TAXONOMY)
+    assert KeywordAnalyzer().missing_categories('')[0] == list(DEFAULT_TAXONOMY)
+
+
+def test_from_file_loads_taxonomy(tmp_path):
+    path = tmp_path / 'taxonomy.json'
+    path.write_text(json.dumps({'安全': {'keywords': ['安全']}}, ensure_ascii=False), encoding='utf-8')
+    assert list(KeywordAnalyzer.from_file(str(path)).taxonomy) == ['安全']
+    assert KeywordAnalyzer.from_file(None).taxonomy is DEFAULT_TAXONOMY
@@ -0,0 +1,224 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules.llm_cache import LLMResponseCache, make_cache_key
+from modules.llm_client import CircuitOpenError, LLMClient, LLMError
+from modules.rate_limiter import RateLimiter
+from modules.resilience import RetryPolicy
+from modules.sse import stream_llm_events
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟DashScope文本生成接口：server.reply(body) 返回 (状态码, 响应体)，SSE请求按 server.chunk 字切分输出"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.calls.append(body)
+        self.server.auth.append(self.headers.get('Authorization'))
+        status, data = self.server.reply(body)
+        if status == 200 and self.headers.get('X-DashScope-SSE') == 'enable':
+            self._send_events(data['output']['text'])
+            return
+        raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _send_events(self, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunk = self.server.chunk
+        for start in range(0, len(text), chunk):
+            data = json.dumps({'output': {'text': text[start:start + chunk]}}, ensure_ascii=False)
+            event = f'id:{start}\nevent:result\ndata:{data}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(event):x}\r\n'.encode() + event + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    httpd.calls = []
+    httpd.auth = []
+    httpd.chunk = 4
+    httpd.reply = lambda body: (200, {'output': {'text': 'ok'}, 'usage': {'total_tokens': 10}})
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    client = LLMClient(base_url=f'http://127.0.0.1:{server.server_address[1]}', api_key_provider=lambda: 'k',
+                       cache=LLMResponseCache(str(tmp_path / 'llm_cache.db')))
+    yield client
+    client.close()
+
+
+def test_invalidate_during_stream_is_not_cached_by_drain(server, client):
+    server.reply = lambda body: (200, {'output': {'text': '{"a": 1} 以上为结果'}})
+    key = make_cache_key('m', prompt='p', parameters={'result_format': 'text'})
+
+    def finalize(text, context):
+        client.invalidate('m', prompt='p')
+        return {'text': text}
+
+    events = list(stream_llm_events('test', lambda context: client.stream('m', prompt='p'), (), finalize,
+                                    lambda error: {'error': error}))
+
+    assert events[-1].startswith('event: done')
+    assert client.cache.get(key) is None
+    assert client._streaming == {}
+    # 下一次调用重新请求上游，而不是命中被判无效的结果
+    assert ''.join(client.stream('m', prompt='p')) == '{"a": 1} 以上为结果'
+    assert len(server.calls) == 2
+    assert client.cache.get(key) == {'output': {'text': '{"a": 1} 以上为结果'}}
+
+
+def test_generate_success_sends_payload_and_auth(server, client):
+    response = client.generate('m', prompt='你好', parameters={'max_tokens': 5})
+    assert response.status_code == 200
+    assert response.text == 'ok'
+    assert response.usage == {'total_tokens': 10}
+    assert server.calls == [{'model': 'm', 'input': {'prompt': '你好'},
+                             'parameters': {'result_format': 'text', 'max_tokens': 5}}]
+    assert server.auth == ['Bearer k']
+
+
+def test_generate_maps_error_status_and_code(server, client):
+    server.reply = lambda body: (400, {'code': 'InvalidParameter', 'message': 'bad input', 'request_id': 'r1'})
+    response = client.generate('m', prompt='p')
+    assert (response.status_code, response.code, response.message, response.request_id) == (
+        400, 'InvalidParameter', 'bad input', 'r1')
+    # 错误结果不写入缓存
+    assert client.generate('m', prompt='p').from_cache is False
+    assert len(server.calls) == 2
+
+
+def test_stream_raises_llm_error_on_error_status(server, client):
+    server.reply = lambda body: (401, {'code': 'InvalidApiKey', 'message': 'invalid key'})
+    with pytest.raises(LLMError) as excinfo:
+        list(client.stream('m', prompt='p'))
+    assert (excinfo.value.status_code, excinfo.value.code) == (401, 'InvalidApiKey')
+
+
+def test_stream_yields_incremental_deltas(server, client):
+    server.reply = lambda body: (200, {'output': {'text': '第一段第二段第三段'}})
+    assert list(client.stream('m', prompt='p')) == ['第一段第', '二段第三', '段']
+    assert server.calls[0]['parameters']['incremental_output'] is True
+
+
+def test_cache_hit_and_bypass(server, client):
+    first = client.generate('m', prompt='同一个  提示词')
+    # 空白差异归一化后命中缓存，不访问上游
+    second = client.generate('m', prompt='同一个 提示词')
+    assert (first.from_cache, second.from_cache, second.text) == (False, True, 'ok')
+    assert len(server.calls) == 1
+    # 流式调用与同步调用共用缓存
+    assert list(client.stream('m', prompt='同一个 提示词')) == ['ok']
+    assert len(server.calls) == 1
+    # use_cache=False 跳过读取，重新调用上游
+    assert client.generate('m', prompt='同一个 提示词', use_cache=False).from_cache is False
+    assert len(server.calls) == 2
+    stats = client.cache.stats()
+    assert (stats['misses'], stats['bypasses']) == (1, 1)
+
+
+class RecordingLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__(limits={'m': (6000, 10 ** 9)})
+        self.settled = []
+
+    def settle(self, lease, actual_tokens):
+        self.settled.append(actual_tokens)
+        super().settle(lease, actual_tokens)
+
+
+def test_retries_retryable_status_only(server, client):
+    client.retry = RetryPolicy(max_attempts=3, base_delay=0.01)
+    replies = [(503, {'code': 'ServiceUnavailable'}), (200, {'output': {'text': 'ok'}})]
+    server.reply = lambda body: replies.pop(0)
+    assert client.generate('m', prompt='p', use_cache=False).text == 'ok'
+    assert client.stats()['retries'] == 1
+
+    server.reply = lambda body: (400, {'code': 'InvalidParameter'})
+    assert client.generate('m', prompt='p', use_cache=False).status_code == 400
+    assert len(server.calls) == 3
+
+
+def test_hedge_fires_after_delay_and_loser_is_settled(server, client):
+    client.rate_limiter = RecordingLimiter()
+    client.hedge_endpoints = frozenset(['e'])
+    client.hedge_delay = 0.1
+    release = threading.Event()
+    arrived = []
+
+    def reply(body):
+        arrived.append(time.monotonic())
+        if len(arrived) == 1:
+            release.wait(5)
+            return 200, {'output': {'text': 'slow'}, 'usage': {'total_tokens': 1}}
+        return 200, {'output': {'text': 'fast'}, 'usage': {'total_tokens': 2}}
+
+    server.reply = reply
+    started = time.monotonic()
+    response = client.generate('m', prompt='p', endpoint='e', use_cache=False)
+    assert response.text == 'fast'
+    assert arrived[1] - started >= 0.1
+    stats = client.stats()
+    assert (stats['hedged'], stats['hedge_wins']) == (1, 1)
+
+    # 落后的请求返回后同样按实际用量结算
+    assert client.rate_limiter.settled == [2]
+    release.set()
+    deadline = time.monotonic() + 5
+    while len(client.rate_limiter.settled) < 2:
+        assert time.monotonic() < deadline, '落后的请求未结算'
+        time.sleep(0.01)
+    assert client.rate_limiter.settled == [2, 1]
+
+
+def test_no_hedge_when_primary_is_fast(server, client):
+    client.hedge_endpoints = frozenset(['e'])
+    client.hedge_delay = 1.0
+    assert client.generate('m', prompt='p', endpoint='e', use_cache=False).text == 'ok'
+    assert len(server.calls) == 1
+    assert client.stats()['hedged'] == 0
+
+
+def test_failed_attempts_refund_their_lease(server, client):
+    client.rate_limiter = RecordingLimiter()
+    client.retry = RetryPolicy(max_attempts=2, base_delay=0.01)
+    replies = [(503, {'code': 'ServiceUnavailable'}), (200, {'output': {'text': 'ok'}, 'usage': {'total_tokens': 7}})]
+    server.reply = lambda body: replies.pop(0)
+    assert client.generate('m', prompt='p', use_cache=False).text == 'ok'
+    # 重试前退回第一次的额度，成功后按实际用量结算
+    assert client.rate_limiter.settled == [0, 7]
+
+
+def test_circuit_open_refunds_lease(server, client, monkeypatch):
+    client.rate_limiter = RecordingLimiter()
+
+    def circuit_open(model):
+        raise CircuitOpenError(model)
+
+    # 排队期间熔断器打开：已取得的额度退回
+    monkeypatch.setattr(client, '_acquire', circuit_open)
+    with pytest.raises(CircuitOpenError):
+        client.generate('m', prompt='p', use_cache=False)
+    assert client.rate_limiter.settled == [0]
+    assert server.calls == []
@@ -0,0 +1,83 @@
+import os
+
+from modules.parse_cache import ParseCache, file_sha256
+
+
+def write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return str(path)
+
+
+def counting_parser(calls):
+    def parse(path):
+        calls.append(path)
+        with open(path, encoding='utf-8') as f:
+            return {'text': f.read(), 'pages': [1, 2]}
+    return parse
+
+
+def test_hit_by_content_regardless_of_filename(tmp_path):
+    cache = ParseCache(str(tmp_path / 'spill'))
+    calls = []
+    first = cache.get_or_parse(write(tmp_path / 'a.txt', '述职'), 'doc', counting_parser(calls))
+    second = cache.get_or_parse(write(tmp_path / 'b.txt', '述职'), 'doc', counting_parser(calls))
+    assert first == second == {'text': '述职', 'pages': [1, 2]}
+    assert len(calls) == 1
+    assert cache.stats()['memory_hits'] == 1
+
+
+def test_changed_content_and_namespace_miss(tmp_path):
+    cache = ParseCache(str(tmp_path / 'spill'))
+    calls = []
+    path = write(tmp_path / 'a.txt', '第一版')
+    cache.get_or_parse(path, 'doc', counting_parser(calls))
+    cache.get_or_parse(path, 'doc.v2', counting_parser(calls))
+    write(path, '第二版，内容更长')
+    assert cache.get_or_parse(path, 'doc', counting_parser(calls))['text'] == '第二版，内容更长'
+    assert len(calls) == 3
+
+
+def test_returned_values_are_copies(tmp_path):
+    cache = ParseCache(str(tmp_path / 'spill'))
+    path = write(tmp_path / 'a.txt', '述职')
+    parsed = cache.get_or_parse(path, 'doc', counting_parser([]))
+    parsed['pages'].append(3)
+    hit = cache.get_or_parse(path, 'doc', counting_parser([]))
+    hit['text'] = '被修改'
+    assert cache.get_or_parse(path, 'doc', counting_parser([])) == {'text': '述职', 'pages': [1, 2]}
+
+
+def test_spill_survives_restart_and_memory_eviction(tmp_path):
+    spill = str(tmp_path / 'spill')
+    path = write(tmp_path / 'a.txt', '述职')
+    ParseCache(spill).get_or_parse(path, 'doc', counting_parser([]))
+    cache = ParseCache(spill, max_bytes=10)
+    calls = []
+    assert cache.get_or_parse(path, 'doc', counting_parser(calls))['text'] == '述职'
+    assert calls == []
+    assert cache.stats()['disk_hits'] == 1
+    # 超过内存预算的结果只保留磁盘副本
+    assert cache.stats()['entries'] == 0
+
+
+def test_spill_dir_is_bounded_by_least_recently_used(tmp_path):
+    spill = str(tmp_path / 'spill')
+    cache = ParseCache(spill, max_bytes=0, max_spill_bytes=350)
+    for index in range(3):
+        cache.put(f'doc:{index}', {'text': 'x' * 80})
+        os.utime(cache._spill_path(f'doc:{index}'), (index, index))
+    # 读取 doc:0 刷新其使用时间，写入第4条超出预算时淘汰最久未使用的 doc:1
+    assert cache.get('doc:0') is not None
+    cache.put('doc:3', {'text': 'x' * 80})
+    assert sorted(name for name in os.listdir(spill)) == ['doc_0.json', 'doc_2.json', 'doc_3.json']
+    stats = cache.stats()
+    assert stats['spill_evictions'] == 1
+    assert stats['spill_bytes'] <= 350 * 0.9
+
+
+def test_digest_memo_is_bounded(tmp_path):
+    cache = ParseCache(None, max_digests=2)
+    paths = [write(tmp_path / f'{index}.txt', str(index)) for index in range(3)]
+    assert [cache.digest(path) for path in paths] == [file_sha256(path) for path in paths]
+    assert cache.stats()['digests'] == 2
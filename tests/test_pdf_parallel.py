@@ -0,0 +1,38 @@
+import pytest
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from modules import pdf_parallel
+from modules.pdf_parallel import get_pool, iter_pdf_pages, page_ranges
+
+
+@pytest.fixture(scope='module')
+def pdf_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('pdf') / 'doc.pdf')
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(6):
+        pdf.drawString(40, 800, f'page {page} teamwork')
+        pdf.showPage()
+    pdf.save()
+    yield path
+    pdf_parallel.shutdown_pool()
+
+
+def test_page_ranges_cover_all_pages():
+    assert page_ranges(10, 4) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_parallel_matches_serial(pdf_path):
+    serial = list(iter_pdf_pages(pdf_path, workers=1))
+    assert [text.strip() for text in serial] == [f'page {page} teamwork' for page in range(6)]
+    assert list(iter_pdf_pages(pdf_path, workers=2, min_pages=1, shard_pages=1)) == serial
+
+
+def test_other_pool_size_does_not_cancel_running_work(pdf_path):
+    pool = get_pool(2)
+    future = pool.submit(pdf_parallel.extract_page_range, pdf_path, 0, 6)
+    # 使用另一种进程数时，原进程池及其中的任务不受影响
+    assert get_pool(3) is not pool
+    assert get_pool(2) is pool
+    assert len(future.result(timeout=60)) == 6
+    assert pool._mp_context.get_start_method() == 'spawn'
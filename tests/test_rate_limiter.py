@@ -0,0 +1,98 @@
+import time
+import threading
+
+import pytest
+
+from modules.rate_limiter import QueueTimeout, RateLimiter, user_context
+
+
+def drained_limiter(rpm, keys=None):
+    """每个密钥的请求桶容量为1，且已用掉"""
+    limiter = RateLimiter(keys=keys, limits={'m': (rpm, 10 ** 9)}, burst_seconds=60.0 / rpm)
+    for _ in limiter.keys:
+        limiter.acquire('m', 1, user='warmup')
+    return limiter
+
+
+def wait_for_depth(limiter, depth, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while limiter.queue_depth('m') < depth:
+        assert time.monotonic() < deadline, '排队请求未到齐'
+        time.sleep(0.005)
+
+
+def test_users_are_admitted_round_robin():
+    limiter = drained_limiter(rpm=3000)
+    order = []
+    lock = threading.Lock()
+
+    def call(user):
+        limiter.acquire('m', 1, user=user, deadline=time.monotonic() + 5)
+        with lock:
+            order.append(user)
+
+    threads = []
+    for user, count, depth in (('bulk', 6, 6), ('alice', 2, 8)):
+        for _ in range(count):
+            thread = threading.Thread(target=call, args=(user,))
+            thread.start()
+            threads.append(thread)
+        wait_for_depth(limiter, depth)
+    for thread in threads:
+        thread.join()
+    assert order[:4] == ['bulk', 'alice', 'bulk', 'alice']
+    assert order[4:] == ['bulk'] * 4
+
+
+def test_queue_timeout_removes_ticket():
+    limiter = drained_limiter(rpm=60)
+    started = time.monotonic()
+    with pytest.raises(QueueTimeout):
+        limiter.acquire('m', 1, user='u', deadline=started + 0.05)
+    assert time.monotonic() - started < 0.5
+    assert limiter.queue_depth('m') == 0
+    assert limiter.stats()['timeouts'] == 1
+
+
+def test_timed_out_head_does_not_block_next_user():
+    limiter = drained_limiter(rpm=600)
+    with pytest.raises(QueueTimeout):
+        limiter.acquire('m', 1, user='impatient', deadline=time.monotonic() + 0.01)
+    lease = limiter.acquire('m', 1, user='patient', deadline=time.monotonic() + 1)
+    assert lease.waited < 1
+
+
+def test_current_user_comes_from_context():
+    limiter = RateLimiter(limits={'m': (600, 10 ** 6)})
+    with user_context('alice'):
+        limiter.acquire('m', 1)
+    assert limiter.stats()['admitted'] == 1
+
+
+def test_keys_rotate_and_penalized_key_is_skipped():
+    limiter = RateLimiter(keys=['k1', 'k2'], limits={'m': (600, 10 ** 6)})
+    first = limiter.acquire('m', 1, user='u')
+    second = limiter.acquire('m', 1, user='u')
+    assert {first.key, second.key} == {'k1', 'k2'}
+    limiter.penalize(first, 60)
+    assert all(limiter.acquire('m', 1, user='u').key == second.key for _ in range(3))
+
+
+def test_settle_refunds_overestimated_tokens():
+    limiter = RateLimiter(limits={'m': (600, 600)}, burst_seconds=10.0)
+    lease = limiter.acquire('m', 100, user='u')
+    limiter.settle(lease, 10)
+    available = limiter.stats()['buckets']['m'][0]['tokens_available']
+    assert available >= 100 - 10 - 1
+
+
+def test_settle_charges_estimate_beyond_bucket_capacity():
+    now = [0.0]
+    limiter = RateLimiter(limits={'m': (600, 600)}, burst_seconds=10.0, clock=lambda: now[0])
+    # 桶容量100，超出容量的估算按容量预扣，结算时补扣实际用量的差额
+    lease = limiter.acquire('m', 150, user='u')
+    assert lease.tokens == 100
+    limiter.settle(lease, 150)
+    assert limiter.stats()['buckets']['m'][0]['tokens_available'] == -50
+    # 欠额补足前后续调用需要等待
+    assert limiter._bucket_pair(0, 'm', now[0])[1].wait_time(1, now[0]) == pytest.approx(5.1)
@@ -0,0 +1,67 @@
+from io import BytesIO
+
+import PyPDF2
+import pytest
+
+from modules import report_pdf
+
+DIAGNOSIS = {'diagnosis': {
+    'employee_info': {'name': '张三', 'position': '工程师', 'quarter': '2024Q1'},
+    'abilities': {'communication': 4, 'learning': None},
+    'strengths': ['沟通<清晰>', '交付稳定'],
+    'growth_suggestions': ['加强架构设计'],
+}}
+
+
+def page_count(document):
+    return len(PyPDF2.PdfReader(BytesIO(document)).pages)
+
+
+@pytest.fixture(autouse=True)
+def pool():
+    yield
+    report_pdf.shutdown_pool()
+
+
+def test_render_each_kind_returns_pdf_bytes():
+    assert report_pdf.render('diagnosis', DIAGNOSIS).startswith(b'%PDF')
+    scoring = {'employee_name': '张三', 'analysis_data': {'core_strengths': '执行力强'},
+               'scoring_results': [{'能力项': '沟通', '评分': 4}]}
+    assert report_pdf.render('scoring_report', scoring).startswith(b'%PDF')
+    evidence = {'employee_name': '张三', 'suggestions': [{'ability': '沟通', 'evidence': '多次协调', 'quote': '……'}]}
+    assert report_pdf.render('scoring_evidence', evidence).startswith(b'%PDF')
+    with pytest.raises(ValueError):
+        report_pdf.render('unknown', {})
+
+
+def test_engine_is_created_once_per_process():
+    assert report_pdf.get_engine() is report_pdf.get_engine()
+
+
+def test_merge_page_count_is_sum_of_reports():
+    long_report = {'diagnosis': dict(DIAGNOSIS['diagnosis'], strengths=['很长的优势描述' * 20] * 40)}
+    items = [DIAGNOSIS, long_report, DIAGNOSIS]
+    documents = report_pdf.render_batch('diagnosis', items, workers=1)
+    counts = [page_count(document) for document in documents]
+    assert counts[1] > counts[0]
+    merged = report_pdf.render_batch('diagnosis', items, merge=True, workers=1)
+    assert page_count(merged) == sum(counts)
+
+
+def test_batch_writes_named_files(tmp_path):
+    paths = report_pdf.render_batch('diagnosis', [DIAGNOSIS, DIAGNOSIS], output_dir=str(tmp_path / 'out'),
+                                    filenames=['a.pdf', 'b.pdf'], workers=1)
+    assert paths == [str(tmp_path / 'out' / 'a.pdf'), str(tmp_path / 'out' / 'b.pdf')]
+    for path in paths:
+        with open(path, 'rb') as f:
+            assert page_count(f.read()) >= 1
+
+
+def test_parallel_batch_matches_serial_order(monkeypatch):
+    monkeypatch.setattr(report_pdf, 'REPORT_PARALLEL_MIN', 2)
+    monkeypatch.setattr(report_pdf, 'REPORT_WORKERS', 2)
+    items = [{'diagnosis': dict(DIAGNOSIS['diagnosis'], strengths=['优势'] * (index * 30 + 1))} for index in range(3)]
+    serial = [page_count(document) for document in report_pdf.render_batch('diagnosis', items, workers=1)]
+    parallel = [page_count(document) for document in report_pdf.render_batch('diagnosis', items, workers=2)]
+    assert parallel == serial
+    assert report_pdf._pool is not None
@@ -0,0 +1,96 @@
+import pytest
+
+from modules import resilience
+from modules.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyTracker, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    clock.now = 4
+    assert breaker.retry_after() == 6
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_breaker_half_open_admits_limited_probes_then_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, half_open_max_calls=1, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens_with_doubled_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, max_reset_timeout=25, clock=clock)
+    breaker.record_failure()
+    for reset in (20, 25, 25):
+        clock.now += breaker.stats()['reset_timeout']
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.stats()['reset_timeout'] == reset
+    # 探测成功后冷却时间恢复初始值
+    clock.now += 25
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.stats()['reset_timeout'] == 10
+
+
+def test_retry_backoff_is_capped_exponential(monkeypatch):
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: high)
+    policy = RetryPolicy(base_delay=0.5, max_delay=3.0)
+    assert [policy.backoff(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 3.0, 3.0]
+
+
+def test_retry_stops_at_max_attempts_and_deadline(monkeypatch, clock):
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: high)
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0)
+    assert policy.next_delay(0, None) == 1.0
+    assert policy.next_delay(1, None) == 2.0
+    assert policy.next_delay(2, None) is None
+    # 等待后剩余时间不足 base_delay 时放弃
+    assert policy.next_delay(1, deadline=3.0, clock=clock) is None
+    assert policy.next_delay(1, deadline=3.5, clock=clock) == 2.0
+
+
+def test_retryable_status_classification():
+    policy = RetryPolicy()
+    assert [status for status in (200, 400, 401, 404, 429, 500, 502, 503, 504)
+            if policy.is_retryable_status(status)] == [429, 500, 502, 503, 504]
+    assert not RetryPolicy(retry_statuses=(503,)).is_retryable_status(429)
+
+
+def test_latency_percentile_needs_min_samples():
+    tracker = LatencyTracker(window=50)
+    for latency in range(19):
+        tracker.record('e', latency / 100)
+    assert tracker.percentile('e', 95) is None
+    for latency in range(100):
+        tracker.record('e', latency / 100)
+    # 只保留最近 window 个样本
+    assert tracker.percentile('e', 95) == 0.97
@@ -0,0 +1,65 @@
+from modules.retrieval import BM25Index, IndexCache, retrieve_evidence, tokenize
+
+PASSAGES = [
+    '负责团队管理，带领十人团队完成年度目标',
+    '精通Python开发，主导数据平台架构设计',
+    '客户沟通能力强，多次获得客户表扬',
+    '团队管理经验丰富，擅长跨部门沟通与团队建设',
+]
+
+
+def test_tokenize_splits_chinese_into_bigrams_and_keeps_words():
+    assert tokenize('团队管理') == ['团队', '队管', '管理']
+    assert tokenize('人 Python3.5 版') == ['人', 'python', '3.5', '版']
+
+
+def test_search_ranks_by_bm25_and_skips_unmatched():
+    index = BM25Index(PASSAGES)
+    hits = index.search('团队管理', top_k=5)
+    assert sorted(passage for passage, _ in hits) == [0, 3]
+    assert all(score > 0 for _, score in hits)
+    assert index.search('财务审计') == []
+
+
+def test_rare_terms_outweigh_common_terms():
+    index = BM25Index(PASSAGES)
+    # “架构”只出现一次，“团队”出现两段，前者的 idf 更高
+    assert index.search('团队 架构', top_k=1)[0][0] == 1
+
+
+def test_top_k_limits_results_and_ties_keep_document_order():
+    index = BM25Index(['沟通', '沟通', '沟通'])
+    assert index.search('沟通', top_k=2) == index.search('沟通', top_k=3)[:2]
+    assert [passage for passage, _ in index.search('沟通', top_k=2)] == [0, 1]
+
+
+def test_empty_index_returns_nothing():
+    assert BM25Index([]).search('团队') == []
+
+
+def test_index_cache_reuses_index_per_document_and_evicts_lru():
+    cache = IndexCache(max_entries=2)
+    first = cache.get('文档一')
+    assert cache.get('文档一') is first
+    cache.get('文档二')
+    cache.get('文档一')
+    cache.get('文档三')
+    assert cache.get('文档一') is first
+    assert len(cache._entries) == 2
+    assert '文档二' not in [index.passages[0] for index in cache._entries.values()]
+
+
+def test_longer_passages_are_length_normalized():
+    index = BM25Index(['沟通', '沟通' + '无关内容' * 20])
+    assert [passage for passage, _ in index.search('沟通')] == [0, 1]
+
+
+def test_retrieve_evidence_returns_numbered_truncated_snippets():
+    text = '\n\n'.join(PASSAGES + ['领导力' * 100])
+    index, evidence = retrieve_evidence(text, ['Python', '领导力'], snippet_chars=10)
+    # 短段落合并为第1个片段，超长段落另起片段；片段序号从1开始
+    assert len(index.passages) > 1
+    assert evidence['Python'] == [{'passage': 1, 'score': evidence['Python'][0]['score'],
+                                   'text': PASSAGES[0][:10] + '...'}]
+    assert evidence['领导力'][0]['passage'] >= 2
+    assert evidence['领导力'][0]['score'] > 0
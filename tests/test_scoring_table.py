@@ -0,0 +1,31 @@
+import openpyxl
+
+from modules.scoring_table import _to_number, parse_scoring_table
+
+
+def test_to_number_scales_percent_text():
+    assert _to_number('30%') == 0.3
+    assert _to_number(' 12.5 % ') == 0.125
+    assert _to_number('10分') == 10.0
+    assert _to_number(0.3) == 0.3
+    assert _to_number('优秀') is None
+
+
+def test_weight_columns_share_one_scale(tmp_path):
+    wb = openpyxl.Workbook()
+    mixed = wb.active
+    mixed.append(['考核项', '权重'])
+    mixed.append(['业绩', '30%'])
+    mixed.append(['协作', 0.3])
+    mixed['B3'].number_format = '0%'
+    mixed.append(['成长', '40%'])
+    points = wb.create_sheet('points')
+    points.append(['考核项', '权重'])
+    points.append(['A', 30])
+    points.append(['B', 70])
+    path = tmp_path / 'score.xlsx'
+    wb.save(path)
+
+    sheets = parse_scoring_table(str(path))['sheets']
+    assert [sheet['weight_total'] for sheet in sheets] == [1.0, 1.0]
+    assert [item['weight'] for item in sheets[1]['items']] == [0.3, 0.7]
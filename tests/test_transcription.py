@@ -0,0 +1,104 @@
+import wave
+
+import numpy as np
+import pytest
+
+from modules import transcription
+from modules.transcription import (SAMPLE_RATE, TranscriptionBackend, decode_audio, register_backend,
+                                   split_on_silence, transcribe_samples)
+
+
+class FakeBackend(TranscriptionBackend):
+    """每段返回一句，内容为本段的采样数，时间戳相对本段开头"""
+
+    def transcribe(self, samples, sample_rate):
+        return [{'start': 0.1, 'end': len(samples) / sample_rate, 'text': str(len(samples))}]
+
+
+register_backend('fake', FakeBackend)
+
+
+def tone(seconds, amplitude=8000):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * 440 * t)
+
+
+def silence(seconds, rng=np.random.default_rng(0)):
+    return rng.normal(0, 10, int(seconds * SAMPLE_RATE))
+
+
+def pcm(*parts):
+    return np.clip(np.round(np.concatenate(parts)), -32768, 32767).astype(np.int16)
+
+
+def test_split_cuts_inside_silences_after_target():
+    samples = pcm(tone(3), silence(1), tone(3), silence(1), tone(3))
+    spans = split_on_silence(samples, target_seconds=2, max_seconds=5, min_silence_ms=400)
+    assert len(spans) == 3
+    assert spans[0][0] == 0 and spans[-1][1] == len(samples)
+    # 相邻分段首尾相接，切点落在静音段内
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert end == start
+    assert 3 * SAMPLE_RATE < spans[1][0] < 4 * SAMPLE_RATE
+    assert 7 * SAMPLE_RATE < spans[2][0] < 8 * SAMPLE_RATE
+
+
+def test_split_without_pauses_respects_max_length():
+    samples = pcm(tone(12) * np.linspace(0.5, 1, 12 * SAMPLE_RATE))
+    spans = split_on_silence(samples, target_seconds=2, max_seconds=4)
+    assert len(spans) >= 3
+    assert all(end - start <= 4 * SAMPLE_RATE for start, end in spans[:-1])
+    assert spans[-1][1] == len(samples)
+
+
+def test_split_drops_silent_chunks_and_handles_short_input():
+    samples = pcm(tone(2), silence(6), tone(2))
+    spans = split_on_silence(samples, target_seconds=1, max_seconds=2)
+    # 中间整段静音的分段不转写
+    assert sum(end - start for start, end in spans) < len(samples) - 3 * SAMPLE_RATE
+    assert split_on_silence(np.zeros(0, dtype=np.int16)) == []
+    assert split_on_silence(pcm(tone(0.01))) == [(0, 160)]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_transcribe_offsets_timestamps_by_chunk_start(monkeypatch, workers):
+    monkeypatch.setattr(transcription, 'TRANSCRIBE_CHUNK_SECONDS', 2)
+    monkeypatch.setattr(transcription, 'TRANSCRIBE_MAX_CHUNK_SECONDS', 5)
+    samples = pcm(tone(3), silence(1), tone(3), silence(1), tone(3))
+    spans = split_on_silence(samples, target_seconds=2, max_seconds=5)
+    progress = []
+    result = transcribe_samples(samples, backend='fake', workers=workers,
+                                progress=lambda fraction, message: progress.append(fraction))
+    assert result['chunks'] == len(spans) == 3
+    assert result['backend'] == 'fake'
+    assert result['duration'] == 11.0
+    assert [segment['start'] for segment in result['segments']] == [round(start / SAMPLE_RATE + 0.1, 2)
+                                                                    for start, _ in spans]
+    assert [segment['end'] for segment in result['segments']] == [round(end / SAMPLE_RATE, 2) for _, end in spans]
+    assert result['text'] == '\n'.join(str(end - start) for start, end in spans)
+    assert sorted(progress) == [1 / 3, 2 / 3, 1.0]
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        transcribe_samples(pcm(tone(1)), backend='missing')
+
+
+def test_decode_wav_mixes_down_and_resamples(tmp_path):
+    path = str(tmp_path / 'stereo.wav')
+    left = pcm(tone(1, 4000))
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(np.stack([left, left], axis=1).astype('<i2').tobytes())
+    decoded = decode_audio(path)
+    assert decoded.dtype == np.int16
+    assert np.array_equal(decoded, left)
+
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(left[::2].astype('<i2').tobytes())
+    assert len(decode_audio(path)) == SAMPLE_RATE
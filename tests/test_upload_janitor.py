@@ -0,0 +1,100 @@
+import io
+import os
+import time
+
+from modules.upload_janitor import DAY, UploadJanitor
+from modules.upload_store import UploadStore
+
+
+def make_store(tmp_path):
+    return UploadStore(root=str(tmp_path / 'uploads'), db_path=str(tmp_path / 'uploads.db'))
+
+
+def put(store, data, accessed_at):
+    """保存文件并把最近访问时间设为 accessed_at"""
+    saved = store.store_stream(io.BytesIO(data), 'a.pdf')
+    store._conn.execute('UPDATE blobs SET last_access = ? WHERE content_id = ?', (accessed_at, saved['content_id']))
+    store._conn.commit()
+    return saved
+
+
+def make_janitor(store, **options):
+    return UploadJanitor(store, store.root, interval=0, **options)
+
+
+def test_retention_removes_only_expired_files(tmp_path):
+    store = make_store(tmp_path)
+    now = time.time()
+    old = put(store, b'old report', now - 31 * DAY)
+    recent = put(store, b'recent report', now - DAY)
+    result = make_janitor(store, retention=30 * DAY).run_once()
+    assert (result['expired'], result['freed_bytes']) == (1, old['size'])
+    assert not os.path.exists(old['file_path'])
+    assert store.exists(recent['file_path'])
+    assert store.total_bytes() == recent['size']
+
+
+def test_quota_evicts_least_recently_used_down_to_low_watermark(tmp_path):
+    store = make_store(tmp_path)
+    now = time.time()
+    saved = [put(store, bytes([index]) * 100, now - 7200 - index * 100) for index in range(4)]
+    result = make_janitor(store, retention=0, quota_bytes=300, low_watermark=0.9).run_once()
+    # 400 -> 270 以下：淘汰访问时间最早的两个（序号3、2）
+    assert result['evicted'] == 2
+    assert [store.exists(item['file_path']) for item in saved] == [True, True, False, False]
+    assert store.total_bytes() == 200
+
+
+def test_quota_skips_recently_accessed_files(tmp_path):
+    store = make_store(tmp_path)
+    now = time.time()
+    oldest = put(store, b'a' * 100, now - 9000)
+    idle = put(store, b'b' * 100, now - 8000)
+    recent = put(store, b'c' * 100, now - 60)
+    # 排队中的任务刚检查过最早的文件：访问时间更新后不在淘汰范围内
+    assert store.exists(oldest['file_path'])
+    result = make_janitor(store, retention=0, quota_bytes=250, min_idle=3600).run_once()
+    assert result['evicted'] == 1
+    assert store.exists(oldest['file_path'])
+    assert not os.path.exists(idle['file_path'])
+    assert store.exists(recent['file_path'])
+
+
+def test_quota_stops_when_only_active_files_remain(tmp_path):
+    store = make_store(tmp_path)
+    now = time.time()
+    put(store, b'a' * 100, now - 10)
+    put(store, b'b' * 100, now - 20)
+    result = make_janitor(store, retention=0, quota_bytes=100, min_idle=3600).run_once()
+    assert result['evicted'] == 0
+    assert store.total_bytes() == 200
+
+
+def test_legacy_files_and_batch_dirs_swept_by_mtime(tmp_path):
+    store = make_store(tmp_path)
+    saved = put(store, b'managed', time.time())
+    upload_dir = store.root
+    old_time = time.time() - 40 * DAY
+    legacy = os.path.join(upload_dir, 'legacy.pdf')
+    fresh = os.path.join(upload_dir, 'fresh.pdf')
+    batch_dir = os.path.join(upload_dir, 'batch_123')
+    os.makedirs(batch_dir)
+    batch_file = os.path.join(batch_dir, 'doc.pdf')
+    for path in (legacy, fresh, batch_file):
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    for path in (legacy, batch_file):
+        os.utime(path, (old_time, old_time))
+    result = make_janitor(store, retention=30 * DAY).run_once()
+    assert result['legacy_removed'] == 2
+    assert not os.path.exists(legacy) and not os.path.exists(batch_dir)
+    assert os.path.exists(fresh)
+    assert store.exists(saved['file_path'])
+
+
+def test_disabled_limits_remove_nothing(tmp_path):
+    store = make_store(tmp_path)
+    saved = put(store, b'kept', time.time() - 365 * DAY)
+    result = make_janitor(store, retention=0, quota_bytes=0).run_once()
+    assert (result['expired'], result['evicted']) == (0, 0)
+    assert store.exists(saved['file_path'])
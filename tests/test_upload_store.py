@@ -0,0 +1,88 @@
+import io
+import os
+
+from modules.upload_store import UploadStore
+
+
+def make_store(tmp_path):
+    return UploadStore(root=str(tmp_path / 'uploads'), db_path=str(tmp_path / 'uploads.db'))
+
+
+def put(store, data, filename='a.pdf'):
+    return store.store_stream(io.BytesIO(data), filename)
+
+
+def test_exists_sees_upload_from_other_process(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    saved = put(first, b'uploaded by first worker')
+    assert second.exists(saved['file_path'])
+    assert second.total_bytes() == saved['size']
+
+
+def test_exists_false_after_other_process_evicts(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    saved = put(first, b'evicted elsewhere')
+    assert second.exists(saved['file_path'])
+    assert first.evict(saved['content_id']) == saved['size']
+    assert not second.exists(saved['file_path'])
+    assert second.evict(saved['content_id']) == 0
+
+
+def test_dedup_across_processes_keeps_refcount(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    a = put(first, b'same content')
+    b = put(second, b'same content')
+    assert b['deduplicated']
+    assert first.release(a['ref_id'])
+    assert second.exists(b['file_path'])
+    assert second.release(b['ref_id'])
+    assert not first.exists(a['file_path'])
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = make_store(tmp_path)
+    a = put(store, b'report body', 'a.pdf')
+    b = put(store, b'report body', 'renamed.pdf')
+    assert not a['deduplicated'] and b['deduplicated']
+    assert a['file_path'] == b['file_path']
+    assert a['ref_id'] != b['ref_id']
+    stats = store.stats()
+    assert (stats['blobs'], stats['refs'], stats['dedup_hits'], stats['bytes_saved']) == (1, 2, 1, len(b'report body'))
+    assert store.display_name(b['file_path']) == 'renamed.pdf'
+
+
+def test_release_deletes_blob_with_last_reference(tmp_path):
+    store = make_store(tmp_path)
+    a = put(store, b'shared')
+    b = put(store, b'shared')
+    assert store.release(a['ref_id'])
+    assert store.exists(b['file_path'])
+    assert store.release(b['ref_id'])
+    assert not store.exists(b['file_path'])
+    assert store.stats()['blobs'] == 0
+    assert not store.release(b['ref_id'])
+
+
+def test_same_name_different_content_kept_apart(tmp_path):
+    store = make_store(tmp_path)
+    a = put(store, b'first', '述职.pdf')
+    b = put(store, b'second', '述职.pdf')
+    assert a['file_path'] != b['file_path']
+    assert store.content_id_for_path(a['file_path']) == a['content_id']
+    assert store.content_id_for_path('uploads/other/述职.pdf') is None
+
+
+def test_uncommitted_spool_is_removed(tmp_path):
+    store = make_store(tmp_path)
+    spool = store.open_spool()
+    spool.write(b'partial upload')
+    path = spool.path
+    spool.close()
+    assert not os.path.exists(path)
+
+
+def test_dedup_spool_is_removed_after_store(tmp_path):
+    store = make_store(tmp_path)
+    put(store, b'dup')
+    put(store, b'dup')
+    assert os.listdir(store.tmp_dir) == []
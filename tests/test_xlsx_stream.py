@@ -0,0 +1,66 @@
+import io
+
+from openpyxl import load_workbook
+
+from modules.xlsx_stream import Sheet, column_letter, sheet_title, stream_xlsx
+
+
+def open_workbook(sheets, **kwargs):
+    return load_workbook(io.BytesIO(b''.join(stream_xlsx(sheets, **kwargs))))
+
+
+def test_streamed_workbook_opens_in_openpyxl_with_typed_cells():
+    rows = [['张三', '沟通能力', 4.5, True], ['李四', '  前后空格 ', 3, None], ['<&"特殊">', '多行\n文本', 0, False]]
+    workbook = open_workbook([Sheet('评分明细', ['员工', '能力项', '评分', '通过'], iter(rows), widths=[12, 40, 8])])
+    sheet = workbook['评分明细']
+    assert [[cell.value for cell in row] for row in sheet.iter_rows()] == [
+        ['员工', '能力项', '评分', '通过'],
+        ['张三', '沟通能力', 4.5, True],
+        ['李四', '  前后空格 ', 3, None],
+        ['<&"特殊">', '多行\n文本', 0, False],
+    ]
+    assert sheet['A1'].font.b
+    assert sheet['B2'].alignment.wrap_text
+    assert sheet.column_dimensions['A'].width == 12
+    assert sheet.freeze_panes == 'A2'
+
+
+def test_rows_are_consumed_lazily_and_output_is_chunked():
+    consumed = []
+
+    def rows():
+        for index in range(5000):
+            consumed.append(index)
+            yield [index, f'第{index}行的评价内容']
+
+    chunks = stream_xlsx([Sheet('大表', ['序号', '内容'], rows())], flush_bytes=4096)
+    first = next(chunks)
+    # 第一块输出时生成器尚未读完
+    assert first and len(consumed) < 5000
+    rest = b''.join(chunks)
+    sheet = load_workbook(io.BytesIO(first + rest))['大表']
+    assert sheet.max_row == 5001
+    assert sheet.cell(5001, 2).value == '第4999行的评价内容'
+
+
+def test_multiple_sheets_get_unique_valid_titles():
+    workbook = open_workbook([Sheet('汇总/明细', ['a'], []), Sheet('汇总/明细', ['b'], []),
+                              Sheet('x' * 40, None, [[1]])])
+    assert workbook.sheetnames == ['汇总_明细', '汇总_明细_2', 'x' * 31]
+    assert workbook['x' * 31]['A1'].value == 1
+
+
+def test_empty_workbook_still_has_one_sheet():
+    assert open_workbook([]).sheetnames == ['Sheet1']
+
+
+def test_illegal_xml_characters_are_dropped():
+    sheet = open_workbook([Sheet('s', None, [['a\x00b\x1fc', float('nan')]])])['s']
+    assert sheet['A1'].value == 'abc'
+    assert sheet['B1'].value == 'nan'
+
+
+def test_column_letter_and_sheet_title_helpers():
+    assert [column_letter(index) for index in (0, 25, 26, 701, 702)] == ['A', 'Z', 'AA', 'ZZ', 'AAA']
+    used = set()
+    assert [sheet_title(title, used) for title in ('Sheet', 'sheet', None, "'q'")] == ['Sheet', 'sheet_2', 'Sheet_3', 'q']